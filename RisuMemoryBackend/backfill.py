@@ -0,0 +1,75 @@
+# backfill.py
+"""지난 대화 기록을 HypaMemory(ChromaDB)에 한꺼번에 요약해 넣습니다. 중단돼도 같은 명령으로 이어서 합니다.
+
+입력 형식은 확장자와 내용으로 알아냅니다.
+- .jsonl: 봇 보관 파일(bot_data/archive/<유저>.jsonl)처럼 한 줄에 메시지 하나
+- .json: 메시지 목록(봇 세션 파일), {유저: 메시지 목록}(예전 통합 파일, --user 필요), AI Studio 내보내기
+
+사용법: python backfill.py history.jsonl --conversation-id 유저이름 [--concurrency 8] [--checkpoint path]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from main import DEFAULT_HYPA_SETTINGS, backfill_checkpoint_path
+from risu_memory_backend.memory.backfill import BackfillProgress, backfill, count_batches
+from risu_memory_backend.memory.consolidation import consolidate
+
+
+def load_messages(path: str, user: str = None) -> list:
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    if "chunkedPrompt" in data:
+        from converter import iter_bot_records
+        return list(iter_bot_records(data["chunkedPrompt"].get("chunks", [])))
+    if user is None:
+        raise SystemExit(f"여러 유저의 기록이 들어 있습니다. --user로 고르세요: {', '.join(list(data)[:10])}")
+    return data[user]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_file")
+    parser.add_argument("--conversation-id", required=True)
+    parser.add_argument("--user", help="예전 통합 파일에서 가져올 유저")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--flush-size", type=int, default=32, help="한 번에 임베딩/저장할 요약 수")
+    parser.add_argument("--checkpoint", help="기본값: backfill_checkpoints/<conversation-id>.json")
+    parser.add_argument("--no-consolidate", action="store_true", help="끝난 뒤 요약문 정리(합치기)를 하지 않음")
+    args = parser.parse_args()
+
+    messages = [{"role": m["role"], "content": m.get("content", ""), "memo": m.get("memo")}
+                for m in load_messages(args.input_file, args.user)]
+    settings = DEFAULT_HYPA_SETTINGS
+    progress = BackfillProgress(args.conversation_id, count_batches(messages, settings['max_chats_per_summary']))
+    checkpoint = args.checkpoint or backfill_checkpoint_path(args.conversation_id)
+    print(f"메시지 {len(messages):,}개 -> 묶음 {progress.total_batches:,}개 (체크포인트: {checkpoint})")
+
+    last_report = [0.0]
+
+    def report(p: BackfillProgress):
+        if p.finished or time.monotonic() - last_report[0] >= 2:
+            last_report[0] = time.monotonic()
+            s = p.to_dict()
+            eta = f"{s['eta_s']:.0f}s" if s["eta_s"] is not None else "?"
+            print(f"  {p.resumed + p.done:,}/{p.total_batches:,} 완료 (이번 실행 {p.done:,}, 실패 {p.failed}) "
+                  f"{s['batches_per_s']} 묶음/s, 남은 시간 {eta}")
+
+    asyncio.run(backfill(messages, settings, args.conversation_id, checkpoint_path=checkpoint,
+                         concurrency=args.concurrency, flush_size=args.flush_size,
+                         progress=progress, on_progress=report))
+    if progress.failed:
+        print(f"{progress.failed}개 묶음이 실패했습니다. 같은 명령을 다시 실행하면 남은 것만 처리합니다.")
+    elif not args.no_consolidate:
+        stats = asyncio.run(consolidate(args.conversation_id, settings))
+        print(f"요약문 정리: {stats['before']:,}개 -> {stats['after']:,}개 (밀린 묶음 {stats['deferred_groups']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""요약문 정리(consolidation) 전후의 기억 검색 품질(recall)과 남는 요약문 수를 비교합니다.
+
+가짜 LLM과 가짜 임베딩으로 네트워크 없이 돌립니다.
+- 처음 요약문(level 0)마다 고유한 사실 한 문장("<이름>는 <물건>를 좋아한다고 했다.")과 잡담 문장을 넣습니다.
+- 가짜 LLM은 자식 요약문에서 문장을 하나씩 번갈아 골라 `--merge-words` 단어까지만 남깁니다. (넘치면 사실이 빠짐)
+- 가짜 임베딩은 단어를 센 희소 벡터라, 질문("<이름>는 뭘 좋아했지?")과 같은 단어가 많은 요약문이 가깝습니다.
+- recall은 hypa_memory_v3처럼 상위 5개를 질의해 기억 예산 안에서 고른 글에 정답 <물건>이 들어 있는 비율입니다.
+
+사용법: python benchmarks/bench_consolidation.py [--summaries 64 256 1024] [--queries 200] [--merge-words 160]
+"""
+import argparse
+import asyncio
+from collections import Counter
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_consolidation_"))
+
+from risu_memory_backend.memory import hypa_memory  # noqa: E402
+from risu_memory_backend.memory.consolidation import (DEFAULT_CONSOLIDATION_SETTINGS, consolidate,  # noqa: E402
+                                                      summary_order)
+
+SETTINGS = {
+    "summarization_model": "gemini-flash-latest", "embedding_model": "text-embedding-004",
+    "summarization_prompt": "[Summarize]", "memory_tokens_ratio": 0.25, "max_chats_per_summary": 8,
+    "recent_memory_ratio": 0.3, "similar_memory_ratio": 0.5,
+}
+MAX_CONTEXT_TOKENS = 8192
+FILLER = ["오늘은 날씨 얘기를 한참 했다.", "둘이서 게임 얘기로 웃었다.", "학교 숙제가 많다고 투덜거렸다.",
+          "저녁 메뉴를 고민하다가 라면으로 정했다.", "그냥 시시한 농담을 주고받았다.", "내일 일찍 일어나야 한다고 했다."]
+SENTENCE = re.compile(r"[^.]+\.")
+
+
+# ----- 가짜 LLM/임베딩/ChromaDB -----
+def embed(text: str) -> dict:
+    vector = Counter(word.strip(".?") for word in text.split())
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {word: v / norm for word, v in vector.items()}
+
+
+def similarity(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(word, 0.0) for word, v in a.items())
+
+
+def make_stub_merge(word_budget: int, calls: list):
+    async def stub_merge(text, settings=None):
+        calls.append(1)
+        children = [SENTENCE.findall(part) for part in text.split("\n\n")]
+        picked, words = [], 0
+        for j in range(max(map(len, children))):
+            for sentences in children:
+                if j < len(sentences):
+                    length = len(sentences[j].split())
+                    if words + length > word_budget:
+                        return " ".join(picked)
+                    picked.append(sentences[j].strip())
+                    words += length
+        return " ".join(picked)
+    return stub_merge
+
+
+async def stub_embeddings(texts, model=None, priority=None):
+    return [embed(t) for t in texts]
+
+
+class StubCollection:
+    """consolidate와 질의에 필요한 add/get/delete/query/count만 흉내 내는 메모리 전용 컬렉션."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, ids, embeddings, metadatas):
+        self.rows.update((i, (e, m)) for i, e, m in zip(ids, embeddings, metadatas))
+
+    def get(self, where=None, include=None):
+        rows = [(i, m) for i, (_, m) in self.rows.items()
+                if not where or all(m.get(k) == v for k, v in where.items())]
+        return {"ids": [i for i, _ in rows], "metadatas": [m for _, m in rows]}
+
+    def delete(self, ids):
+        for i in ids:
+            self.rows.pop(i, None)
+
+    def count(self):
+        return len(self.rows)
+
+    def query(self, query_embeddings, n_results):
+        q = query_embeddings[0]
+        scored = sorted(self.rows.values(), key=lambda row: -similarity(q, row[0]))
+        return {"metadatas": [[m for _, m in scored[:n_results]]]}
+
+
+# ----- 합성 요약문 -----
+def make_facts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [(f"친구{i}", f"물건{rng.getrandbits(32):08x}") for i in range(count)]
+
+
+def fill(collection: StubCollection, facts, conversation_id: str):
+    rng = random.Random(1)
+    for i, (who, what) in enumerate(facts):
+        text = " ".join([f"{who}는 {what}를 좋아한다고 했다."] + rng.sample(FILLER, rng.choice([2, 3, 4])))
+        collection.add([f"leaf-{i}"], [embed(text)], [{**hypa_memory.summary_metadata(text, conversation_id), "batch": i}])
+
+
+def recall(collection: StubCollection, facts, queries: int) -> tuple:
+    """(recall, 질의 한 번의 평균 ms)"""
+    sample = random.Random(2).sample(facts, min(queries, len(facts)))
+    hits, elapsed = 0, 0.0
+    for who, what in sample:
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[embed(f"{who}는 뭘 좋아했지?")], n_results=5)
+        memory = hypa_memory.select_memories([m["text"] for m in result["metadatas"][0]],
+                                             MAX_CONTEXT_TOKENS * SETTINGS["memory_tokens_ratio"])
+        elapsed += time.perf_counter() - started
+        hits += what in memory
+    return hits / len(sample), elapsed / len(sample) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--summaries", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--merge-words", type=int, default=160, help="가짜 LLM이 합친 요약문에 남기는 최대 단어 수")
+    args = parser.parse_args()
+
+    calls = []
+    hypa_memory.summarize_or_raise = make_stub_merge(args.merge_words, calls)
+    hypa_memory.get_embeddings = stub_embeddings
+    print(f"정리 설정: {dict(DEFAULT_CONSOLIDATION_SETTINGS)}, 합친 요약문 최대 {args.merge_words}단어")
+    print(f"{'summaries':>10} {'live after':>10} {'max level':>9} {'merges':>7} "
+          f"{'recall before':>13} {'recall after':>12} {'query ms before':>15} {'after':>7}")
+    for count in args.summaries:
+        collection = hypa_memory.collection = StubCollection()
+        facts = make_facts(count)
+        fill(collection, facts, "bench")
+        recall_before, ms_before = recall(collection, facts, args.queries)
+        calls.clear()
+        stats = asyncio.run(consolidate("bench", SETTINGS))
+        recall_after, ms_after = recall(collection, facts, args.queries)
+        live = sorted(collection.get(where={"conversation_id": "bench"})["metadatas"], key=summary_order)
+        print(f"{count:>10} {stats['after']:>10} {max(m['level'] for m in live):>9} {len(calls):>7} "
+              f"{recall_before:>13.3f} {recall_after:>12.3f} {ms_before:>15.3f} {ms_after:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
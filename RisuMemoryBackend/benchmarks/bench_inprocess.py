@@ -0,0 +1,117 @@
+"""메모리 백엔드를 HTTP로 부를 때와 같은 프로세스에서 부를 때(in-process 모드)의 턴당 비용을 비교합니다.
+
+맥락이 넘치지 않는 턴(백엔드가 메시지를 그대로 돌려주는 경우)만 재므로, 차이가 곧 HTTP 모드의 부가 비용입니다.
+- http: 봇의 post_to_memory_backend와 같이 본문을 만들고, 따로 띄운 uvicorn(127.0.0.1)에 보내고, 응답을 읽음
+        (서버 쪽 본문 해석/검증/직렬화 포함. 형식별로 json, 설치돼 있으면 msgpack)
+- inprocess: risu_memory_backend.service.process_chat을 바로 부름 (토크나이저/이미지 예산/메모리 처리는 같음)
+
+사용법: python benchmarks/bench_inprocess.py [--sizes 50 200 1000] [--turns 50] [--port 8765]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="bench_inprocess_"))
+
+import httpx  # noqa: E402
+
+from risu_memory_backend import service, wire  # noqa: E402
+from risu_memory_backend.tokenizer import tokenizer  # noqa: E402
+
+
+def make_payload(size: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    words = "오늘 제비야 밥 먹었어 hey what do you think about the plan lol 내일 학교".split()
+    messages = [{"role": "user" if i % 2 == 0 else "assistant",
+                 "content": " ".join(rng.choice(words) for _ in range(rng.choice([5, 20, 60]))),
+                 "memo": f"{rng.getrandbits(128):032x}"} for i in range(size)]
+    # 맥락 한도를 넉넉히 주어 요약 없이 그대로 돌려받는 턴만 잽니다.
+    return {"messages": messages, "memory_type": "hypa", "max_context_tokens": 10 ** 9,
+            "character_name": "제비", "room_data": {}}
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn이 종료되었습니다:\n{server.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn이 시간 안에 뜨지 않았습니다.")
+
+
+async def time_turns(call, payload: dict, turns: int) -> list:
+    await call(payload)  # 연결/첫 호출 비용은 빼고 잽니다.
+    samples = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        await call(payload)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    tokenizer.encoding  # 양쪽 모두 인코더를 미리 불러 둔 상태로 비교합니다.
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                               "--port", str(args.port), "--log-level", "warning"],
+                              cwd=os.getcwd(), stderr=subprocess.PIPE,
+                              env=dict(os.environ, PYTHONPATH=BACKEND_DIR, METRICS_ENABLED="0"))
+    try:
+        async with httpx.AsyncClient(timeout=120.0) as client:
+            await wait_until_up(client, base_url + "/", server)
+
+            def http_call(content_type: str):
+                async def call(payload: dict) -> dict:
+                    body, headers = wire.encode_body(payload, content_type)
+                    response = await client.post(base_url + "/process_chat/", content=body, headers=headers)
+                    response.raise_for_status()
+                    return wire.decode_body(response.content, response.headers.get("content-type"))
+                return call
+
+            async def inprocess_call(payload: dict) -> dict:
+                return await service.process_chat(payload["messages"], service.ChatOptions.from_payload(payload))
+
+            modes = [("http/json", http_call(wire.JSON))]
+            if wire.msgpack:
+                modes.append(("http/msgpack", http_call(wire.MSGPACK)))
+            modes.append(("inprocess", inprocess_call))
+
+            print(f"orjson={'yes' if wire.orjson else 'no'} msgpack={'yes' if wire.msgpack else 'no'} turns={args.turns}")
+            print(f"{'messages':>8} {'mode':14} {'p50 ms':>9} {'p95 ms':>9} {'saved p50 ms':>13}")
+            for size in args.sizes:
+                payload = make_payload(size)
+                rows = []
+                for name, call in modes:
+                    samples = await time_turns(call, payload, args.turns)
+                    rows.append((name, statistics.median(samples) * 1000,
+                                 statistics.quantiles(samples, n=20)[-1] * 1000))
+                inprocess_p50 = rows[-1][1]
+                for name, p50, p95 in rows:
+                    saved = f"{p50 - inprocess_p50:>13.2f}" if name != "inprocess" else f"{'':>13}"
+                    print(f"{size:>8} {name:14} {p50:>9.2f} {p95:>9.2f} {saved}")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+"""RisuMemoryBackend의 로컬 계산(토큰 세기, 요약 묶음 선택, 기억 선택, 최종 자르기, supa/hypa 전체)을 잽니다.
+
+한국어/영어 합성 대화(100 ~ 50,000개 메시지)를 만들어 쓰고, 요약/임베딩 호출과 ChromaDB는 가짜로 바꿔
+네트워크 없이 CPU 시간만 측정합니다. 결과를 JSON으로 저장해 두면 커밋 사이의 회귀를 비교할 수 있습니다.
+
+사용법: python benchmarks/bench_memory.py [--sizes 100 1000 10000 50000] [--repeat 5]
+                                         [--json out.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# hypa_memory는 불러올 때 risu_memory_db 폴더를 만들므로 임시 폴더에서 불러옵니다.
+ORIGINAL_CWD = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="bench_memory_"))
+
+from risu_memory_backend import tokenizer as tokenizer_module  # noqa: E402
+from risu_memory_backend.memory import hypa_memory, supa_memory  # noqa: E402
+
+KO_WORDS = "오늘 그래서 진짜 제비야 밥 먹었어 내일 학교 가야 돼 게임 하자 날씨 좋다 ㅋㅋㅋ 왜 그렇게 생각해 기억나".split()
+EN_WORDS = "hey so what do you think about the plan for tomorrow I really want to play that game again lol".split()
+SETTINGS = {
+    "summarization_model": "gemini-flash-latest", "embedding_model": "text-embedding-004",
+    "summarization_prompt": "[Summarize]", "memory_tokens_ratio": 0.25, "max_chats_per_summary": 8,
+    "recent_memory_ratio": 0.3, "similar_memory_ratio": 0.5,
+}
+MAX_CONTEXT_TOKENS = 8192
+
+
+# ----- 가짜 LLM/임베딩/ChromaDB -----
+async def stub_summarize(text, settings=None, *args, **kwargs):
+    return text[:400]
+
+
+async def stub_embedding(text, model="text-embedding-004", priority=None):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255.0 for b in digest]
+
+
+class StubCollection:
+    """add/query/count만 흉내 내는 메모리 전용 컬렉션. 질의는 최근 요약 n개를 돌려줍니다."""
+    name = "bench"
+
+    def __init__(self, summaries=()):
+        self.metadatas = [{"text": s} for s in summaries]
+
+    def add(self, ids, embeddings, metadatas):
+        self.metadatas.extend(metadatas)
+
+    def count(self):
+        return len(self.metadatas)
+
+    def query(self, query_embeddings, n_results):
+        return {"metadatas": [self.metadatas[-n_results:]]}
+
+
+def install_stubs():
+    hypa_memory.summarize_for_hypa = stub_summarize
+    hypa_memory.get_embedding = stub_embedding
+    supa_memory.summarize = stub_summarize
+    hypa_memory.print = supa_memory.print = lambda *args, **kwargs: None  # 단계별 로그가 측정을 흐리지 않도록
+
+
+# ----- 합성 대화 -----
+def make_conversation(size: int, language: str, seed: int = 0):
+    rng = random.Random(seed)
+    words = KO_WORDS if language == "ko" else EN_WORDS
+    chats = []
+    for i in range(size):
+        length = rng.choice([3, 6, 12, 25, 60])
+        chats.append({"role": "user" if i % 2 == 0 else "assistant",
+                      "content": " ".join(rng.choice(words) for _ in range(length)),
+                      "memo": f"{rng.getrandbits(128):032x}"})
+    return chats
+
+
+def make_summaries(language: str, count: int = 5):
+    words = KO_WORDS if language == "ko" else EN_WORDS
+    rng = random.Random(1)
+    return [" ".join(rng.choice(words) for _ in range(rng.choice([40, 80, 160]))) for _ in range(count)]
+
+
+# ----- 측정 -----
+def measure(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(samples) * 1000, 3), "min_ms": round(min(samples) * 1000, 3)}
+
+
+def cases(chats, summaries):
+    total_tokens = tokenizer_module.count_chat_history_tokens(chats)
+    memory_prompt_tokens = tokenizer_module.count_tokens("\n\n".join(summaries))
+
+    def hypa_full():
+        hypa_memory.collection = StubCollection(summaries)
+        asyncio.run(hypa_memory.hypa_memory_v3(list(chats), total_tokens, MAX_CONTEXT_TOKENS, {}, SETTINGS))
+
+    def supa_full():
+        asyncio.run(supa_memory.supa_memory(list(chats), total_tokens, MAX_CONTEXT_TOKENS, {}, {"name": "Risu"}))
+
+    return {
+        "tokenize": lambda: tokenizer_module.count_chat_history_tokens(chats),
+        "summary_batch": lambda: hypa_memory.select_summary_batch(chats, 0, SETTINGS["max_chats_per_summary"]),
+        "memory_select": lambda: hypa_memory.select_memories(summaries, MAX_CONTEXT_TOKENS * 0.25),
+        "final_trim": lambda: hypa_memory.trim_to_budget(chats, memory_prompt_tokens, MAX_CONTEXT_TOKENS),
+        "hypa_full": hypa_full,
+        "supa_full": supa_full,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes, repeat: int) -> dict:
+    result = {"commit": git_commit(), "python": platform.python_version(), "repeat": repeat,
+              "max_context_tokens": MAX_CONTEXT_TOKENS, "results": {}}
+    print(f"{'case':28} {'median ms':>11} {'min ms':>11}")
+    for language in ("ko", "en"):
+        summaries = make_summaries(language)
+        for size in sizes:
+            chats = make_conversation(size, language)
+            # supa는 한도에 맞을 때까지 요약을 반복하므로 큰 대화에서는 반복 횟수를 줄입니다.
+            for name, fn in cases(chats, summaries).items():
+                case_repeat = max(1, repeat // 5) if name == "supa_full" and size >= 10_000 else repeat
+                key = f"{language}/{size}/{name}"
+                result["results"][key] = stats = measure(fn, case_repeat)
+                print(f"{key:28} {stats['median_ms']:>11.3f} {stats['min_ms']:>11.3f}")
+    return result
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\n비교 기준: {baseline.get('commit')} -> 현재: {current.get('commit')}")
+    print(f"{'case':28} {'base ms':>11} {'now ms':>11} {'ratio':>7}")
+    for key, stats in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        flag = "  <- 느려짐" if ratio > 1.1 else ""
+        print(f"{key:28} {base['median_ms']:>11.3f} {stats['median_ms']:>11.3f} {ratio:>7.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON 경로")
+    args = parser.parse_args()
+
+    install_stubs()
+    result = run(args.sizes, args.repeat)
+    if args.json:
+        with open(os.path.join(ORIGINAL_CWD, args.json), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(os.path.join(ORIGINAL_CWD, args.compare), "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""/process_chat/ 본문을 만들고 읽는 비용을 형식별로 비교합니다.
+
+- 봇 쪽: payload -> 본문 (JSON 표준 라이브러리 / orjson / msgpack, gzip 여부)
+- 백엔드 쪽: 본문 -> dict -> 검증 (메시지마다 Pydantic 모델을 만드는 경로 / 큰 목록용 빠른 경로)
+
+사용법: python benchmarks/bench_wire.py [--sizes 200 2000 20000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench_wire_"))
+
+from risu_memory_backend import wire  # noqa: E402
+import main as backend_main  # noqa: E402
+
+
+def make_payload(size: int) -> dict:
+    rng = random.Random(0)
+    words = "오늘 제비야 밥 먹었어 hey what do you think about the plan lol 내일 학교".split()
+    messages = [{"role": "user" if i % 2 == 0 else "assistant",
+                 "content": " ".join(rng.choice(words) for _ in range(rng.choice([5, 20, 60]))),
+                 "memo": f"{rng.getrandbits(128):032x}"} for i in range(size)]
+    return {"messages": messages, "memory_type": "hypa", "max_context_tokens": 8192,
+            "character_name": "제비", "room_data": {}}
+
+
+def measure(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def pydantic_path(data: dict):
+    request = backend_main.ProcessChatRequest(**data)
+    return [msg.dict() for msg in request.messages]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 2_000, 20_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    formats = [("json", wire.JSON)] + ([("msgpack", wire.MSGPACK)] if wire.msgpack else [])
+    print(f"orjson={'yes' if wire.orjson else 'no'} msgpack={'yes' if wire.msgpack else 'no'}")
+    print(f"{'case':26} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+    for size in args.sizes:
+        payload = make_payload(size)
+        baseline = json.dumps(payload).encode("utf-8")
+        print(f"{f'{size}/stdlib-json':26} {len(baseline):>10} "
+              f"{measure(lambda: json.dumps(payload).encode('utf-8'), args.repeat):>10.2f} "
+              f"{measure(lambda: json.loads(baseline), args.repeat):>10.2f}")
+        for name, content_type in formats:
+            for gzip_min in (0, 1):
+                body, headers = wire.encode_body(payload, content_type, gzip_min)
+                label = f"{size}/{name}{'+gzip' if gzip_min else ''}"
+                encode_ms = measure(lambda: wire.encode_body(payload, content_type, gzip_min), args.repeat)
+                decode_ms = measure(lambda: wire.decode_body(body, content_type, headers.get("Content-Encoding")),
+                                    args.repeat)
+                print(f"{label:26} {len(body):>10} {encode_ms:>10.2f} {decode_ms:>10.2f}")
+
+        data = json.loads(baseline)
+        print(f"{f'{size}/validate-pydantic':26} {'':>10} {measure(lambda: pydantic_path(data), args.repeat):>10.2f}")
+        print(f"{f'{size}/validate-parse':26} {'':>10} "
+              f"{measure(lambda: backend_main.parse_process_chat_request(data), args.repeat):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
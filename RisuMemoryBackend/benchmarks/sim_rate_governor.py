@@ -0,0 +1,95 @@
+"""RateGovernor를 429를 돌려주는 가짜 Gemini에 붙여 우선순위/백오프/버림 동작을 확인합니다.
+
+요약 작업이 한꺼번에 몰리는 동안 대화 응답이 얼마나 기다리는지를 조정자 없이/있이 비교합니다.
+사용법: python benchmarks/sim_rate_governor.py
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from risu_memory_backend.rate_governor import (  # noqa: E402
+    AdmissionRejected, Priority, RateGovernor, RateLimit, is_rate_limit_error)
+
+
+class ResourceExhausted(Exception):
+    """google.api_core.exceptions.ResourceExhausted(429)를 흉내 냅니다."""
+    code = 429
+
+
+class FakeGemini:
+    """분당 `rpm`개(순간 `burst`개)를 넘는 요청에는 429를 돌려주는 가짜 모델. 응답에는 `latency`초가 걸립니다."""
+
+    def __init__(self, rpm: float, burst: int, latency: float):
+        self.rate = rpm / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.latency = latency
+        self.calls = 0
+        self.rejections = 0
+
+    async def generate(self) -> str:
+        self.calls += 1
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            self.rejections += 1
+            raise ResourceExhausted("429 Resource has been exhausted")
+        self.tokens -= 1
+        await asyncio.sleep(self.latency)
+        return "ok"
+
+
+async def run(use_governor: bool, scale: float):
+    # 시간 축을 `scale`배 줄여 실제 분당 한도를 몇 초 안에 재현합니다.
+    # 실제 한도를 조정자 설정보다 조금 빡빡하게 두어 가끔 429가 나도록 합니다.
+    fake = FakeGemini(rpm=55 * scale, burst=8, latency=0.05)
+    governor = RateGovernor({"m": RateLimit(requests_per_minute=60 * scale, burst=10)},
+                            base_delay=0.2, max_delay=2.0,
+                            max_wait={Priority.INTERACTIVE: 30.0, Priority.BACKGROUND: 3.0, Priority.EMBEDDING: 3.0})
+    latencies = {"interactive": [], "background": []}
+    outcome = {"ok": 0, "failed": 0, "shed": 0}
+
+    async def job(kind: str, priority: Priority, delay: float):
+        await asyncio.sleep(delay)
+        started = time.monotonic()
+        try:
+            if use_governor:
+                await governor.call("m", priority, fake.generate)
+            else:
+                await fake.generate()
+            outcome["ok"] += 1
+            latencies[kind].append(time.monotonic() - started)
+        except AdmissionRejected:
+            outcome["shed"] += 1
+        except Exception as e:
+            assert is_rate_limit_error(e)
+            outcome["failed"] += 1
+
+    # 0초에 요약 40개가 몰리고, 그 사이 대화 응답 20개가 꾸준히 들어옵니다.
+    jobs = [job("background", Priority.BACKGROUND, 0.0) for _ in range(40)]
+    jobs += [job("interactive", Priority.INTERACTIVE, i * 0.1) for i in range(20)]
+    await asyncio.gather(*jobs)
+
+    def p(values, q):
+        return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else (values[0] if values else 0.0)
+
+    label = "governor" if use_governor else "no governor"
+    print(f"[{label}] ok={outcome['ok']} failed(429)={outcome['failed']} shed={outcome['shed']} "
+          f"fake calls={fake.calls} fake 429s={fake.rejections}")
+    for kind, values in latencies.items():
+        if values:
+            print(f"  {kind:11}: n={len(values):2} p50={p(values, 50) * 1000:7.1f}ms p95={p(values, 95) * 1000:7.1f}ms")
+    if use_governor:
+        print(f"  counters: {governor.counters}")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    asyncio.run(run(False, scale=20))
+    asyncio.run(run(True, scale=20))
@@ -1,58 +1,122 @@
 # json_to_bot_memory.py
 
+import argparse
 import json
 import os
+import sys
+import time
 import uuid
+from itertools import islice
 
+try:
+    import ijson
+except ImportError:  # ijson이 없으면 파일 전체를 읽습니다. (큰 파일은 pip install ijson 권장)
+    ijson = None
 
-def convert_ai_studio_to_bot_format(json_file_path: str, user_name: str = "default_user"):
+# 봇의 단기기억 모듈(chat_history, session_manager, config)은 저장소 최상위에 있습니다.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZE = 1000  # 창에 한 번에 넣는 메시지 수. 창 크기만큼만 메모리에 남고 나머지는 보관 파일로 나갑니다.
+
+
+def iter_ai_studio_chunks(json_file_path: str):
+    """AI Studio 내보내기 파일의 `chunkedPrompt.chunks`를 하나씩 읽습니다. ijson이 있으면 메모리를 일정하게 씁니다."""
+    with open(json_file_path, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'chunkedPrompt.chunks.item')
+            return
+        print("경고: ijson이 없어 파일 전체를 메모리에 읽습니다. (pip install ijson)")
+        yield from json.load(f).get('chunkedPrompt', {}).get('chunks', [])
+
+
+def iter_bot_records(chunks):
+    """AI Studio 청크를 봇의 대화 기록 형식(role/content/memo)으로 바꿉니다. 생각(thought)과 빈 청크는 건너뜁니다."""
+    for chunk in chunks:
+        text = (chunk.get('text') or '').strip()
+        if not text or chunk.get('isThought', False):
+            continue
+        # 디스코드 봇의 role 형식(user/assistant)에 맞게 변환
+        yield {
+            "role": "assistant" if chunk.get('role') == "model" else "user",
+            "content": text,
+            "memo": str(uuid.uuid4())  # 고유한 memo 생성
+        }
+
+
+def convert_ai_studio_to_bot_format(json_file_path: str, user_name: str = "default_user", session_dir: str = None,
+                                    archive_dir: str = None, max_messages: int = None, max_tokens: int = None):
     """
-    Google AI Studio의 JSON을 디스코드 봇의 user_chat_histories 형식으로 변환합니다.
+    Google AI Studio의 JSON을 한 유저의 봇 단기기억(세션 파일)에 합칩니다.
+
+    가져온 대화는 그 유저의 기존 기록보다 앞(과거)에 놓이고, 창 크기를 넘는 오래된 기록은
+    `archive_dir`의 유저별 JSONL로 보관됩니다. 다른 유저의 세션 파일은 건드리지 않습니다.
+    저장소는 봇과 같이 config.SHARED_STATE를 따릅니다. ("redis"면 Redis 세션 저장소에 씁니다.)
+    봇이 이 유저와 대화 중이면 봇이 저장할 때 덮어쓸 수 있으므로 봇을 멈추고 실행하세요.
+    (Redis 저장소는 버전을 비교하고 저장하므로, 도중에 봇이 먼저 저장했으면 덮지 않고 실패로 끝납니다.)
     """
     if not os.path.exists(json_file_path):
         print(f"오류: 파일을 찾을 수 없습니다 - {json_file_path}")
-        return
+        return None
 
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        bot_history = []
-        if 'chunkedPrompt' in data and 'chunks' in data['chunkedPrompt']:
-            for chunk in data['chunkedPrompt']['chunks']:
-                role = chunk.get('role', 'unknown')
-                text = chunk.get('text', '').strip()
-                is_thought = chunk.get('isThought', False)
-
-                if not text or is_thought:
-                    continue
-
-                # 디스코드 봇의 role 형식(user/assistant)에 맞게 변환
-                bot_role = "assistant" if role == "model" else "user"
-
-                bot_history.append({
-                    "role": bot_role,
-                    "content": text,
-                    "memo": str(uuid.uuid4())  # 고유한 memo 생성
-                })
-
-        output_data = {
-            user_name: bot_history
-        }
+    import config
+    from chat_history import ChatHistoryWindow
+    from session_manager import RedisSessionStore, SessionManager
+
+    session_dir = session_dir or config.SESSION_DIR
+    archive_dir = archive_dir or config.ARCHIVE_DIR
+    max_messages = max_messages or config.SHORT_TERM_MAX_MESSAGES
+    max_tokens = max_tokens or config.SHORT_TERM_MAX_TOKENS
 
-        output_filename = "bot_short_term_memory_imported.json"
-        with open(output_filename, 'w', encoding='utf-8') as f_out:
-            json.dump(output_data, f_out, ensure_ascii=False, indent=4)
+    def new_window(name: str) -> ChatHistoryWindow:
+        # 넘친 기록은 바로 아카이브로 보내 backfill.py로 장기기억에 넣습니다.
+        return ChatHistoryWindow(name, max_messages, max_tokens, archive_dir, hard_limit_ratio=1.0)
 
-        print(f"성공: '{json_file_path}' 파일을 봇 메모리 형식인 '{output_filename}'으로 변환했습니다.")
-        print(f"이 파일을 'bot_short_term_memory.json'으로 이름을 바꾸고 봇을 실행하면 대화 기록이 로드됩니다.")
+    store = None
+    if config.SHARED_STATE == "redis":
+        import redis
+        store = RedisSessionStore(redis.Redis.from_url(config.REDIS_URL, socket_connect_timeout=2))
+    sessions = SessionManager(new_window, session_dir, config.INACTIVE_SESSION_TIMEOUT, max_resident=1, store=store)
+    existing = sessions.get(user_name).to_list()  # 이미 있는 최근 기록 (창 크기 이하)
 
+    started = time.perf_counter()
+    window = new_window(user_name)
+    records = iter_bot_records(iter_ai_studio_chunks(json_file_path))
+    imported = 0
+    try:
+        while batch := list(islice(records, BATCH_SIZE)):
+            window.extend(batch)
+            imported += len(batch)
+            if imported % (BATCH_SIZE * 50) == 0:
+                print(f"  {imported:,}개 처리 중... ({imported / (time.perf_counter() - started):,.0f} msg/s)")
     except Exception as e:
-        print(f"변환 중 오류 발생: {e}")
+        print(f"변환 중 오류 발생 ({imported:,}개 처리 후 중단, 세션 파일은 바꾸지 않았습니다): {e}")
+        return None
+
+    window.extend(existing)
+    sessions.replace(user_name, window)
+    sessions.save_all()
+    if sessions.conflict_count:
+        print(f"오류: 가져오는 동안 봇이 '{user_name}'의 기록을 저장해서 합친 결과를 저장하지 않았습니다. 다시 실행하세요.")
+        return None
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    size_mb = os.path.getsize(json_file_path) / 1024 / 1024
+    stats = {"imported": imported, "kept_in_window": len(window), "archived": imported + len(existing) - len(window),
+             "elapsed_s": round(elapsed, 2), "mb_per_s": round(size_mb / elapsed, 1),
+             "messages_per_s": round(imported / elapsed)}
+    print(f"성공: '{json_file_path}'의 메시지 {imported:,}개를 '{user_name}'의 단기기억({sessions.store.name} 저장소)에 "
+          f"합쳤습니다. (창 {stats['kept_in_window']}개, 보관 {stats['archived']:,}개)")
+    print(f"처리량: {size_mb:.1f}MB / {elapsed:.2f}s = {stats['mb_per_s']}MB/s, {stats['messages_per_s']:,} msg/s")
+    return stats
 
 
 if __name__ == '__main__':
-    input_file = "your_chat_history.json"
+    parser = argparse.ArgumentParser(description="AI Studio 대화 내보내기를 봇 단기기억에 합칩니다.")
+    parser.add_argument("input_file", nargs="?", default="your_chat_history.json")
     # 이 대화 기록을 어떤 유저의 기록으로 저장할지 이름을 지정합니다.
-    target_user = "ZeroIvy19408175"
-    convert_ai_studio_to_bot_format(input_file, user_name=target_user)
\ No newline at end of file
+    parser.add_argument("--user", default="ZeroIvy19408175")
+    parser.add_argument("--session-dir", help="기본값: config.SESSION_DIR")
+    parser.add_argument("--archive-dir", help="기본값: config.ARCHIVE_DIR")
+    args = parser.parse_args()
+    convert_ai_studio_to_bot_format(args.input_file, user_name=args.user, session_dir=args.session_dir,
+                                    archive_dir=args.archive_dir)
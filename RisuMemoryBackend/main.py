@@ -1,23 +1,58 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Dict, Optional, Literal
 
 # 수정된 임포트 경로
-from risu_memory_backend.tokenizer import Tokenizer, count_chat_history_tokens
-from risu_memory_backend.memory.supa_memory import supa_memory, OpenAIChat as SupaOpenAIChat, Chat as SupaChat, \
-    Character as SupaCharacter
-from risu_memory_backend.memory.hypa_memory import hypa_memory_v3, HypaV3Settings, OpenAIChat as HypaOpenAIChat, \
-    Chat as HypaChat
+from risu_memory_backend.memory.hypa_memory import HypaV3Settings
+from risu_memory_backend.memory.backfill import BackfillProgress, backfill, count_batches
+from risu_memory_backend.metrics import registry, span, timed
+from risu_memory_backend import service, wire
+from risu_memory_backend.service import DEFAULT_HYPA_SETTINGS, ChatOptions, MemoryServiceError, schedule_consolidation
+
+# --- 시작 단계 (Startup) ---
+# 무거운 초기화(tiktoken 인코더, ChromaDB, Gemini 설정)는 임포트 때가 아니라 여기서 스레드로 나눠 동시에 합니다.
+# 포트는 바로 열리고, 준비가 끝났는지는 /ready 로 확인합니다.
+startup_state = {"ready": False, "started_at": time.perf_counter(), "ready_after_s": None, "error": None}
+
+
+async def warm_up():
+    try:
+        await service.warm_up()
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logging.error(f"백엔드 초기화 실패: {e}")
+        return
+    startup_state["ready"] = True
+    startup_state["ready_after_s"] = round(time.perf_counter() - startup_state["started_at"], 3)
+    logging.info(f"백엔드 준비 완료 ({startup_state['ready_after_s']}s)")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_task = asyncio.create_task(warm_up())
+    yield
+    warm_task.cancel()
+
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="RisuAI Long-Term Memory Backend (ChromaDB Edition)",
     description="A Python implementation of RisuAI's long-term memory systems using ChromaDB and Google Gemini API.",
     version="2.0.0",
+    lifespan=lifespan,
 )
-
-tokenizer = Tokenizer()
+# 큰 응답은 클라이언트가 gzip을 받겠다고 하면 압축해서 보냅니다. (httpx는 기본으로 받음)
+app.add_middleware(GZipMiddleware, minimum_size=wire.GZIP_MIN_BYTES)
 
 
 # --- Pydantic Models for API ---
@@ -25,6 +60,8 @@ class ChatMessage(BaseModel):
     role: str
     content: str
     memo: Optional[str] = None
+    image_tokens: int = Field(0, ge=0, description="Estimated model tokens for an image attached to this message.")
+    caption: Optional[str] = Field(None, description="Short description used when the image is dropped.")
 
 
 class ProcessChatRequest(BaseModel):
@@ -35,64 +72,180 @@ class ProcessChatRequest(BaseModel):
     hypa_settings: Optional[HypaV3Settings] = None
     # room_data는 이제 HypaMemory에서 사용되지 않지만, SupaMemory와의 호환성을 위해 남겨둡니다.
     room_data: Dict = Field({}, description="Persistent data for the chat room, used by SupaMemory.")
+    conversation_id: Optional[str] = Field(None, description="Stored with new HypaMemory summaries to tell conversations apart.")
+    max_images: int = Field(3, ge=0, description="How many of the most recent images to keep.")
+    image_token_ratio: float = Field(0.5, ge=0, le=1, description="Share of max_context_tokens images may use.")
+
+
+class BackfillRequest(BaseModel):
+    conversation_id: str
+    messages: List[ChatMessage]
+    hypa_settings: Optional[HypaV3Settings] = None
+    concurrency: int = Field(4, ge=1, le=32, description="How many batches to summarize at once.")
+
+
+BACKFILL_CHECKPOINT_DIR = "backfill_checkpoints"
+
+
+# 메시지가 이보다 많으면 메시지마다 Pydantic 모델을 만들지 않고 필요한 필드만 직접 확인합니다.
+MAX_VALIDATED_MESSAGES = 256
+
+
+def parse_process_chat_request(data) -> tuple:
+    """요청 본문(dict)을 검증해 (요청 설정, 메시지 dict 목록)을 돌려줍니다.
+
+    메시지는 토큰 계산과 메모리 처리에 그대로 쓰이므로 role/content/memo 세 키(와 이미지가 있으면 image_tokens/caption)만
+    가진 dict로 맞춥니다.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("messages"), list):
+        raise HTTPException(status_code=422, detail="'messages' list is required.")
+    messages = data["messages"]
+    try:
+        if len(messages) <= MAX_VALIDATED_MESSAGES:
+            request = ProcessChatRequest(**data)
+            return request, [chat_dict(msg.dict()) for msg in request.messages]
+        request = ProcessChatRequest(**{**data, "messages": []})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+
+    chats = []
+    for i, msg in enumerate(messages):
+        if not isinstance(msg, dict) or not isinstance(msg.get("role"), str) or not isinstance(msg.get("content"), str):
+            raise HTTPException(status_code=422, detail=f"messages[{i}] must have string 'role' and 'content'.")
+        chats.append(chat_dict(msg))
+    return request, chats
+
+
+def chat_dict(msg: Dict) -> Dict:
+    memo = msg.get("memo")
+    chat = {"role": msg["role"], "content": msg["content"], "memo": memo if isinstance(memo, str) else None}
+    image_tokens = msg.get("image_tokens")
+    if isinstance(image_tokens, int) and image_tokens > 0:
+        chat["image_tokens"] = image_tokens
+        if isinstance(msg.get("caption"), str):
+            chat["caption"] = msg["caption"]
+    return chat
 
 
 # --- API Endpoint ---
 @app.post("/process_chat/")
-async def process_chat(request: ProcessChatRequest):
-    current_tokens = count_chat_history_tokens([msg.dict() for msg in request.messages])
-
-    if current_tokens <= request.max_context_tokens:
-        return {
-            "processed_messages": request.messages,
-            "final_tokens": current_tokens,
-            # updated_room_data는 이제 별 의미가 없지만, 봇과의 호환성을 위해 빈 객체를 보냅니다.
-            "updated_room_data": {},
-            "info": "Context window not exceeded, no memory processing needed."
-        }
-
-    if request.memory_type == 'supa':
-        # SupaMemory는 여전히 room_data를 사용합니다 (휘발성).
-        supa_chats: List[SupaOpenAIChat] = [msg.dict() for msg in request.messages]
-        supa_room: SupaChat = {"supaMemoryData": request.room_data.get("supaMemoryData")}
-        supa_char: SupaCharacter = {"name": request.character_name}
-        result = await supa_memory(
-            chats=supa_chats, current_tokens=current_tokens, max_context_tokens=request.max_context_tokens,
-            room=supa_room, char=supa_char
-        )
-        if result.get("error"): raise HTTPException(status_code=500, detail=result["error"])
-        # SupaMemory는 여전히 room_data를 업데이트합니다.
-        updated_data = {"supaMemoryData": result.get("memory")}
-        return {
-            "processed_messages": result["chats"], "final_tokens": result["current_tokens"],
-            "updated_room_data": updated_data,
-            "info": f"SupaMemory processed. Last summarized message ID: {result.get('last_id')}"
-        }
-
-    elif request.memory_type == 'hypa':
-        hypa_chats: List[HypaOpenAIChat] = [msg.dict() for msg in request.messages]
-        # ChromaDB를 사용하므로 room_data를 전달할 필요가 없습니다.
-        hypa_room: HypaChat = {}
-        hypa_settings = request.hypa_settings or HypaV3Settings(
-            summarization_model='gemini-flash-latest', embedding_model='text-embedding-004',
-            summarization_prompt='[Summarize the ongoing role story, focusing on key events, character progression, and unresolved plot points.]',
-            memory_tokens_ratio=0.25, max_chats_per_summary=8,
-            recent_memory_ratio=0.3, similar_memory_ratio=0.5,
-        )
-        result = await hypa_memory_v3(
-            chats=hypa_chats, current_tokens=current_tokens, max_context_tokens=request.max_context_tokens,
-            room=hypa_room, settings=hypa_settings
-        )
-        if result.get("error"): raise HTTPException(status_code=500, detail=result["error"])
-
-        # HypaMemory는 더 이상 room_data를 반환하지 않습니다.
-        return {
-            "processed_messages": result["chats"], "final_tokens": result["current_tokens"],
-            "updated_room_data": {},  # 빈 객체 반환
-            "info": f"HypaMemory (ChromaDB) processed."
-        }
-    else:
-        raise HTTPException(status_code=400, detail="Invalid memory_type specified.")
+@timed("backend", "process_chat")
+async def process_chat(http_request: Request):
+    """JSON(기본) 또는 msgpack 본문(Content-Type: application/msgpack)을 받습니다. gzip 압축 본문도 받습니다.
+
+    응답 형식은 Accept 헤더로 고릅니다. 본문 형식은 ProcessChatRequest를 따릅니다.
+    """
+    request, chats = await read_process_chat_request(http_request)
+    result = await run_process_chat(request, chats)
+
+    with span("backend", "encode"):
+        response_format = wire.negotiate(http_request.headers.get("accept"))
+        return Response(content=wire.encode(result, response_format), media_type=response_format)
+
+
+async def read_process_chat_request(http_request: Request) -> tuple:
+    with span("backend", "decode"):
+        try:
+            data = wire.decode_body(await http_request.body(), http_request.headers.get("content-type"),
+                                    http_request.headers.get("content-encoding"))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not decode request body: {e}")
+        return parse_process_chat_request(data)
+
+
+async def run_process_chat(request: ProcessChatRequest, chats: List[Dict]) -> Dict:
+    return await service.process_chat(chats, chat_options(request))
+
+
+def chat_options(request: ProcessChatRequest) -> ChatOptions:
+    return ChatOptions(memory_type=request.memory_type, max_context_tokens=request.max_context_tokens,
+                       character_name=request.character_name, hypa_settings=request.hypa_settings,
+                       room_data=request.room_data, conversation_id=request.conversation_id,
+                       max_images=request.max_images, image_token_ratio=request.image_token_ratio)
+
+
+@app.exception_handler(MemoryServiceError)
+async def memory_service_error(http_request: Request, e: MemoryServiceError):
+    return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+
+
+# --- 다음 턴 미리 준비 (Speculative Prepare) ---
+@app.post("/prepare_context/", status_code=202)
+async def prepare_context(http_request: Request):
+    """봇이 답한 직후(또는 유저가 입력 중일 때) 보냅니다. 본문은 /process_chat/과 같고 conversation_id가 필요합니다.
+
+    다음 턴에 할 요약과 기억 선택을 백그라운드에서 미리 해 두고 바로 돌아갑니다. (HypaMemory만 해당)
+    """
+    request, chats = await read_process_chat_request(http_request)
+    return service.prepare_context(chats, chat_options(request))
+
+
+# --- 백필 (Backfill) ---
+# 지난 대화 기록을 한꺼번에 요약해 넣는 작업. 대화마다 하나씩만 돌고, 진행 상황은 GET으로 봅니다.
+backfill_jobs: Dict[str, BackfillProgress] = {}
+_backfill_tasks: Dict[str, asyncio.Task] = {}  # 실행 중인 태스크가 가비지 컬렉션되지 않도록 잡아 둡니다.
+
+
+def backfill_checkpoint_path(conversation_id: str) -> str:
+    safe_name = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in conversation_id)
+    return os.path.join(BACKFILL_CHECKPOINT_DIR, f"{safe_name}.json")
+
+
+@app.post("/backfill/", status_code=202)
+async def start_backfill(request: BackfillRequest):
+    running = backfill_jobs.get(request.conversation_id)
+    if running and not running.finished:
+        raise HTTPException(status_code=409, detail="A backfill for this conversation is already running.")
+    settings = request.hypa_settings or DEFAULT_HYPA_SETTINGS
+    chats = [msg.dict() for msg in request.messages]
+    progress = BackfillProgress(request.conversation_id, count_batches(chats, settings['max_chats_per_summary']))
+    backfill_jobs[request.conversation_id] = progress
+
+    async def run():
+        try:
+            await backfill(chats, settings, request.conversation_id,
+                           checkpoint_path=backfill_checkpoint_path(request.conversation_id),
+                           concurrency=request.concurrency, progress=progress)
+        except Exception as e:
+            logging.error(f"백필 실패 ({request.conversation_id}): {e}")
+            return
+        schedule_consolidation(request.conversation_id, settings)
+
+    _backfill_tasks[request.conversation_id] = asyncio.create_task(run())
+    return progress.to_dict()
+
+
+@app.get("/backfill/{conversation_id}")
+async def backfill_status(conversation_id: str):
+    progress = backfill_jobs.get(conversation_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No backfill has been started for this conversation.")
+    return progress.to_dict()
+
+
+# --- 요약문 정리 (Consolidation) ---
+# 새 요약문이 생긴 대화의 정리는 service.schedule_consolidation이 백그라운드에서 합니다.
+
+
+@app.post("/consolidate/{conversation_id}")
+async def consolidate_now(conversation_id: str):
+    """대화 하나의 요약문 정리를 바로 실행하고 결과(정리 전/후 요약문 수)를 돌려줍니다."""
+    return await service.consolidate_now(conversation_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 형식의 단계별 시간/토큰/요약 지표. METRICS_ENABLED=0이면 값이 쌓이지 않습니다."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+async def ready():
+    """초기화가 끝났으면 200, 아직이면 503을 돌려줍니다. (준비 전 요청도 처리는 되지만 첫 요청이 느립니다.)"""
+    status_code = 200 if startup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content={
+        "ready": startup_state["ready"], "ready_after_s": startup_state["ready_after_s"],
+        "error": startup_state["error"]})
 
 
 @app.get("/")
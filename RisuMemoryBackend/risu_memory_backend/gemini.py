@@ -0,0 +1,26 @@
+import logging
+import os
+import threading
+
+_lock = threading.Lock()
+_configured = False
+
+
+def get_genai():
+    """설정을 마친 google.generativeai 모듈을 돌려줍니다.
+
+    임포트(수백 ms)와 API 키 설정은 처음 부를 때 한 번만 합니다. hypa/supa가 각자 설정하던 것을 여기로 모았습니다.
+    """
+    global _configured
+    import google.generativeai as genai
+    if not _configured:
+        with _lock:
+            if not _configured:
+                from dotenv import load_dotenv
+                load_dotenv()  # .env 파일 로드
+                if api_key := os.getenv("GEMINI_API_KEY"):
+                    genai.configure(api_key=api_key)
+                else:
+                    logging.warning("Warning: GEMINI_API_KEY environment variable not set.")
+                _configured = True
+    return genai
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import hypa_memory
+from .hypa_memory import HypaV3Settings, OpenAIChat, SummarizationFailed, stringlize_chats, summary_metadata
+from ..rate_governor import AdmissionRejected
+from ..metrics import SUMMARIZATIONS, span
+
+
+def iter_batches(chats: Iterable[OpenAIChat], max_chats: int) -> Iterator[Tuple[int, List[OpenAIChat]]]:
+    """요약할 묶음을 (묶음 번호, 메시지들)로 나눕니다. hypa_memory_v3와 같이 NewChat 표시와 빈 메시지는 건너뜁니다.
+
+    같은 입력이면 항상 같은 번호가 나오므로, 번호를 체크포인트와 요약문 ID에 씁니다.
+    """
+    batch, index = [], 0
+    for chat in chats:
+        if chat.get('memo') == 'NewChat' or not chat.get('content', '').strip():
+            continue
+        batch.append(chat)
+        if len(batch) >= max_chats:
+            yield index, batch
+            batch, index = [], index + 1
+    if batch:
+        yield index, batch
+
+
+def count_batches(chats: List[OpenAIChat], max_chats: int) -> int:
+    kept = sum(1 for c in chats if c.get('memo') != 'NewChat' and c.get('content', '').strip())
+    return -(-kept // max_chats)
+
+
+class Checkpoint:
+    """끝난 묶음 번호를 JSON 파일에 적어 두어, 중단된 백필을 이어서 할 수 있게 합니다."""
+
+    def __init__(self, path: Optional[str], conversation_id: str):
+        self.path = path
+        self.conversation_id = conversation_id
+        self.done: Set[int] = set()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("conversation_id") == conversation_id:
+                self.done = set(data.get("done", []))
+
+    def mark(self, indexes: Iterable[int]):
+        self.done.update(indexes)
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"conversation_id": self.conversation_id, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class BackfillProgress:
+    conversation_id: str
+    total_batches: int
+    resumed: int = 0  # 체크포인트에 이미 끝났다고 적혀 있던 묶음 수
+    done: int = 0  # 이번 실행에서 저장까지 끝낸 묶음 수
+    failed: int = 0  # 실행 허가를 못 받았거나 저장에 실패한 묶음 수 (다시 실행하면 재시도)
+    started_at: float = field(default_factory=time.monotonic)
+    finished: bool = False
+    error: Optional[str] = None
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        remaining = self.total_batches - self.resumed - self.done - self.failed
+        return remaining / self.rate if self.rate > 0 else None
+
+    def to_dict(self) -> dict:
+        eta = self.eta_seconds
+        return {"conversation_id": self.conversation_id, "total_batches": self.total_batches,
+                "resumed": self.resumed, "done": self.done, "failed": self.failed,
+                "batches_per_s": round(self.rate, 2), "eta_s": round(eta, 1) if eta is not None else None,
+                "finished": self.finished, "error": self.error}
+
+
+def summary_id(conversation_id: str, index: int) -> str:
+    return f"backfill:{conversation_id}:{index}"
+
+
+async def backfill(chats: List[OpenAIChat], settings: HypaV3Settings, conversation_id: str,
+                   checkpoint_path: Optional[str] = None, concurrency: int = 8, flush_size: int = 32,
+                   progress: Optional[BackfillProgress] = None,
+                   on_progress: Optional[Callable[[BackfillProgress], None]] = None) -> BackfillProgress:
+    """지난 대화 기록 전체를 `max_chats_per_summary`개씩 요약해 HypaMemory(ChromaDB)에 넣습니다.
+
+    - 요약은 `concurrency`개까지 동시에 하고, 모든 호출은 공용 호출 조정자(BACKGROUND/EMBEDDING 우선순위)를 거칩니다.
+    - 요약문은 `flush_size`개씩 모아 한 번의 임베딩 호출과 한 번의 `collection.add`로 저장한 뒤 체크포인트에 적습니다.
+    - 요약문 ID는 (대화, 묶음 번호)로 정해지므로 같은 묶음을 다시 넣어도 중복되지 않습니다.
+    """
+    max_chats = settings['max_chats_per_summary']
+    checkpoint = Checkpoint(checkpoint_path, conversation_id)
+    if progress is None:
+        progress = BackfillProgress(conversation_id, count_batches(chats, max_chats))
+    progress.resumed = len(checkpoint.done)
+    collection = hypa_memory.get_collection()
+    batches = ((i, b) for i, b in iter_batches(chats, max_chats) if i not in checkpoint.done)
+    pending: List[Tuple[int, str]] = []
+    flush_lock = asyncio.Lock()
+
+    async def flush():
+        async with flush_lock:
+            items = pending[:]
+            del pending[:]
+            if not items:
+                return
+            try:
+                with span("backfill", "embed"):
+                    embeddings = await hypa_memory.get_embeddings([text for _, text in items],
+                                                                  model=settings['embedding_model'])
+                with span("backfill", "store"):
+                    await asyncio.to_thread(
+                        collection.add, ids=[summary_id(conversation_id, i) for i, _ in items], embeddings=embeddings,
+                        metadatas=[summary_metadata(text, conversation_id, batch=i) for i, text in items])
+            except Exception as e:
+                progress.failed += len(items)
+                logging.warning(f"[Backfill] {len(items)}개 요약 저장 실패 (다시 실행하면 재시도): {e}")
+                return
+            checkpoint.mark(i for i, _ in items)
+            progress.done += len(items)
+            SUMMARIZATIONS.inc(len(items), memory="backfill", result="ok")
+            if on_progress:
+                on_progress(progress)
+
+    async def worker():
+        # 모든 워커가 같은 제너레이터에서 다음 묶음을 꺼내 가므로 묶음 수만큼 태스크를 만들지 않습니다.
+        for index, batch in batches:
+            try:
+                with span("backfill", "summarize"):
+                    text = await hypa_memory.summarize_or_raise(stringlize_chats(batch), settings)
+            except AdmissionRejected as e:
+                progress.failed += 1
+                SUMMARIZATIONS.inc(memory="backfill", result="deferred")
+                logging.warning(f"[Backfill] 묶음 {index} 요약이 밀렸습니다 (다시 실행하면 재시도): {e}")
+                continue
+            except SummarizationFailed as e:
+                # 원문을 요약문으로 넣고 끝난 것으로 적으면 다시 실행해도 고쳐지지 않으므로 실패로 남깁니다.
+                progress.failed += 1
+                SUMMARIZATIONS.inc(memory="backfill", result="error")
+                logging.warning(f"[Backfill] 묶음 {index} 요약 실패 (다시 실행하면 재시도): {e}")
+                continue
+            pending.append((index, text))
+            if len(pending) >= flush_size:
+                await flush()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        await flush()
+    except Exception as e:
+        progress.error = str(e)
+        raise
+    finally:
+        progress.finished = True
+        if on_progress:
+            on_progress(progress)
+    return progress
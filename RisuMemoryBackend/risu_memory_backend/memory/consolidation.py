@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import uuid
+from typing import Dict, List, Optional, TypedDict
+
+from . import hypa_memory
+from .hypa_memory import HypaV3Settings, SummarizationFailed, summary_metadata
+from ..rate_governor import AdmissionRejected
+from ..metrics import SUMMARIZATIONS, span
+
+
+class ConsolidationSettings(TypedDict):
+    max_live_summaries: int  # 대화 하나에 남겨 둘 요약문 수의 상한
+    group_size: int  # 한 번에 합칠 이웃 요약문 수
+    keep_recent: int  # 가장 최근 요약문 몇 개는 합치지 않고 그대로 둡니다.
+
+
+DEFAULT_CONSOLIDATION_SETTINGS = ConsolidationSettings(max_live_summaries=64, group_size=4, keep_recent=16)
+CONSOLIDATION_PROMPT = ("[Merge these consecutive summaries of past events into one summary. Keep names, places, "
+                        "promises, preferences and unresolved plot points; drop repetition and small talk.]")
+
+
+def summary_order(metadata: Dict) -> tuple:
+    """요약문을 대화 순서대로 놓는 키. 백필한 요약은 묶음 번호 순으로 대화 중에 생긴 요약보다 앞에 둡니다."""
+    if "batch" in metadata:
+        return 0, metadata["batch"]
+    return 1, metadata.get("span_start", metadata.get("created_at", 0))
+
+
+def plan_consolidation(entries: List[Dict], settings: ConsolidationSettings) -> List[List[Dict]]:
+    """합칠 요약문 묶음을 고릅니다. `entries`는 {"id", "metadata"} 목록이며 대화 순서대로 정렬되어 있어야 합니다.
+
+    남은 수가 `max_live_summaries` 이하가 될 때까지, 시간상 이웃한 `group_size`개 묶음을 겹치지 않게 고릅니다.
+    단계(level)가 낮고 오래된 묶음부터 합치므로 요약은 로그 구조처럼 층을 이루며 쌓입니다.
+    """
+    group_size = max(2, settings['group_size'])
+    excess = len(entries) - settings['max_live_summaries']
+    candidates = entries[:max(0, len(entries) - settings['keep_recent'])]
+    if excess <= 0 or len(candidates) < group_size:
+        return []
+
+    levels = [e["metadata"].get("level", 0) for e in candidates]
+    starts = sorted(range(len(candidates) - group_size + 1), key=lambda i: (max(levels[i:i + group_size]), i))
+    used = [False] * len(candidates)
+    chosen = []
+    for i in starts:
+        if excess <= 0:
+            break
+        if any(used[i:i + group_size]):
+            continue
+        used[i:i + group_size] = [True] * group_size
+        chosen.append(i)
+        excess -= group_size - 1
+    return [candidates[i:i + group_size] for i in sorted(chosen)]
+
+
+def merged_metadata(text: str, group: List[Dict], conversation_id: str) -> Dict:
+    """합친 요약문의 메타데이터. 순서 키는 묶음의 첫 요약문을 따릅니다."""
+    first = group[0]["metadata"]
+    extra = {"batch": first["batch"]} if "batch" in first else {"span_start": summary_order(first)[1]}
+    return summary_metadata(text, conversation_id, level=max(e["metadata"].get("level", 0) for e in group) + 1,
+                            sources=sum(e["metadata"].get("sources", 1) for e in group), **extra)
+
+
+async def consolidate(conversation_id: str, settings: HypaV3Settings,
+                      consolidation: Optional[ConsolidationSettings] = None, concurrency: int = 4) -> Dict:
+    """대화 하나의 요약문이 상한을 넘었으면 오래된 이웃 요약문을 묶어 다시 요약하고 원래 요약문은 지웁니다.
+
+    새 요약문을 먼저 넣고 나서 원래 요약문을 지우므로, 도중에 실패해도 기억이 비는 순간은 없습니다.
+    (실패하면 같은 내용이 잠시 겹칠 뿐이고 다음 정리에서 다시 합쳐집니다.)
+    """
+    consolidation = consolidation or DEFAULT_CONSOLIDATION_SETTINGS
+    collection = hypa_memory.get_collection()
+    with span("consolidate", "load"):
+        found = await asyncio.to_thread(collection.get, where={"conversation_id": conversation_id},
+                                        include=["metadatas"])
+    entries = sorted(({"id": i, "metadata": m} for i, m in zip(found["ids"], found["metadatas"])),
+                     key=lambda e: summary_order(e["metadata"]))
+    stats = {"conversation_id": conversation_id, "before": len(entries), "merged_groups": 0, "deferred_groups": 0}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    merge_settings = {**settings, "summarization_prompt": CONSOLIDATION_PROMPT}
+
+    async def merge(group):
+        async with semaphore:
+            try:
+                with span("consolidate", "summarize"):
+                    return await hypa_memory.summarize_or_raise(
+                        "\n\n".join(e["metadata"]["text"] for e in group), merge_settings)
+            except AdmissionRejected as e:
+                SUMMARIZATIONS.inc(memory="consolidate", result="deferred")
+                logging.info(f"[Consolidate] 요약이 밀려 다음 정리로 넘깁니다: {e}")
+                return None
+            except SummarizationFailed as e:
+                # 원문을 이어 붙인 것을 합친 요약문으로 넣고 원래 요약문을 지우면 안 되므로 다음 정리로 넘깁니다.
+                SUMMARIZATIONS.inc(memory="consolidate", result="error")
+                logging.warning(f"[Consolidate] 요약 실패, 다음 정리로 넘깁니다: {e}")
+                return None
+
+    while groups := plan_consolidation(entries, consolidation):
+        texts = await asyncio.gather(*(merge(g) for g in groups))
+        done = [(g, t) for g, t in zip(groups, texts) if t is not None]
+        stats["deferred_groups"] += len(groups) - len(done)
+        if not done:
+            break
+        with span("consolidate", "embed"):
+            embeddings = await hypa_memory.get_embeddings([t for _, t in done], model=settings['embedding_model'])
+        merged = [{"id": f"consolidated:{uuid.uuid4()}", "metadata": merged_metadata(t, g, conversation_id)}
+                  for g, t in done]
+        with span("consolidate", "store"):
+            await asyncio.to_thread(collection.add, ids=[m["id"] for m in merged], embeddings=embeddings,
+                                    metadatas=[m["metadata"] for m in merged])
+            retired = {e["id"] for g, _ in done for e in g}
+            await asyncio.to_thread(collection.delete, ids=list(retired))
+        SUMMARIZATIONS.inc(len(done), memory="consolidate", result="ok")
+        stats["merged_groups"] += len(done)
+        entries = sorted([e for e in entries if e["id"] not in retired] + merged,
+                         key=lambda e: summary_order(e["metadata"]))
+        if len(done) < len(groups):
+            break  # 밀린 묶음은 다음 정리에서 다시 시도합니다.
+
+    stats["after"] = len(entries)
+    if stats["merged_groups"]:
+        logging.info(f"[Consolidate] '{conversation_id}' 요약문 {stats['before']}개 -> {stats['after']}개 "
+                     f"({stats['merged_groups']}묶음 합침)")
+    return stats
@@ -1,12 +1,18 @@
+import asyncio
+import hashlib
 import logging
-import os
-import google.generativeai as genai
-from typing import List, Dict, TypedDict, Optional
-import chromadb
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+# Pydantic 2는 Python 3.12 미만에서 typing_extensions의 TypedDict만 모델 필드로 받습니다. (HypaV3Settings가 요청 본문에 들어감)
+from typing_extensions import TypedDict
 import uuid
-from dotenv import load_dotenv
 
-from ..tokenizer import Tokenizer, count_tokens
+from ..tokenizer import tokenizer, count_tokens
+from ..gemini import get_genai
+from ..rate_governor import AdmissionRejected, Priority, get_governor
+from ..metrics import SUMMARIZATIONS, span, timed
 
 
 # --- 데이터 구조 정의 (Data Structures) ---
@@ -26,120 +32,265 @@ class OpenAIChat(TypedDict):
     memo: Optional[str]
 
 
-class Chat(TypedDict):
+class Chat(TypedDict, total=False):
     # ChromaDB를 사용하므로 이 부분은 사실상 비어있게 됩니다.
     hypaV3Data: Optional[Dict]
+    conversation_id: Optional[str]  # 요약문 메타데이터에 남겨 대화별로 구분합니다.
 
 
 # --- ChromaDB 클라이언트 설정 ---
+# chromadb 임포트와 영구 저장소 열기는 느리므로 처음 필요할 때(또는 서버 시작 단계에서) 한 번만 합니다.
 db_path = "risu_memory_db"  # DB 파일이 저장될 폴더 이름
-client = chromadb.PersistentClient(path=db_path)
-collection = client.get_or_create_collection(name="summaries")
-logging.info(f"ChromaDB collection '{collection.name}' loaded with {collection.count()} entries from '{db_path}'.")
+collection = None
+_collection_lock = threading.Lock()
 
-load_dotenv() # .env 파일 로드
 
-# --- Gemini API 설정 ---
-if api_key := os.getenv("GEMINI_API_KEY"):
-    genai.configure(api_key=api_key)
-else:
-    print("Warning: GEMINI_API_KEY environment variable not set.")
-tokenizer = Tokenizer()
+def get_collection():
+    global collection
+    if collection is None:
+        with _collection_lock:
+            if collection is None:
+                import chromadb
+                client = chromadb.PersistentClient(path=db_path)
+                opened = client.get_or_create_collection(name="summaries")
+                logging.info(f"ChromaDB collection '{opened.name}' loaded with {opened.count()} entries from '{db_path}'.")
+                collection = opened
+    return collection
+
+
+# 요약은 끝났는데 임베딩이 호출 한도로 밀린 요약문. (대화 ID, 요약한 원문의 해시) -> 요약문
+# 다음 턴에 같은 부분을 요약할 때 요약 모델을 다시 부르지 않고 임베딩만 다시 시도합니다.
+PENDING_SUMMARIES_MAX = 256
+_pending_summaries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
 
 
 # --- 헬퍼 함수 (Helper Functions) ---
-def get_embedding(text: str, model: str = "text-embedding-004") -> List[float]:
+async def get_embedding(text: str, model: str = "text-embedding-004",
+                        priority: Priority = Priority.EMBEDDING) -> List[float]:
     text = text.replace("\n", " ")
-    result = genai.embed_content(model=model, content=text)
+    # embed_content는 동기 함수이므로 스레드에서 실행합니다.
+    genai = get_genai()
+    result = await get_governor().call(
+        model, priority, lambda: asyncio.to_thread(genai.embed_content, model=model, content=text))
     return result['embedding']
 
 
-async def summarize_for_hypa(text_to_summarize: str, settings: HypaV3Settings) -> str:
+async def get_embeddings(texts: List[str], model: str = "text-embedding-004",
+                         priority: Priority = Priority.EMBEDDING) -> List[List[float]]:
+    """여러 문장을 한 번의 API 호출로 임베딩합니다. (백필처럼 요약이 많이 쌓일 때 호출 수를 줄임)"""
+    contents = [text.replace("\n", " ") for text in texts]
+    genai = get_genai()
+    result = await get_governor().call(
+        model, priority, lambda: asyncio.to_thread(genai.embed_content, model=model, content=contents))
+    return result['embedding']
+
+
+def stringlize_chats(chats: List[OpenAIChat]) -> str:
+    return "\n".join([f"{c['role']}: {c['content']}" for c in chats])
+
+
+def summary_metadata(summary_text: str, conversation_id: Optional[str] = None, level: int = 0, **extra) -> Dict:
+    """ChromaDB에 요약문과 함께 저장할 메타데이터. (ChromaDB 메타데이터에는 None을 넣을 수 없습니다)
+
+    `level`은 대화를 바로 요약한 것이 0, 요약문 여러 개를 다시 합친 것이 1 이상입니다. (consolidation.py 참고)
+    """
+    metadata = {"text": summary_text, "created_at": time.time(), "level": level, **extra}
+    if conversation_id:
+        metadata["conversation_id"] = conversation_id
+    return metadata
+
+
+class SummarizationFailed(Exception):
+    """요약 모델이 오류를 냈거나 빈 답을 줬습니다."""
+
+
+async def summarize_or_raise(text_to_summarize: str, settings: HypaV3Settings) -> str:
+    """요약문을 돌려줍니다. 실패하면 원문 대신 SummarizationFailed를 올립니다. (호출 한도는 AdmissionRejected 그대로)
+
+    요약문이 원문을 대신해 원문을 지우는 곳(요약문 정리, 백필)에서 씁니다.
+    """
     prompt = settings['summarization_prompt']
     full_prompt = f"{text_to_summarize}\n\n{prompt}\n\nOutput:"
     try:
-        model = genai.GenerativeModel(settings['summarization_model'])
-        response = await model.generate_content_async(full_prompt)
-        return response.text.strip() or text_to_summarize
+        model = get_genai().GenerativeModel(settings['summarization_model'])
+        response = await get_governor().call(settings['summarization_model'], Priority.BACKGROUND,
+                                             lambda: model.generate_content_async(full_prompt))
+        summary = response.text.strip()
+    except AdmissionRejected:
+        raise
     except Exception as e:
+        raise SummarizationFailed(str(e)) from e
+    if not summary or summary == text_to_summarize.strip():
+        raise SummarizationFailed("summary is empty or identical to the input")
+    return summary
+
+
+async def summarize_for_hypa(text_to_summarize: str, settings: HypaV3Settings) -> str:
+    """대화 중 요약. 실패하면 원문을 그대로 요약문으로 씁니다. (이번 턴의 맥락을 줄이는 것이 우선)"""
+    try:
+        return await summarize_or_raise(text_to_summarize, settings)
+    except SummarizationFailed as e:
         print(f"Error during Hypa summarization: {e}")
         return text_to_summarize
 
 
+# --- 단계별 계산 (Pure Steps) ---
+# 아래 함수들은 LLM/DB를 부르지 않는 순수 계산이라 벤치마크(benchmarks/bench_memory.py)에서 따로 잴 수 있습니다.
+def select_summary_batch(chats: List[OpenAIChat], start_idx: int, max_chats: int) -> Tuple[List[OpenAIChat], int, int]:
+    """요약할 채팅 묶음을 고릅니다. (묶음, 묶음의 토큰 수, 다음 시작 인덱스)를 돌려줍니다.
+
+    마지막 3개 메시지는 요약에서 제외하고, NewChat 표시나 빈 메시지는 건너뜁니다.
+    """
+    batch, batch_tokens, next_idx = [], 0, start_idx
+    for i in range(start_idx, len(chats) - 3):
+        if len(batch) >= max_chats:
+            break
+        chat = chats[i]
+        next_idx = i + 1
+        if chat.get('memo') == 'NewChat' or not chat.get('content', '').strip():
+            continue
+        batch.append(chat)
+        batch_tokens += tokenizer.count_chat_tokens(chat)
+    return batch, batch_tokens, next_idx
+
+
+def select_memories(summary_texts: List[str], available_tokens: float) -> str:
+    """유사도 순으로 정렬된 요약문을 토큰 예산 안에서 앞에서부터 고릅니다."""
+    selected_texts, consumed_tokens = [], 0
+    for summary_text in summary_texts:
+        summary_tokens = count_tokens(summary_text)
+        if consumed_tokens + summary_tokens <= available_tokens:
+            selected_texts.append(summary_text)
+            consumed_tokens += summary_tokens
+    return "\n\n".join(selected_texts)
+
+
+def trim_to_budget(chats: List[OpenAIChat], reserved_tokens: int, max_context_tokens: int) -> Tuple[List[OpenAIChat], int]:
+    """앞에서부터 메시지를 버려 `reserved_tokens`(기억 프롬프트)와 합친 토큰 수가 한도 안에 들도록 합니다.
+
+    메시지마다 토큰 수를 한 번만 세고, 잘라낼 위치를 찾은 뒤 한 번에 자릅니다. (list.pop(0) 반복은 O(n^2))
+    최소 1개 메시지는 남깁니다.
+    """
+    chat_tokens = [tokenizer.count_chat_tokens(c) for c in chats]
+    total = sum(chat_tokens) + reserved_tokens
+    cut = 0
+    while total > max_context_tokens and cut < len(chats) - 1:
+        total -= chat_tokens[cut]
+        cut += 1
+    return chats[cut:], total
+
+
 # --- 핵심 로직: HypaMemory v3 (ChromaDB 버전) ---
-async def hypa_memory_v3(
+class PreparedHypa(TypedDict):
+    start_idx: int  # 요약되어 최종 컨텍스트에서 빠질 앞부분의 끝 (chats[start_idx:]가 남음)
+    summarized: bool  # 이번에 새 요약문을 넣었는지
+    memory_content: str  # 선택된 기억(요약문)들
+
+
+async def hypa_prepare(
         chats: List[OpenAIChat], current_tokens: int, max_context_tokens: int,
-        room: Chat, settings: HypaV3Settings,
-) -> dict:
+        room: Chat, settings: HypaV3Settings, summarize_above: Optional[int] = None,
+) -> PreparedHypa:
+    """1~2단계(요약, 기억 선택). LLM/임베딩/DB를 부르는 부분이라 다음 턴을 위해 미리 해 둘 수 있습니다.
+
+    `summarize_above`를 주면 토큰 수가 `max_context_tokens` 대신 그 값을 넘을 때 요약합니다. (미리 준비할 때 다음 메시지 몫을 남김)
+    """
     log_prefix = "[HypaV3-Chroma]"
-    memory_prompt_tag = "Past Events Summary"
+    collection = get_collection()
     start_idx = 0  # 요약을 시작할 채팅 인덱스
+    summarized = False
 
     # 1. 요약 단계 (Summarization Phase)
-    if current_tokens > max_context_tokens:
+    if current_tokens > (max_context_tokens if summarize_above is None else summarize_above):
         print(f"{log_prefix} Context limit exceeded. Starting summarization process.")
-        to_summarize_batch, tokens_to_be_removed = [], 0
-
-        for i in range(start_idx, len(chats) - 3):  # 마지막 3개 메시지는 요약에서 제외
-            chat = chats[i]
-            if len(to_summarize_batch) < settings['max_chats_per_summary']:
-                if chat.get('memo') == 'NewChat' or not chat.get('content', '').strip(): continue
-                to_summarize_batch.append(chat)
-                tokens_to_be_removed += tokenizer.count_chat_tokens(chat)
-            else:
-                break
+        with span("hypa", "batch_select"):
+            to_summarize_batch, tokens_to_be_removed, next_idx = select_summary_batch(
+                chats, start_idx, settings['max_chats_per_summary'])
 
         if to_summarize_batch:
-            stringlized_chat = "\n".join([f"{c['role']}: {c['content']}" for c in to_summarize_batch])
-            summary_text = await summarize_for_hypa(stringlized_chat, settings)
-            summary_embedding = get_embedding(summary_text, model=settings['embedding_model'])
-            summary_id = str(uuid.uuid4())
+            stringlized_chat = stringlize_chats(to_summarize_batch)
+            pending_key = (room.get("conversation_id") or "", hashlib.sha1(stringlized_chat.encode("utf-8")).hexdigest())
+            summary_text = _pending_summaries.pop(pending_key, None)
+            try:
+                if summary_text is None:
+                    with span("hypa", "summarize"):
+                        summary_text = await summarize_for_hypa(stringlized_chat, settings)
+                with span("hypa", "embed_summary"):
+                    summary_embedding = await get_embedding(summary_text, model=settings['embedding_model'])
+            except AdmissionRejected as e:
+                # 호출 한도가 빠듯해 요약이 밀렸습니다. 이번 턴은 요약 없이 진행하고 다음 턴에 다시 시도합니다.
+                # 요약문은 이미 받았다면 남겨 두고 다음 턴에는 임베딩만 다시 합니다.
+                if summary_text is not None:
+                    _pending_summaries[pending_key] = summary_text
+                    while len(_pending_summaries) > PENDING_SUMMARIES_MAX:
+                        _pending_summaries.popitem(last=False)
+                SUMMARIZATIONS.inc(memory="hypa", result="deferred")
+                print(f"{log_prefix} Summarization deferred: {e}")
+            else:
+                summary_id = str(uuid.uuid4())
 
-            collection.add(ids=[summary_id], embeddings=[summary_embedding], metadatas=[{"text": summary_text}])
+                # ChromaDB 호출은 이벤트 루프(in-process 모드라면 Discord 봇의 루프)를 막지 않도록 스레드에서 합니다.
+                with span("hypa", "store"):
+                    await asyncio.to_thread(
+                        collection.add, ids=[summary_id], embeddings=[summary_embedding],
+                        metadatas=[summary_metadata(summary_text, room.get("conversation_id"))])
+                SUMMARIZATIONS.inc(memory="hypa", result="ok")
 
-            current_tokens -= tokens_to_be_removed
-            start_idx += len(to_summarize_batch)
-            print(f"{log_prefix} New summary saved to ChromaDB. Total summaries: {collection.count()}.")
+                start_idx = next_idx
+                summarized = True
+                print(f"{log_prefix} New summary saved to ChromaDB.")
 
     # 2. 기억 선택 단계 (Memory Selection Phase)
     memory_content = ""
-    if collection.count() > 0:
+    if await asyncio.to_thread(collection.count) > 0:
         available_memory_tokens = max_context_tokens * settings['memory_tokens_ratio']
         recent_chats_for_query = [c for c in chats[-3:] if c.get('content', '').strip()]
 
         if recent_chats_for_query:
             query_text = "\n".join([c['content'] for c in recent_chats_for_query])
-            query_embedding = get_embedding(query_text, model=settings['embedding_model'])
+            # 질의 임베딩은 이번 답변을 기다리게 하므로 대화 응답과 같은 우선순위로 처리합니다.
+            with span("hypa", "embed_query"):
+                query_embedding = await get_embedding(query_text, model=settings['embedding_model'],
+                                                      priority=Priority.INTERACTIVE)
 
             # ChromaDB에 현재 대화와 가장 유사한 요약문 5개를 쿼리
-            results = collection.query(query_embeddings=[query_embedding], n_results=5)
+            with span("hypa", "query"):
+                results = await asyncio.to_thread(collection.query, query_embeddings=[query_embedding], n_results=5)
 
             similar_summaries = results['metadatas'][0] if results['metadatas'] else []
 
-            selected_texts, consumed_tokens = [], 0
-            for summary_meta in similar_summaries:
-                summary_text = summary_meta['text']
-                summary_tokens = count_tokens(summary_text)
-                if consumed_tokens + summary_tokens <= available_memory_tokens:
-                    selected_texts.append(summary_text)
-                    consumed_tokens += summary_tokens
-            memory_content = "\n\n".join(selected_texts)
+            memory_content = select_memories([meta['text'] for meta in similar_summaries],
+                                             available_memory_tokens)
+
+    return {"start_idx": start_idx, "summarized": summarized, "memory_content": memory_content}
 
-    # 3. 최종 조립 단계 (Final Assembly Phase)
+
+def hypa_assemble(chats: List[OpenAIChat], prepared: PreparedHypa, max_context_tokens: int) -> dict:
+    """3단계(최종 조립). 선택된 기억을 맨 앞에 두고 남은 대화를 예산에 맞게 자릅니다."""
+    memory_prompt_tag = "Past Events Summary"
+    memory_content = prepared["memory_content"]
     final_memory_prompt = f"<{memory_prompt_tag}>\n{memory_content}\n</{memory_prompt_tag}>" if memory_content else ""
     final_memory_tokens = count_tokens(final_memory_prompt)
 
-    final_chats = chats[start_idx:]
-    final_tokens = sum(tokenizer.count_chat_tokens(c) for c in final_chats) + final_memory_tokens
-
-    while final_tokens > max_context_tokens and len(final_chats) > 1:
-        removed_chat = final_chats.pop(0)
-        final_tokens -= tokenizer.count_chat_tokens(removed_chat)
+    with span("hypa", "trim"):
+        final_chats, final_tokens = trim_to_budget(chats[prepared["start_idx"]:], final_memory_tokens,
+                                                   max_context_tokens)
 
     if final_memory_prompt:
         final_chats.insert(0, {"role": "system", "content": final_memory_prompt, "memo": "hypaMemory"})
 
-    print(f"{log_prefix} Final context ready. Tokens: {final_tokens}. Chats: {len(final_chats)}.")
+    print(f"[HypaV3-Chroma] Final context ready. Tokens: {final_tokens}. Chats: {len(final_chats)}.")
+
+    # 이제 memory_data를 반환할 필요가 없습니다. summarized는 새 요약문을 넣었는지 (요약문 정리 예약에 씀)
+    # start_idx 앞은 장기기억에 요약된 부분입니다. (trim_to_budget이 자른 나머지는 요약되지 않음)
+    return {"current_tokens": final_tokens, "chats": final_chats, "error": None,
+            "summarized": prepared["summarized"], "start_idx": prepared["start_idx"]}
+
 
-    # 이제 memory_data를 반환할 필요가 없습니다.
-    return {"current_tokens": final_tokens, "chats": final_chats, "error": None}
\ No newline at end of file
+@timed("hypa", "total")
+async def hypa_memory_v3(
+        chats: List[OpenAIChat], current_tokens: int, max_context_tokens: int,
+        room: Chat, settings: HypaV3Settings,
+) -> dict:
+    prepared = await hypa_prepare(chats, current_tokens, max_context_tokens, room, settings)
+    return await asyncio.to_thread(hypa_assemble, chats, prepared, max_context_tokens)
@@ -0,0 +1,38 @@
+from typing import List, Tuple
+
+from .hypa_memory import OpenAIChat
+
+DROPPED_IMAGE_TEXT = "[이전에 보낸 이미지]"
+
+
+def describe_dropped(chat: OpenAIChat) -> OpenAIChat:
+    """이미지를 뺀 메시지. 캡션이 있으면 본문 끝에 붙이고, 없으면 이미지가 있었다는 표시만 남깁니다."""
+    caption = chat.get("caption")
+    note = f"[이미지: {caption}]" if caption else DROPPED_IMAGE_TEXT
+    content = chat.get("content", "")
+    return {"role": chat["role"], "content": f"{content}\n{note}" if content else note,
+            "memo": chat.get("memo"), "image_dropped": True}
+
+
+def budget_images(chats: List[OpenAIChat], max_images: int, max_image_tokens: int) -> Tuple[List[OpenAIChat], int, int]:
+    """최근 이미지부터 `max_images`장, 합계 `max_image_tokens` 토큰까지만 남기고 더 오래된 이미지는 글로 바꿉니다.
+
+    글보다 이미지를 먼저 줄이므로, 요약(HypaMemory/SupaMemory)은 이미지를 뺀 뒤의 토큰 수를 기준으로 합니다.
+    가장 최근 이미지는 예산을 넘어도 남깁니다. (방금 보낸 사진을 못 보면 답을 할 수 없으므로)
+    돌려주는 값: (메시지 목록, 뺀 이미지 수, 남은 이미지 토큰 합)
+    """
+    result = chats
+    kept = dropped = image_tokens = 0
+    for i in range(len(chats) - 1, -1, -1):
+        tokens = chats[i].get("image_tokens") or 0
+        if not tokens:
+            continue
+        if kept == 0 or (kept < max_images and image_tokens + tokens <= max_image_tokens):
+            kept += 1
+            image_tokens += tokens
+            continue
+        if result is chats:
+            result = list(chats)  # 이미지를 뺄 때만 복사합니다.
+        result[i] = describe_dropped(chats[i])
+        dropped += 1
+    return result, dropped, image_tokens
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .hypa_memory import OpenAIChat, PreparedHypa
+from ..metrics import CACHE_LOOKUPS
+
+
+@dataclass
+class _Entry:
+    last_memo: Optional[str]  # 준비할 때 대화의 마지막 메시지 memo. 다음 턴에는 그 뒤에 메시지 하나만 붙어 있어야 합니다.
+    boundary_memo: Optional[str]  # 요약되고 남은 첫 메시지의 memo
+    max_context_tokens: int
+    created_at: float
+    task: "asyncio.Task[PreparedHypa]"
+
+
+class PreparedContextCache:
+    """봇이 답한 뒤(또는 유저가 입력 중일 때) 다음 턴의 HypaMemory 요약/기억 선택을 미리 해 둡니다.
+
+    대화(conversation_id)마다 하나만 들고 있으며, 다음 `/process_chat/` 요청의 끝에서 두 번째 메시지 memo가
+    준비할 때의 마지막 memo와 같을 때(= 새 메시지 하나만 붙었을 때)만 씁니다. 그렇지 않으면 낡은 것으로 보고 버립니다.
+    기억 선택의 질의는 새 메시지를 빼고 한 것이므로, 새 메시지 하나 만큼 덜 최신인 기억을 쓰게 됩니다.
+
+    준비하면서 넣은 요약문은 결과를 버려도 장기기억에 남으므로, 요약된 부분의 경계(memo)는 대화마다 따로 기억해 두고
+    (`summarized_until`) 다음 요청에서 그 앞부분을 다시 요약하지 않게 합니다.
+    """
+
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._boundaries: "OrderedDict[str, str]" = OrderedDict()  # 대화별 미리 요약된 부분 뒤 첫 메시지의 memo
+        # 대화별 아직 도는 준비 작업. 결과(_entries)를 꺼내 가거나 밀려나도 끝날 때까지 남겨 두고 다음 준비를 그 뒤에 잇습니다.
+        self._inflight: Dict[str, "asyncio.Task[PreparedHypa]"] = {}
+        self.counters: Dict[str, int] = {"scheduled": 0, "duplicate": 0, "hits": 0, "stale": 0, "misses": 0,
+                                         "pending": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, conversation_id: str, chats: List[OpenAIChat], max_context_tokens: int,
+                 prepare: Callable[[], Awaitable[PreparedHypa]]) -> bool:
+        """준비 작업을 띄웁니다. 같은 대화, 같은 마지막 memo로 이미 준비 중이거나 끝났으면 다시 하지 않습니다."""
+        last_memo = chats[-1].get("memo") if chats else None
+        current = self._entries.get(conversation_id)
+        if current and current.last_memo == last_memo and current.max_context_tokens == max_context_tokens \
+                and not self._expired(current):
+            self.counters["duplicate"] += 1
+            return False
+
+        # 앞서 준비하던 작업은 끝까지 돌게 두고, 새 작업은 그 뒤에 시작합니다.
+        # (요약을 넣는 중에 끊거나 동시에 돌리면 같은 부분의 요약이 두 번 들어갈 수 있음)
+        previous = self._inflight.get(conversation_id)
+
+        async def run() -> PreparedHypa:
+            if previous is not None:
+                await asyncio.wait([previous])
+            prepared = await prepare()
+            entry.boundary_memo = chats[prepared["start_idx"]].get("memo") if prepared["start_idx"] < len(chats) else None
+            if prepared["start_idx"] and entry.boundary_memo is not None:
+                self._remember_boundary(conversation_id, entry.boundary_memo)
+            return prepared
+
+        entry = _Entry(last_memo, None, max_context_tokens, time.monotonic(), None)
+        entry.task = asyncio.create_task(run())
+        entry.task.add_done_callback(self._log_failure)
+        self._inflight[conversation_id] = entry.task
+        entry.task.add_done_callback(lambda task: self._finish(conversation_id, task))
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.counters["scheduled"] += 1
+        return True
+
+    async def take(self, conversation_id: Optional[str], chats: List[OpenAIChat],
+                   max_context_tokens: int, wait: bool = True) -> Optional[PreparedHypa]:
+        """이번 요청에 쓸 수 있는 준비 결과를 꺼냅니다. (한 번 쓰면 지움) start_idx는 이번 요청의 chats 기준으로 고쳐서 돌려줍니다.
+
+        준비가 아직 끝나지 않았으면 기다립니다. 같은 요약을 두 번 하지 않게 하려는 것입니다.
+        이번 턴에 요약이 필요 없으면(`wait=False`) 기다리지 않고 None을 돌려줍니다. 아직 도는 준비는 꺼내지 않고 두므로
+        다음 준비는 그 뒤에 이어지고, 넣은 요약문의 경계는 `summarized_until`로 다음 요청에 반영됩니다.
+        """
+        entry = self._entries.get(conversation_id) if conversation_id else None
+        if entry is None:
+            inflight = self._inflight.get(conversation_id) if conversation_id else None
+            if wait and inflight is not None:
+                # 결과는 밀려났어도 준비가 아직 요약을 넣는 중이면 끝나기를 기다립니다. (그 경계는 summarized_until로 반영)
+                await asyncio.wait([inflight])
+            self._count("misses")
+            return None
+        if not wait and not entry.task.done():
+            # 꺼내지 않고 둡니다. 다음 요청이 끝난 결과를 쓰거나 기다릴 수 있고, 그 사이 새 준비는 이 작업 뒤에 이어집니다.
+            self._count("pending")
+            return None
+        del self._entries[conversation_id]
+        try:
+            prepared = await asyncio.shield(entry.task)
+        except Exception:
+            self._count("stale")
+            return None
+        if (self._expired(entry) or len(chats) < 2 or chats[-2].get("memo") != entry.last_memo
+                or entry.max_context_tokens != max_context_tokens):
+            # 준비한 뒤로 기록이 바뀌었습니다. 이미 넣은 요약문은 장기기억에 남으므로 결과만 버립니다.
+            # (요약된 부분은 summarized_until로 잘라 다시 요약하지 않음)
+            self._count("stale")
+            return None
+        start_idx = 0
+        if prepared["start_idx"]:
+            if entry.boundary_memo is None:
+                self._count("stale")
+                return None
+            # 봇의 단기기억 창이 앞부분을 내보냈을 수 있으므로 위치 대신 memo로 경계를 다시 찾습니다.
+            # 못 찾으면 요약된 부분이 이미 창에서 빠진 것이므로 처음부터 씁니다.
+            start_idx = next((i for i, c in enumerate(chats) if c.get("memo") == entry.boundary_memo), 0)
+        self._count("hits")
+        return {**prepared, "start_idx": start_idx}
+
+    def summarized_until(self, conversation_id: Optional[str], chats: List[OpenAIChat]) -> int:
+        """미리 준비하면서 요약문을 넣은 부분의 끝(chats 기준 인덱스)을 돌려줍니다. 없으면 0.
+
+        경계 메시지가 맨 앞이거나 창에 없으면 봇이 요약된 부분을 이미 내보낸 것이므로 기억해 둔 경계를 지웁니다.
+        """
+        boundary_memo = self._boundaries.get(conversation_id) if conversation_id else None
+        if boundary_memo is None:
+            return 0
+        idx = next((i for i, c in enumerate(chats) if c.get("memo") == boundary_memo), 0)
+        if not idx:
+            self._boundaries.pop(conversation_id, None)
+        return idx
+
+    def discard(self, conversation_id: str):
+        self._entries.pop(conversation_id, None)
+
+    def stats(self) -> Dict:
+        return {**self.counters, "entries": len(self._entries), "inflight": len(self._inflight)}
+
+    def _remember_boundary(self, conversation_id: str, boundary_memo: str):
+        self._boundaries[conversation_id] = boundary_memo
+        self._boundaries.move_to_end(conversation_id)
+        while len(self._boundaries) > self.max_entries:
+            self._boundaries.popitem(last=False)
+
+    def _finish(self, conversation_id: str, task: asyncio.Task):
+        if self._inflight.get(conversation_id) is task:
+            del self._inflight[conversation_id]
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl_seconds
+
+    def _count(self, result: str):
+        self.counters[result] += 1
+        CACHE_LOOKUPS.inc(cache="prepared_context", result=result)
+
+    def _log_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["errors"] += 1
+            logging.warning(f"[Prepare] 다음 턴 컨텍스트 준비 실패: {task.exception()}")
@@ -1,9 +1,10 @@
-import os
-import google.generativeai as genai
 from typing import List, Dict, TypedDict, Optional
 
 # 상위 폴더의 tokenizer를 임포트하기 위해 경로를 수정합니다.
-from ..tokenizer import Tokenizer, count_tokens
+from ..tokenizer import count_tokens, count_chat_tokens
+from ..gemini import get_genai
+from ..rate_governor import AdmissionRejected, Priority, get_governor
+from ..metrics import SUMMARIZATIONS, span, timed
 
 
 # --- 데이터 구조 정의 (Data Structures) ---
@@ -22,19 +23,12 @@ class Character(TypedDict):
     name: str
 
 
-# --- Gemini API 설정 ---
-# .env 파일에서 키를 읽어옵니다.
-if api_key := os.getenv("GEMINI_API_KEY"):
-    genai.configure(api_key=api_key)
-else:
-    print("Warning: GEMINI_API_KEY environment variable not set.")
-
-
 # --- 핵심 함수 (Core Functions) ---
 async def summarize(text_to_summarize: str, supa_model_type: str = 'gemini-flash-latest',
                     supa_memory_prompt: str = "") -> str:
     """
     주어진 텍스트를 Gemini API를 사용하여 요약합니다.
+    호출 한도로 밀린 경우(AdmissionRejected)는 원본으로 대신하지 않고 그대로 올립니다. (다음 턴에 다시 요약)
     """
     if not supa_memory_prompt:
         supa_memory_prompt = "[Summarize the ongoing role story, It must also remove redundancy and unnecessary text and content from the output to reduce tokens for gpt3 and other sublanguage models]"
@@ -42,19 +36,23 @@ async def summarize(text_to_summarize: str, supa_model_type: str = 'gemini-flash
     prompt_body = f"{text_to_summarize}\n\n{supa_memory_prompt}\n\nOutput:"
 
     try:
-        model = genai.GenerativeModel(supa_model_type)
-        response = await model.generate_content_async(prompt_body)
+        model = get_genai().GenerativeModel(supa_model_type)
+        response = await get_governor().call(supa_model_type, Priority.BACKGROUND,
+                                             lambda: model.generate_content_async(prompt_body))
 
         result = response.text.strip()
         if not result:
             raise ValueError("Summarization returned an empty result.")
         return result
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Error during summarization: {e}")
         # 실패 시 원본 텍스트를 반환하여 데이터 손실을 방지합니다.
         return text_to_summarize
 
 
+@timed("supa", "total")
 async def supa_memory(
         chats: List[OpenAIChat],
         current_tokens: int,
@@ -90,6 +88,7 @@ async def supa_memory(
         stringlized_chat = ''
         splice_len = 0  # 대화 기록의 시작 부분에서 제거할 메시지 수
         max_chunk_tokens = max_context_tokens / 3  # 컨텍스트의 약 1/3을 요약
+        chunk_last_id = ''
 
         for i, chat_message in enumerate(chats):
             # 시스템 메시지는 요약 대상에서 제외
@@ -98,7 +97,7 @@ async def supa_memory(
 
             message_tokens = count_chat_tokens(chat_message)
             if chunk_size + message_tokens > max_chunk_tokens and stringlized_chat:
-                last_id = chat_message.get('memo', '')
+                chunk_last_id = chat_message.get('memo', '')
                 break
 
             # 대화 내용을 "user: ..." 또는 "assistant: ..." 형식의 문자열로 만듭니다.
@@ -115,23 +114,34 @@ async def supa_memory(
                 "error": "Not enough tokens to summarize or failed to create a summarization chunk."
             }
 
+        # 새로운 요약 부분을 생성합니다.
+        try:
+            with span("supa", "summarize"):
+                new_summary_part = await summarize(stringlized_chat)
+        except AdmissionRejected as e:
+            # 호출 한도가 빠듯해 요약이 밀렸습니다. 이번 청크는 요약하지 않고 남겨 두었다가 다음 턴에 다시 시도합니다.
+            SUMMARIZATIONS.inc(memory="supa", result="deferred")
+            print(f"Supa summarization deferred: {e}")
+            current_tokens += chunk_size
+            break
+        SUMMARIZATIONS.inc(memory="supa", result="ok")
+
         # 요약된 부분을 대화 기록에서 제거합니다.
         chats = chats[splice_len:]
-
-        # 새로운 요약 부분을 생성합니다.
-        new_summary_part = await summarize(stringlized_chat)
+        last_id = chunk_last_id
         new_summary_tokens = count_tokens(new_summary_part)
 
         # 전체 요약문에 새로운 요약 부분을 추가합니다.
         supa_memory_summary = f"{supa_memory_summary}\n\n{new_summary_part}".strip()
         current_tokens += new_summary_tokens
 
-    # 최종 요약문을 시스템 메시지로 대화 기록 맨 앞에 추가합니다.
-    chats.insert(0, {
-        "role": "system",
-        "content": supa_memory_summary,
-        "memo": "supaMemory"
-    })
+    # 최종 요약문을 시스템 메시지로 대화 기록 맨 앞에 추가합니다. (첫 청크부터 밀려 요약문이 없으면 넣지 않음)
+    if supa_memory_summary:
+        chats.insert(0, {
+            "role": "system",
+            "content": supa_memory_summary,
+            "memo": "supaMemory"
+        })
 
     return {
         "current_tokens": current_tokens,
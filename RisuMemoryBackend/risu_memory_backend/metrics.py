@@ -0,0 +1,201 @@
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_NOOP = nullcontext()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Sequence[str]):
+        self.registry, self.name, self.help, self.labelnames = registry, name, help_text, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "key", "started")
+
+    def __init__(self, histogram: "Histogram", key: Tuple):
+        self.histogram, self.key = histogram, key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram._observe(self.key, time.perf_counter() - self.started)
+        return False
+
+
+class Histogram:
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.registry, self.name, self.help, self.labelnames = registry, name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # 라벨 -> [버킷별 개수..., +Inf 개수, 합계]
+
+    def observe(self, value: float, **labels):
+        if self.registry.enabled:
+            self._observe(tuple(labels.get(n, "") for n in self.labelnames), value)
+
+    def time(self, **labels):
+        """`with` 블록의 실행 시간을 기록합니다. 꺼져 있으면 아무것도 하지 않는 컨텍스트를 돌려줍니다."""
+        if not self.registry.enabled:
+            return _NOOP
+        return _Timer(self, tuple(labels.get(n, "") for n in self.labelnames))
+
+    def _observe(self, key: Tuple, value: float):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Collected:
+    """렌더링할 때 콜백을 불러 값을 읽는 게이지. 이미 다른 곳에서 세고 있는 카운터(캐시 적중 등)를 노출할 때 씁니다."""
+
+    def __init__(self, name: str, help_text: str, fn: Callable, labelname: Optional[str]):
+        self.name, self.help, self.fn, self.labelname = name, help_text, fn, labelname
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logging.warning(f"[Metrics] {self.name} 수집 실패: {e}")
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if isinstance(value, dict):
+            lines += [f'{self.name}{{{self.labelname}="{k}"}} {v}' for k, v in value.items()
+                      if isinstance(v, (int, float))]
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """프로세스 안의 카운터/히스토그램을 모아 Prometheus 텍스트 형식으로 내보냅니다.
+
+    꺼져 있으면(`enabled=False`) 기록 함수는 플래그만 확인하고 바로 돌아갑니다.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(self, name, help_text, labelnames, buckets))
+
+    def collect(self, name: str, help_text: str, fn: Callable, labelname: Optional[str] = None):
+        self._metrics[name] = _Collected(name, help_text, fn, labelname)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def _register(self, name: str, factory: Callable):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = factory()
+        return metric
+
+
+# 봇과 백엔드가 같은 이름으로 기록하도록 공용 레지스트리와 지표를 둡니다. METRICS_ENABLED=0이면 끕니다.
+registry = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "1") != "0")
+STAGE_SECONDS = registry.histogram("risu_stage_seconds", "단계별 처리 시간(초)", ("component", "stage"))
+TOKENS = registry.counter("risu_tokens_total", "처리한 토큰 수", ("component", "direction"))
+SUMMARIZATIONS = registry.counter("risu_summarizations_total", "장기기억 요약 횟수", ("memory", "result"))
+CACHE_LOOKUPS = registry.counter("risu_cache_lookups_total", "캐시 조회 결과", ("cache", "result"))
+TOOL_CALLS = registry.counter("risu_tool_calls_total", "함수 호출 횟수", ("tool", "result"))
+REQUESTS = registry.counter("risu_requests_total", "처리한 요청 수", ("component", "outcome"))
+# source: estimate(백엔드가 센 전체), image_estimate(그중 이미지), gemini(Gemini가 알려준 실제 입력 토큰)
+TURN_INPUT_TOKENS = registry.histogram("risu_turn_input_tokens", "턴마다 모델에 들어가는 입력 토큰 수", ("component", "source"),
+                                       buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072))
+
+
+def span(component: str, stage: str):
+    """`with span("bot", "gemini"):`처럼 단계 하나의 시간을 잽니다."""
+    return STAGE_SECONDS.time(component=component, stage=stage)
+
+
+def timed(component: str, stage: str):
+    """함수(동기/비동기) 전체의 실행 시간을 재는 데코레이터."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not registry.enabled:
+                    return await fn(*args, **kwargs)
+                with span(component, stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            with span(component, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """FastAPI가 없는 프로세스(디스코드 봇)를 위한 아주 작은 HTTP 서버. 어떤 경로로 요청해도 지표를 돌려줍니다."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            body = registry.render().encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"지표 서버가 http://{host}:{port}/metrics 에서 실행 중입니다.")
+    return server
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, TypeVar
+
+from .metrics import registry
+
+T = TypeVar("T")
+
+# 여러 프로세스가 함께 쓰는 Redis 버킷. 채우고 꺼내는 것을 한 번에 해서 두 프로세스가 같은 토큰을 꺼내지 않게 합니다.
+# 꺼냈으면 0, 아니면 기다려야 할 초를 문자열로 돌려줍니다. (Lua 숫자를 그대로 돌려주면 정수로 잘림)
+_TAKE_SCRIPT = """
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated', 'cooldown')
+local rate, capacity, level, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+local cooldown = tonumber(state[3]) or 0
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if now < cooldown then
+    wait = cooldown - now
+elseif tokens >= level then
+    tokens = tokens - 1
+elseif rate > 0 then
+    wait = (level - tokens) / rate
+else
+    wait = 3600
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('expire', KEYS[1], 3600)
+return tostring(wait)
+"""
+# 429를 받은 프로세스가 정한 쉬는 시각을 다른 프로세스도 따르게 합니다. (더 늦은 시각만 반영)
+_COOLDOWN_SCRIPT = """
+if (tonumber(redis.call('hget', KEYS[1], 'cooldown')) or 0) < tonumber(ARGV[1]) then
+    redis.call('hset', KEYS[1], 'cooldown', ARGV[1])
+    redis.call('expire', KEYS[1], 3600)
+end
+return 0
+"""
+
+
+class Priority(IntEnum):
+    """숫자가 작을수록 먼저 처리됩니다."""
+    INTERACTIVE = 0  # 유저에게 바로 나가는 답변 (봇의 send_message, 질의 임베딩)
+    BACKGROUND = 1  # 요약
+    EMBEDDING = 2  # 요약문 임베딩 등 미뤄도 되는 작업
+
+
+class RateLimit(NamedTuple):
+    requests_per_minute: float
+    burst: int
+
+
+class AdmissionRejected(Exception):
+    """낮은 우선순위 작업이 정해진 시간 안에 실행 허가를 받지 못해 버려졌을 때 발생합니다."""
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """429(ResourceExhausted)나 503처럼 잠시 뒤 다시 시도하면 되는 에러인지 판단합니다."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable"):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code in (429, 503)
+
+
+class TokenBucket:
+    def __init__(self, limit: RateLimit, now: float):
+        self.rate = limit.requests_per_minute / 60.0
+        self.capacity = float(limit.burst)
+        self.tokens = float(limit.burst)
+        self.updated = now
+        self.cooldown_until = 0.0  # 429를 받은 뒤에는 이 시각까지 모든 호출을 멈춥니다.
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, level: float, now: float) -> float:
+        wait = max(0.0, (level - self.tokens) / self.rate) if self.rate > 0 else float("inf")
+        return max(wait, self.cooldown_until - now)
+
+
+class RateGovernor:
+    """모델별 토큰 버킷으로 Gemini 호출 속도를 맞추고, 우선순위에 따라 실행을 허가하는 조정자.
+
+    - 낮은 우선순위 작업은 버킷의 `reserve_ratio`만큼을 남겨둬야만 실행되므로, 요약이 몰려도 대화 응답 몫이 남습니다.
+    - 429/503을 받으면 지터를 섞은 지수 백오프로 재시도하고, 그동안 같은 모델의 다른 호출도 쉬게 합니다.
+    - 우선순위별 `max_wait`보다 오래 기다려야 하는 작업은 `AdmissionRejected`로 버립니다.
+    - Redis 클라이언트(`client`)를 주면 버킷을 `{prefix}:{모델}` 키에 두어 봇/백엔드/샤드 프로세스가 한도 하나를 함께 씁니다.
+      그러면 대화 응답 몫(reserve)도 프로세스 사이에서 지켜집니다. Redis가 잠깐 안 되면 이 프로세스의 버킷으로 대신합니다.
+    """
+
+    def __init__(self, limits: Dict[str, RateLimit], default_limit: RateLimit = RateLimit(60, 10),
+                 reserve_ratio: Dict[Priority, float] = None, max_wait: Dict[Priority, float] = None,
+                 max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable] = asyncio.sleep,
+                 jitter: Callable[[], float] = random.random, client=None, prefix: str = "ratelimit"):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.reserve_ratio = reserve_ratio or {Priority.INTERACTIVE: 0.0, Priority.BACKGROUND: 0.3,
+                                               Priority.EMBEDDING: 0.5}
+        self.max_wait = max_wait or {Priority.INTERACTIVE: 120.0, Priority.BACKGROUND: 60.0,
+                                     Priority.EMBEDDING: 30.0}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock, self.sleep, self.jitter = clock, sleep, jitter
+        self.client = client
+        self.prefix = prefix
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.counters: Dict[str, int] = {"admitted": 0, "rejected": 0, "retries": 0, "rate_limited": 0,
+                                         "shared_errors": 0}
+
+    async def call(self, model: str, priority: Priority, fn: Callable[[], Awaitable[T]]) -> T:
+        """`fn()`을 실행 허가가 나면 호출하고, 429면 백오프 후 재시도합니다."""
+        for attempt in range(self.max_retries + 1):
+            await self.admit(model, priority)
+            try:
+                return await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + self.jitter() / 2)
+                self.counters["rate_limited"] += 1
+                self.counters["retries"] += 1
+                bucket = self._bucket(model)
+                bucket.cooldown_until = max(bucket.cooldown_until, self.clock() + delay)
+                if self.client is not None:
+                    try:
+                        self.client.eval(_COOLDOWN_SCRIPT, 1, f"{self.prefix}:{model}", time.time() + delay)
+                    except Exception as shared_error:
+                        self.counters["shared_errors"] += 1
+                        logging.warning(f"[RateGovernor] 공유 버킷에 쉬는 시간 기록 실패: {shared_error}")
+                logging.warning(f"[RateGovernor] {model} 한도 초과, {delay:.1f}초 뒤 재시도 ({attempt + 1}/{self.max_retries})")
+
+    async def admit(self, model: str, priority: Priority):
+        bucket = self._bucket(model)
+        reserve = bucket.capacity * self.reserve_ratio.get(priority, 0.0)
+        started = self.clock()
+        while True:
+            now = self.clock()
+            wait = self._take_shared(model, bucket, reserve + 1) if self.client is not None else None
+            if wait is None:  # 이 프로세스의 버킷 (공유 버킷이 없거나 Redis 오류)
+                bucket.refill(now)
+                if now >= bucket.cooldown_until and bucket.tokens >= reserve + 1:
+                    bucket.tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = bucket.time_until(reserve + 1, now)
+            if wait <= 0:
+                self.counters["admitted"] += 1
+                return
+            if now - started + wait > self.max_wait.get(priority, float("inf")):
+                self.counters["rejected"] += 1
+                raise AdmissionRejected(f"{model} ({priority.name}) 실행 허가 대기 시간 초과")
+            await self.sleep(max(wait, 0.01))
+
+    def stats(self) -> Dict:
+        now = self.clock()
+        buckets = {}
+        for model, bucket in self._buckets.items():
+            bucket.refill(now)
+            buckets[model] = {"tokens": round(bucket.tokens, 2), "cooldown": round(max(0.0, bucket.cooldown_until - now), 2)}
+        return {**self.counters, "buckets": buckets}
+
+    def _take_shared(self, model: str, bucket: TokenBucket, level: float) -> Optional[float]:
+        """공유 버킷에서 하나 꺼냅니다. 꺼냈으면 0, 아니면 기다릴 초. Redis 오류면 None. (시각은 프로세스 사이에 맞는 벽시계)"""
+        try:
+            return float(self.client.eval(_TAKE_SCRIPT, 1, f"{self.prefix}:{model}",
+                                          bucket.rate, bucket.capacity, level, time.time()))
+        except Exception as e:
+            self.counters["shared_errors"] += 1
+            logging.warning(f"[RateGovernor] 공유 버킷 사용 실패, 이 프로세스의 버킷으로 대신합니다: {e}")
+            return None
+
+    def _bucket(self, model: str) -> TokenBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = TokenBucket(self.limits.get(model, self.default_limit), self.clock())
+        return bucket
+
+
+# 한 프로세스 안의 모든 Gemini 호출(봇 응답, 요약, 임베딩)이 같은 조정자를 거치도록 공유 인스턴스를 둡니다.
+# 한도는 API 키 하나의 한도입니다. 봇과 백엔드(http 모드), 샤드 프로세스는 모두 아래 환경 변수를 읽습니다.
+#   GEMINI_RATE_LIMITS     모델별 "분당 요청 수/버스트"를 쉼표로 (예: "gemini-flash-latest=60/10,text-embedding-004=1500/50")
+#                          적지 않은 모델은 DEFAULT_LIMITS, 목록에도 없으면 DEFAULT_MODEL_LIMIT을 씁니다.
+#   GEMINI_RATE_REDIS_URL  주면 모든 프로세스가 Redis의 같은 버킷을 씁니다. (한도와 대화 응답 우선이 프로세스 사이에도 지켜짐)
+#   GEMINI_RATE_SHARE      Redis 없이 여러 프로세스를 띄울 때 이 프로세스가 쓸 몫 (0~1, 기본 1).
+#                          프로세스마다 버킷을 따로 두므로 몫의 합이 1을 넘지 않게 나눠 주세요. (예: 봇 0.6, 백엔드 0.4)
+DEFAULT_LIMITS = {
+    "gemini-flash-latest": RateLimit(requests_per_minute=60, burst=10),
+    "text-embedding-004": RateLimit(requests_per_minute=1500, burst=50),
+}
+DEFAULT_MODEL_LIMIT = RateLimit(requests_per_minute=60, burst=10)
+_governor: Optional[RateGovernor] = None
+
+
+def parse_limits(spec: Optional[str], share: float = 1.0) -> Dict[str, RateLimit]:
+    """GEMINI_RATE_LIMITS 형식을 읽어 DEFAULT_LIMITS 위에 덮고, 모든 한도에 `share`를 곱합니다. 형식이 틀리면 ValueError."""
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, value = item.partition("=")
+        rpm, _, burst = value.partition("/")
+        if not model.strip() or not rpm:
+            raise ValueError(f"GEMINI_RATE_LIMITS 항목 형식이 잘못되었습니다: '{item}' (모델=분당요청수/버스트)")
+        default = limits.get(model.strip(), DEFAULT_MODEL_LIMIT)
+        limits[model.strip()] = RateLimit(float(rpm), int(burst) if burst else default.burst)
+    return {model: scale_limit(limit, share) for model, limit in limits.items()}
+
+
+def scale_limit(limit: RateLimit, share: float) -> RateLimit:
+    return RateLimit(limit.requests_per_minute * share, max(1, round(limit.burst * share)))
+
+
+def get_governor() -> RateGovernor:
+    global _governor
+    if _governor is None:
+        client, share = None, float(os.getenv("GEMINI_RATE_SHARE", "1"))
+        if redis_url := os.getenv("GEMINI_RATE_REDIS_URL"):
+            import redis
+            client, share = redis.Redis.from_url(redis_url, socket_connect_timeout=2), 1.0  # 공유 버킷은 나누지 않음
+        _governor = RateGovernor(parse_limits(os.getenv("GEMINI_RATE_LIMITS"), share),
+                                 scale_limit(DEFAULT_MODEL_LIMIT, share), client=client)
+        logging.info(f"[RateGovernor] 한도 {dict(_governor.limits)} (몫 {share:g}, "
+                     f"{'Redis 공유 버킷' if client is not None else '프로세스별 버킷'})")
+    return _governor
+
+
+registry.collect("risu_rate_governor_events", "호출 조정자 누적 이벤트 수 (허가/버림/재시도/429)",
+                 lambda: get_governor().counters, "event")
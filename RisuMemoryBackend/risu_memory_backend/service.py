@@ -0,0 +1,247 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Optional
+
+from .gemini import get_genai
+from .memory import hypa_memory
+from .memory.consolidation import consolidate
+from .memory.hypa_memory import HypaV3Settings, get_collection, hypa_assemble, hypa_memory_v3, hypa_prepare
+from .memory.images import budget_images
+from .memory.speculative import PreparedContextCache
+from .memory.supa_memory import supa_memory
+from .metrics import REQUESTS, TOKENS, TURN_INPUT_TOKENS, registry, span
+from .tokenizer import count_chat_history_tokens, tokenizer
+
+# FastAPI 서버(main.py)와 봇의 in-process 모드가 함께 쓰는 메모리 처리 본체입니다.
+# HTTP 본문 해석과 검증은 main.py가 하고, 여기서는 이미 role/content/memo(와 image_tokens/caption) 형태인
+# 메시지 dict 목록만 받습니다. 같은 프로세스에서 부르면 토크나이저와 임베딩 캐시, 미리 준비한 컨텍스트를 함께 씁니다.
+
+DEFAULT_HYPA_SETTINGS = HypaV3Settings(
+    summarization_model='gemini-flash-latest', embedding_model='text-embedding-004',
+    summarization_prompt='[Summarize the ongoing role story, focusing on key events, character progression, and unresolved plot points.]',
+    memory_tokens_ratio=0.25, max_chats_per_summary=8,
+    recent_memory_ratio=0.3, similar_memory_ratio=0.5,
+)
+# 다음 턴 컨텍스트를 미리 준비할 때 새 메시지 몫으로 남겨 두는 토큰 수. 이만큼 여유가 있으면 준비하지 않습니다.
+PREPARE_HEADROOM_TOKENS = 512
+prepared_contexts = PreparedContextCache()
+registry.collect("risu_prepared_context", "다음 턴 컨텍스트 미리 준비 누적 수", prepared_contexts.stats, "kind")
+
+
+class MemoryServiceError(Exception):
+    """처리할 수 없는 요청이나 메모리 처리 실패. HTTP 모드에서는 `status_code`로 응답합니다."""
+
+    def __init__(self, detail: str, status_code: int = 500):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class ChatOptions:
+    """/process_chat/ 본문에서 messages를 뺀 설정. 기본값은 ProcessChatRequest와 같습니다."""
+    memory_type: str = "hypa"
+    max_context_tokens: int = 8192
+    character_name: str = "Risu"
+    hypa_settings: Optional[HypaV3Settings] = None
+    room_data: Dict = field(default_factory=dict)
+    conversation_id: Optional[str] = None
+    max_images: int = 3
+    image_token_ratio: float = 0.5
+
+    @classmethod
+    def from_payload(cls, payload: Dict) -> "ChatOptions":
+        """봇이 만든 본문 dict에서 아는 키만 골라 만듭니다. (messages 등 나머지는 무시)"""
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in payload.items() if key in names})
+
+
+def configure(db_path: Optional[str] = None):
+    """ChromaDB 폴더를 바꿉니다. 컬렉션을 처음 열기 전에 불러야 합니다. (in-process 모드는 작업 폴더가 다르므로)"""
+    if db_path:
+        hypa_memory.db_path = db_path
+
+
+async def warm_up():
+    """무거운 초기화(tiktoken 인코더, ChromaDB, Gemini 설정)를 스레드로 나눠 동시에 합니다. 실패하면 예외를 올립니다."""
+    await asyncio.gather(
+        asyncio.to_thread(lambda: tokenizer.encoding),
+        asyncio.to_thread(get_collection),
+        asyncio.to_thread(get_genai),
+    )
+
+
+def unsummarized_from(chats: List[Dict], idx: int) -> Optional[str]:
+    """`chats[idx:]`가 아직 장기기억에 요약되지 않은 부분일 때 그 첫 메시지의 memo. (idx가 0이면 None)
+
+    봇은 이 memo 앞의 기록만 단기기억 창에서 내보냅니다. 맥락 예산 때문에 잘랐을 뿐 요약하지 않은 메시지는
+    창에 남아 다음 요청에서 다시 요약 대상이 됩니다. 전부 요약됐으면 마지막 메시지 하나는 남깁니다.
+    """
+    if idx <= 0 or not chats:
+        return None
+    return chats[min(idx, len(chats) - 1)].get("memo")
+
+
+def apply_image_budget(options: ChatOptions, chats: List[Dict]) -> tuple:
+    """글을 요약하기 전에 오래된 이미지부터 뺍니다. (chats, 남은 이미지 토큰 합)을 돌려줍니다."""
+    with span("backend", "image_budget"):
+        chats, dropped, image_tokens = budget_images(
+            chats, options.max_images, int(options.max_context_tokens * options.image_token_ratio))
+    if dropped:
+        REQUESTS.inc(dropped, component="backend", outcome="image_dropped")
+    return chats, image_tokens
+
+
+async def process_chat(chats: List[Dict], options: ChatOptions) -> Dict:
+    """이미지 예산을 먼저 적용한 뒤 메모리를 처리하고, 응답에 이번 턴의 입력 토큰 추정치(글/이미지)를 붙입니다.
+
+    돌려주는 dict는 /process_chat/ 응답 본문과 같습니다. 맥락이 넘치지 않으면 받은 메시지 목록을 그대로 돌려줍니다.
+    `summarized_until`은 요약되지 않은 첫 메시지의 memo입니다. (`unsummarized_from` 참고, 요약한 것이 없으면 None)
+    """
+    chats, image_tokens = apply_image_budget(options, chats)
+    result = await process_memory(chats, options)
+    result["image_tokens"] = image_tokens
+    TURN_INPUT_TOKENS.observe(result["final_tokens"], component="backend", source="estimate")
+    if image_tokens:
+        TURN_INPUT_TOKENS.observe(image_tokens, component="backend", source="image_estimate")
+    return result
+
+
+async def process_memory(chats: List[Dict], options: ChatOptions) -> Dict:
+    # 긴 기록의 토큰 세기는 수 ms가 걸리므로 스레드에서 합니다. (tiktoken은 세는 동안 GIL을 놓음)
+    with span("backend", "tokenize"):
+        current_tokens = await asyncio.to_thread(count_chat_history_tokens, chats)
+    TOKENS.inc(current_tokens, component="backend", direction="in")
+
+    # 지난 턴이 끝난 뒤 미리 해 둔 요약/기억 선택이 있고 그 뒤로 메시지 하나만 붙었다면 그대로 씁니다.
+    # 맥락이 넘치지 않는 턴은 준비가 끝나기를 기다리지 않습니다.
+    prepared = None
+    summarized_until = 0
+    if options.memory_type == 'hypa' and options.conversation_id:
+        prepared = await prepared_contexts.take(options.conversation_id, chats, options.max_context_tokens,
+                                                wait=current_tokens > options.max_context_tokens)
+        if prepared is None:
+            # 준비 결과를 못 쓰더라도 그때 넣은 요약문이 덮는 앞부분은 다시 요약하지 않고 잘라냅니다.
+            summarized_until = prepared_contexts.summarized_until(options.conversation_id, chats)
+
+    if current_tokens <= options.max_context_tokens and not (prepared and prepared["start_idx"]) \
+            and not summarized_until:
+        REQUESTS.inc(component="backend", outcome="passthrough")
+        TOKENS.inc(current_tokens, component="backend", direction="out")
+        return {
+            "processed_messages": chats,
+            "final_tokens": current_tokens,
+            # updated_room_data는 이제 별 의미가 없지만, 봇과의 호환성을 위해 빈 객체를 보냅니다.
+            "updated_room_data": {},
+            "summarized_until": None,
+            "info": "Context window not exceeded, no memory processing needed."
+        }
+
+    if options.memory_type == 'supa':
+        # SupaMemory는 여전히 room_data를 사용합니다 (휘발성).
+        result = await supa_memory(
+            chats=chats, current_tokens=current_tokens, max_context_tokens=options.max_context_tokens,
+            room={"supaMemoryData": options.room_data.get("supaMemoryData")}, char={"name": options.character_name}
+        )
+        if result.get("error"):
+            REQUESTS.inc(component="backend", outcome="error")
+            raise MemoryServiceError(result["error"])
+        REQUESTS.inc(component="backend", outcome="supa")
+        TOKENS.inc(result["current_tokens"], component="backend", direction="out")
+        # SupaMemory는 앞에서부터 요약한 만큼 지우고 요약문(있으면)을 맨 앞에 넣을 뿐 자르지는 않습니다.
+        remaining = len(result["chats"]) - (1 if result.get("memory") else 0)
+        # SupaMemory는 여전히 room_data를 업데이트합니다.
+        return {
+            "processed_messages": result["chats"], "final_tokens": result["current_tokens"],
+            "updated_room_data": {"supaMemoryData": result.get("memory")},
+            "summarized_until": unsummarized_from(chats, len(chats) - remaining),
+            "info": f"SupaMemory processed. Last summarized message ID: {result.get('last_id')}"
+        }
+
+    elif options.memory_type == 'hypa':
+        # ChromaDB를 사용하므로 room_data를 전달할 필요가 없습니다.
+        hypa_settings = options.hypa_settings or DEFAULT_HYPA_SETTINGS
+        all_chats = chats
+        if prepared is not None:
+            result = await asyncio.to_thread(hypa_assemble, chats, prepared, options.max_context_tokens)
+        else:
+            if summarized_until:
+                chats = chats[summarized_until:]
+                current_tokens = await asyncio.to_thread(count_chat_history_tokens, chats)
+            result = await hypa_memory_v3(
+                chats=chats, current_tokens=current_tokens, max_context_tokens=options.max_context_tokens,
+                room={"conversation_id": options.conversation_id}, settings=hypa_settings
+            )
+        if result.get("error"):
+            REQUESTS.inc(component="backend", outcome="error")
+            raise MemoryServiceError(result["error"])
+        REQUESTS.inc(component="backend", outcome="hypa")
+        TOKENS.inc(result["current_tokens"], component="backend", direction="out")
+        if result.get("summarized") and options.conversation_id:
+            schedule_consolidation(options.conversation_id, hypa_settings)
+
+        # HypaMemory는 더 이상 room_data를 반환하지 않습니다.
+        return {
+            "processed_messages": result["chats"], "final_tokens": result["current_tokens"],
+            "updated_room_data": {},  # 빈 객체 반환
+            "summarized_until": unsummarized_from(all_chats, summarized_until + result["start_idx"]),
+            "info": "HypaMemory (ChromaDB) processed."
+        }
+    else:
+        raise MemoryServiceError("Invalid memory_type specified.", status_code=400)
+
+
+def prepare_context(chats: List[Dict], options: ChatOptions) -> Dict:
+    """다음 턴에 할 요약과 기억 선택을 백그라운드로 띄우고 바로 돌아갑니다. (HypaMemory만 해당)"""
+    if options.memory_type != 'hypa' or not options.conversation_id:
+        raise MemoryServiceError("Only hypa requests with a conversation_id can be prepared.", status_code=422)
+    chats, _ = apply_image_budget(options, chats)
+    current_tokens = count_chat_history_tokens(chats)
+    summarize_above = options.max_context_tokens - PREPARE_HEADROOM_TOKENS
+    if current_tokens <= summarize_above:
+        return {"status": "not_needed", "tokens": current_tokens}
+    settings = options.hypa_settings or DEFAULT_HYPA_SETTINGS
+
+    async def prepare():
+        # 앞선 준비가 이미 요약한 부분은 빼고 합니다. (앞선 준비가 끝난 뒤에 불리므로 그 경계가 반영돼 있음)
+        skip = prepared_contexts.summarized_until(options.conversation_id, chats)
+        rest = chats[skip:]
+        prepared = await hypa_prepare(rest, count_chat_history_tokens(rest) if skip else current_tokens,
+                                      options.max_context_tokens, {"conversation_id": options.conversation_id},
+                                      settings, summarize_above=summarize_above)
+        if prepared["summarized"]:
+            schedule_consolidation(options.conversation_id, settings)
+        return {**prepared, "start_idx": skip + prepared["start_idx"]}
+
+    scheduled = prepared_contexts.schedule(options.conversation_id, chats, options.max_context_tokens, prepare)
+    return {"status": "scheduled" if scheduled else "duplicate", "tokens": current_tokens}
+
+
+# --- 요약문 정리 (Consolidation) ---
+# 새 요약문이 생긴 대화는 백그라운드에서 오래된 요약문을 합쳐 대화당 요약문 수를 일정하게 유지합니다.
+_consolidation_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def run_consolidation(conversation_id: str, settings: HypaV3Settings) -> Dict:
+    try:
+        return await consolidate(conversation_id, settings)
+    except Exception as e:
+        logging.error(f"요약문 정리 실패 ({conversation_id}): {e}")
+        return {"conversation_id": conversation_id, "error": str(e)}
+
+
+def schedule_consolidation(conversation_id: str, settings: HypaV3Settings):
+    """대화의 요약문 정리를 띄웁니다. 그 대화의 정리가 이미 돌고 있으면 새로 띄우지 않습니다."""
+    task = _consolidation_tasks.get(conversation_id)
+    if task is not None and not task.done():
+        return
+    _consolidation_tasks[conversation_id] = asyncio.create_task(run_consolidation(conversation_id, settings))
+
+
+async def consolidate_now(conversation_id: str) -> Dict:
+    """대화 하나의 요약문 정리를 바로 실행합니다. 이미 돌고 있으면 그 결과를 기다립니다."""
+    task = _consolidation_tasks.get(conversation_id)
+    if task is not None and not task.done():
+        return await task
+    return await run_consolidation(conversation_id, DEFAULT_HYPA_SETTINGS)
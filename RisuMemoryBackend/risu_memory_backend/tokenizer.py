@@ -1,12 +1,23 @@
 import tiktoken
 from typing import List, Dict
 
+# 메시지에 붙는 이미지 정보. 본문이 아니므로 글자 토큰으로 세지 않습니다. (memory/images.py 참고)
+IMAGE_FIELDS = ("image_tokens", "caption", "image_dropped")
+
 class Tokenizer:
     def __init__(self, model_name: str = "gpt-4"):
-        try:
-            self.encoding = tiktoken.encoding_for_model(model_name)
-        except KeyError:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.model_name = model_name
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        # 인코더 로딩(BPE 파일 읽기)은 수백 ms가 걸리므로 처음 쓸 때 합니다. 서버는 시작 단계(lifespan)에서 미리 불러 둡니다.
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model_name)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        return self._encoding
 
     def encode(self, text: str) -> List[int]:
         return self.encoding.encode(text)
@@ -23,11 +34,14 @@ class Tokenizer:
         """
         num_tokens = 4
         for key, value in message.items():
+            if key in IMAGE_FIELDS:
+                continue
             if value:
                 num_tokens += self.count_tokens(value)
             if key == "name":
                 num_tokens -= 1
-        return num_tokens
+        # 이미지는 글자가 아니라 봇이 크기로 추정해 보낸 토큰 수(image_tokens)로 셉니다.
+        return num_tokens + (message.get("image_tokens") or 0)
 
     def count_chat_history_tokens(self, messages: List[Dict[str, str]]) -> int:
         """
@@ -39,7 +53,7 @@ class Tokenizer:
         num_tokens += 3
         return num_tokens
 
-# Global tokenizer instance for easy import
+# Global tokenizer instance for easy import (백엔드 전체가 이 인스턴스 하나를 공유합니다)
 tokenizer = Tokenizer()
 
 def count_tokens(text: str) -> int:
@@ -0,0 +1,67 @@
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # msgpack이 없으면 JSON만 씁니다.
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # orjson이 없으면 표준 json을 씁니다.
+    orjson = None
+
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+GZIP_MIN_BYTES = 64 * 1024  # 이보다 작은 본문은 압축해도 이득이 적습니다.
+
+
+def available_formats() -> Tuple[str, ...]:
+    return (MSGPACK, JSON) if msgpack else (JSON,)
+
+
+def choose_format(preference: str = "auto") -> str:
+    """'auto'면 msgpack(설치돼 있을 때), 아니면 JSON. 'json'/'msgpack'으로 고정할 수 있습니다."""
+    if preference == "json" or msgpack is None:
+        return JSON
+    return MSGPACK
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Accept 헤더에 msgpack이 있고 처리할 수 있으면 msgpack, 아니면 JSON으로 응답합니다."""
+    if accept and msgpack and MSGPACK in accept:
+        return MSGPACK
+    return JSON
+
+
+def encode(payload: Any, content_type: str) -> bytes:
+    if content_type == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    if orjson:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(body: bytes, content_type: Optional[str]) -> Any:
+    if content_type and content_type.split(";")[0].strip() == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack 본문을 받았지만 msgpack이 설치되어 있지 않습니다.")
+        return msgpack.unpackb(body, raw=False)
+    return orjson.loads(body) if orjson else json.loads(body)
+
+
+def encode_body(payload: Any, content_type: str, gzip_min_bytes: int = GZIP_MIN_BYTES) -> Tuple[bytes, Dict[str, str]]:
+    """본문과 헤더를 만듭니다. `gzip_min_bytes`(0이면 끔)보다 크면 gzip으로 압축합니다."""
+    body = encode(payload, content_type)
+    headers = {"Content-Type": content_type, "Accept": ", ".join(available_formats())}
+    if gzip_min_bytes and len(body) >= gzip_min_bytes:
+        body = gzip.compress(body, compresslevel=1)  # 속도 우선 (대화 텍스트는 1단계로도 충분히 줄어듭니다)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def decode_body(body: bytes, content_type: Optional[str], content_encoding: Optional[str] = None) -> Any:
+    if content_encoding and content_encoding.strip().lower() == "gzip":
+        body = gzip.decompress(body)
+    return decode(body, content_type)
@@ -0,0 +1,176 @@
+# bot/answer_cache.py
+import hashlib
+import math
+import re
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+NON_WORD = re.compile(r"[^0-9a-z가-힣ㄱ-ㅎ]+")
+HAS_DIGIT = re.compile(r"[0-9]")
+VECTOR_DIM = 1 << 12  # 글자 3-그램을 이 크기로 해시합니다. (짧은 질문끼리는 충돌이 거의 없음)
+
+ToolCall = Tuple[str, Dict]  # (도구 이름, 인자)
+
+
+@dataclass
+class ToolPolicy:
+    ttl_seconds: float  # 이 도구를 쓴 답을 보관하는 시간. 0이면 이 도구를 쓴 답은 보관하지 않습니다.
+    revalidate: bool = False  # 꺼낼 때 도구를 같은 인자로 다시 불러 결과가 같을 때만 씁니다. (LLM 호출보다 훨씬 쌈)
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    vector: Dict[int, float]
+    tool_calls: List[ToolCall]
+    fingerprint: str
+    answer: str
+    expires_at: float
+    revalidate: bool
+    cost_seconds: float  # 처음 답할 때 걸린 시간 (적중 시 아낀 시간 계산용)
+    hits: int = 0
+    numbers: FrozenSet[str] = frozenset()  # 질문에서 숫자가 든 낱말 (s24, 2025, 3시 ...)
+    anchors: FrozenSet[str] = frozenset()  # 질문에 그대로 나온 도구 인자 낱말 (seoul, 롤 패치노트 ...)
+
+
+def normalize_question(text: str, strip_keywords: Optional[Callable[[str], str]] = None) -> str:
+    """소문자로 바꾸고, 부르는 말과 문장 부호/이모지를 지우고, 공백을 하나로 줄입니다."""
+    text = text.lower()
+    if strip_keywords:
+        text = strip_keywords(text)
+    return " ".join(NON_WORD.sub(" ", text).split())
+
+
+def trigram_vector(text: str) -> Dict[int, float]:
+    """글자 3-그램을 해시해 센 단위 벡터. 임베딩 API를 부르지 않고 로컬에서 바로 만듭니다."""
+    padded = f" {text} "
+    counts = Counter(zlib.crc32(padded[i:i + 3].encode("utf-8")) % VECTOR_DIM for i in range(len(padded) - 2))
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+def number_tokens(question: str) -> FrozenSet[str]:
+    """정규화한 질문에서 숫자가 든 낱말. 3-그램 유사도는 s24/s25처럼 한 글자 다른 모델명/날짜를 거의 구분하지 못합니다."""
+    return frozenset(word for word in question.split() if HAS_DIGIT.search(word))
+
+
+def argument_anchors(question: str, tool_calls: List[ToolCall]) -> FrozenSet[str]:
+    """도구 인자 값의 낱말 중 질문에 그대로 나온 것. (도시 이름, 검색어 등)
+
+    모델이 인자를 번역했으면(서울 -> Seoul) 질문에 없으므로 빠집니다. 조사가 붙어도(서울은) 찾도록 부분 문자열로 봅니다.
+    """
+    words = {word for _, args in tool_calls for value in args.values() if isinstance(value, str)
+             for word in normalize_question(value).split() if len(word) >= 2}
+    return frozenset(word for word in words if word in question)
+
+
+def same_entities(question: str, entry: CachedAnswer) -> bool:
+    """비슷한 질문이라도 숫자 낱말이 다르거나, 보관할 때 질문에 나왔던 도구 인자가 새 질문에 없으면 다른 질문입니다.
+
+    다시 확인(revalidate)은 보관된 인자로 도구를 부르므로 이런 경우(서울 날씨를 부산에 답함)를 잡지 못합니다.
+    """
+    return number_tokens(question) == entry.numbers and all(anchor in question for anchor in entry.anchors)
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def fingerprint(results: List[str]) -> str:
+    return hashlib.sha1("\x1f".join(map(str, results)).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """도구를 써서 답한 질문의 최종 답을 범위(scope)별로 보관해, 거의 같은 질문에는 LLM을 부르지 않고 답합니다.
+
+    - 범위는 부르는 쪽이 정합니다. 봇은 서버/채널/페르소나를 묶어 써서 다른 서버나 채널의 답이 섞이지 않게 합니다.
+      범위가 `max_scopes`를 넘으면 가장 오래 보관하지 않은 범위부터 버립니다.
+    - 키는 정규화한 질문의 글자 3-그램 벡터와 도구 결과의 지문입니다. 유사도가 `threshold` 이상이면 같은 질문으로 봅니다.
+    - 유사도를 넘어도 숫자 낱말과 질문에 나온 도구 인자가 같아야 합니다. (`same_entities`)
+    - 보관 시간은 답에 쓰인 도구 중 가장 짧은 TTL을 따르고, TTL이 0이거나 정책이 없는 도구를 쓴 답은 보관하지 않습니다.
+    - `revalidate` 도구는 꺼낼 때 같은 인자로 도구를 다시 불러 결과 지문이 같을 때만 적중으로 칩니다.
+    """
+
+    def __init__(self, policies: Mapping[str, ToolPolicy], threshold: float = 0.88, max_entries: int = 256,
+                 min_length: int = 3, clock: Callable[[], float] = time.monotonic, max_scopes: int = 1024):
+        self.policies = dict(policies)
+        self.threshold = threshold
+        self.max_entries = max_entries  # 범위별
+        self.max_scopes = max_scopes
+        self.min_length = min_length
+        self.clock = clock
+        self._entries: Dict[str, List[CachedAnswer]] = {}
+        self.counters: Dict[str, int] = {"lookups": 0, "hits": 0, "misses": 0, "stale": 0, "stored": 0,
+                                         "not_cacheable": 0, "entity_mismatch": 0}
+        self.saved_seconds = 0.0
+
+    def lookup(self, scope: str, question: str) -> Optional[CachedAnswer]:
+        """가장 비슷한 보관된 답을 찾습니다. 적중 여부는 (다시 확인이 필요하면 확인한 뒤) `record_hit`/`record_miss`로 알려 주세요."""
+        self.counters["lookups"] += 1
+        if len(question) < self.min_length:
+            return None
+        now, vector = self.clock(), trigram_vector(question)
+        entries = self._entries.get(scope, [])
+        entries[:] = [e for e in entries if e.expires_at > now]
+        best, best_score = None, self.threshold
+        for entry in entries:
+            score = cosine(vector, entry.vector)
+            if score < best_score:
+                continue
+            if not same_entities(question, entry):
+                self.counters["entity_mismatch"] += 1
+                continue
+            best, best_score = entry, score
+        return best
+
+    def verify(self, entry: CachedAnswer, results: List[str]) -> bool:
+        """다시 부른 도구 결과가 보관할 때와 같은지. 다르면 그 답을 버립니다."""
+        if fingerprint(results) == entry.fingerprint:
+            return True
+        self.counters["stale"] += 1
+        for entries in self._entries.values():
+            if entry in entries:
+                entries.remove(entry)
+        return False
+
+    def record_hit(self, entry: CachedAnswer, lookup_seconds: float):
+        entry.hits += 1
+        self.counters["hits"] += 1
+        self.saved_seconds += max(0.0, entry.cost_seconds - lookup_seconds)
+
+    def record_miss(self):
+        self.counters["misses"] += 1
+
+    def put(self, scope: str, question: str, tool_calls: List[Tuple[str, Dict, str]], answer: str,
+            cost_seconds: float) -> bool:
+        """`tool_calls`는 (도구 이름, 인자, 결과) 목록입니다. 보관했으면 True."""
+        policies = [self.policies.get(name) for name, _, _ in tool_calls]
+        if not tool_calls or not answer or len(question) < self.min_length \
+                or any(p is None or p.ttl_seconds <= 0 for p in policies):
+            self.counters["not_cacheable"] += 1
+            return False
+        entries = self._entries.pop(scope, [])
+        self._entries[scope] = entries  # 마지막에 보관한 범위를 맨 뒤로
+        while len(self._entries) > self.max_scopes:
+            del self._entries[next(iter(self._entries))]
+        calls = [(name, dict(args)) for name, args, _ in tool_calls]
+        entries.append(CachedAnswer(
+            question, trigram_vector(question), calls, fingerprint([result for _, _, result in tool_calls]), answer,
+            self.clock() + min(p.ttl_seconds for p in policies), any(p.revalidate for p in policies), cost_seconds,
+            numbers=number_tokens(question), anchors=argument_anchors(question, calls)))
+        if len(entries) > self.max_entries:
+            entries.sort(key=lambda e: e.expires_at)  # 곧 만료될 것부터 버립니다.
+            del entries[:len(entries) - self.max_entries]
+        self.counters["stored"] += 1
+        return True
+
+    def stats(self) -> Dict:
+        decided = self.counters["hits"] + self.counters["misses"]
+        return {**self.counters, "entries": sum(map(len, self._entries.values())),
+                "hit_rate": round(self.counters["hits"] / decided, 3) if decided else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2)}
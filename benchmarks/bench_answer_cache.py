@@ -0,0 +1,127 @@
+# benchmarks/bench_answer_cache.py
+"""답변 캐시의 유사도 기준별 적중률, 잘못된 적중, 아낀 시간을 잽니다.
+
+실제 서버에서 봇을 부르는 메시지처럼 같은 질문을 여러 말투로 묻는 흐름을 만들고, 질문마다 의도(도시별 날씨/검색어/업타임/잡담)를
+붙여 둡니다. 캐시가 다른 의도의 답을 돌려주면 '잘못된 적중'입니다.
+캐시를 놓친 턴의 비용은 백엔드 + Gemini 두 번 + 도구 호출 시간(아래 상수)으로, 적중한 턴의 비용은 실제 조회 시간과
+(다시 확인하는 도구라면) 도구 호출 시간으로 계산합니다. 날씨 결과는 30분마다 바뀐다고 가정합니다.
+
+사용법: python benchmarks/bench_answer_cache.py [메시지 수] [--thresholds 0.8 0.88 0.95]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from answer_cache import AnswerCache, ToolPolicy, normalize_question  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+
+KEYWORDS = {"제비야", "제비", "야제비야", "제비님"}
+BACKEND_S, GEMINI_S = 0.12, 0.9
+TOOL_S = {"get_weather": 0.25, "search_web": 0.6, "get_uptime": 0.0}
+POLICIES = {"get_weather": ToolPolicy(30 * 60, True), "search_web": ToolPolicy(3600, True), "get_uptime": ToolPolicy(0)}
+
+# (의도, 도구, 인자, 말투들)
+INTENTS = [
+    ("weather:seoul", "get_weather", {"city": "Seoul"},
+     ["제비야 날씨 어때", "날씨 어때 제비야?", "제비야 오늘 날씨 어때?", "제비 날씨 어때!!", "제비야 서울 날씨 어때"]),
+    ("weather:busan", "get_weather", {"city": "Busan"},
+     ["제비야 부산 날씨 어때", "부산 날씨 어때 제비야", "제비야 부산 날씨 알려줘"]),
+    ("uptime", "get_uptime", {}, ["제비야 업타임", "제비야 얼마나 켜져 있었어?", "업타임 알려줘 제비"]),
+    ("search:patch", "search_web", {"query": "롤 패치노트"},
+     ["제비야 롤 패치노트 검색해줘", "제비야 롤 패치노트 찾아줘", "롤 패치노트 검색 좀 제비야"]),
+    ("search:movie", "search_web", {"query": "이번주 개봉 영화"},
+     ["제비야 이번주 개봉 영화 검색해줘", "제비야 이번주 개봉 영화 뭐 있어"]),
+    # 한 낱말(도시, 모델 번호)만 다른 긴 질문. 3-그램 유사도만으로는 같은 질문으로 봅니다.
+    ("weather:seoul:en", "get_weather", {"city": "Seoul"},
+     ["제비야 can you tell me what the weather in seoul is like right now", "제비야 what is the weather in seoul like now"]),
+    ("weather:busan:en", "get_weather", {"city": "Busan"},
+     ["제비야 can you tell me what the weather in busan is like right now", "제비야 what is the weather in busan like now"]),
+    ("search:s24", "search_web", {"query": "galaxy s24 release date"},
+     ["제비야 any news about the samsung galaxy s24 release date", "제비야 any news on the galaxy s24 release date"]),
+    ("search:s25", "search_web", {"query": "galaxy s25 release date"},
+     ["제비야 any news about the samsung galaxy s25 release date", "제비야 any news on the galaxy s25 release date"]),
+]
+CHATTER = ["제비야 뭐해", "제비야 심심해", "제비야 나 오늘 시험 망했어", "제비님 안녕", "제비야 배고파"]
+
+
+def make_stream(n: int, seed: int = 0):
+    """(시각(초), 의도, 도구, 인자, 질문). 봇을 부르는 메시지가 평균 20초마다 하나씩 온다고 봅니다."""
+    rng = random.Random(seed)
+    now, stream = 0.0, []
+    for _ in range(n):
+        now += rng.expovariate(1 / 20)
+        if rng.random() < 0.3:
+            stream.append((now, "chatter", None, None, rng.choice(CHATTER)))
+        else:
+            intent, tool, args, phrasings = rng.choice(INTENTS)
+            stream.append((now, intent, tool, args, rng.choice(phrasings)))
+    return stream
+
+
+def tool_result(tool: str, args: dict, now: float) -> str:
+    if tool == "get_weather":
+        return f"{args['city']} 맑음 {int(now // 1800) % 7 + 18}도"  # 30분마다 바뀜
+    if tool == "get_uptime":
+        return f"{int(now)}초"
+    return f"{args['query']} 검색 결과"
+
+
+def simulate(stream, threshold: float) -> dict:
+    clock = [0.0]
+    cache = AnswerCache(POLICIES, threshold, clock=lambda: clock[0])
+    matcher = KeywordMatcher(KEYWORDS)
+    answers = {}  # 저장된 답 -> 의도
+    baseline_s = spent_s = 0.0
+    wrong = 0
+    for now, intent, tool, args, text in stream:
+        clock[0] = now
+        miss_cost = BACKEND_S + GEMINI_S + (GEMINI_S + TOOL_S[tool] if tool else 0.0)
+        baseline_s += miss_cost
+        question = normalize_question(text, matcher.remove)
+
+        started = time.perf_counter()
+        entry = cache.lookup("인외", question)
+        hit_cost = 0.0
+        if entry is not None and entry.revalidate:
+            hit_cost += sum(TOOL_S[name] for name, _ in entry.tool_calls)
+            if not cache.verify(entry, [tool_result(name, a, now) for name, a in entry.tool_calls]):
+                entry = None
+        hit_cost += time.perf_counter() - started
+        if entry is not None:
+            cache.record_hit(entry, hit_cost)
+            spent_s += hit_cost
+            wrong += answers[entry.answer] != intent
+            continue
+        cache.record_miss()
+        spent_s += miss_cost + hit_cost
+        if tool:
+            answer = f"[{intent}] {tool_result(tool, args, now)} @{now:.0f}"
+            answers[answer] = intent
+            cache.put("인외", question, [(tool, args, tool_result(tool, args, now))], answer, miss_cost)
+    stats = cache.stats()
+    return {"hit_rate": stats["hit_rate"], "hits": stats["hits"], "wrong": wrong, "stale": stats["stale"],
+            "baseline_s": baseline_s, "spent_s": spent_s}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("messages", type=int, nargs="?", default=5000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.88, 0.95])
+    args = parser.parse_args()
+
+    stream = make_stream(args.messages)
+    print(f"봇 호출 {len(stream)}건 (약 {stream[-1][0] / 3600:.1f}시간)")
+    print(f"{'threshold':>9} {'hit rate':>9} {'hits':>6} {'wrong':>6} {'stale':>6} "
+          f"{'no cache s':>11} {'with cache s':>13} {'saved/turn ms':>14}")
+    for threshold in args.thresholds:
+        r = simulate(stream, threshold)
+        saved_ms = (r["baseline_s"] - r["spent_s"]) / len(stream) * 1000
+        print(f"{threshold:>9.2f} {r['hit_rate']:>9.3f} {r['hits']:>6} {r['wrong']:>6} {r['stale']:>6} "
+              f"{r['baseline_s']:>11.0f} {r['spent_s']:>13.0f} {saved_ms:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
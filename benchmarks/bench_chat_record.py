@@ -0,0 +1,48 @@
+# benchmarks/bench_chat_record.py
+"""단기기억 기록 한 건당 메모리 사용량을 dict 방식과 ChatRecord 방식으로 비교합니다.
+
+사용법: python benchmarks/bench_chat_record.py [메시지 수]
+"""
+import os
+import sys
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_history import ChatRecord  # noqa: E402
+
+
+def make_contents(n: int):
+    # 내용 문자열은 두 방식이 똑같이 공유하므로 측정에서 제외합니다.
+    return [f"제비야 {i}번째 메시지야" for i in range(n)]
+
+
+def measure(build, n: int) -> float:
+    contents = make_contents(n)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = build(contents)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert len(records) == n
+    return used / n
+
+
+def build_dicts(contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": c, "memo": str(uuid.uuid4())}
+            for i, c in enumerate(contents)]
+
+
+def build_records(contents):
+    return [ChatRecord.new("user" if i % 2 == 0 else "assistant", c) for i, c in enumerate(contents)]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    dict_bytes = measure(build_dicts, n)
+    record_bytes = measure(build_records, n)
+    print(f"messages: {n}")
+    print(f"dict       : {dict_bytes:8.1f} bytes/message")
+    print(f"ChatRecord : {record_bytes:8.1f} bytes/message")
+    print(f"saved      : {dict_bytes - record_bytes:8.1f} bytes/message ({(1 - record_bytes / dict_bytes) * 100:.1f}%)")
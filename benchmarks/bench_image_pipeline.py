@@ -0,0 +1,63 @@
+# benchmarks/bench_image_pipeline.py
+"""이미지 전처리 전후의 Gemini 전송 크기, Redis 저장 크기, 처리 시간을 비교합니다.
+
+폰 사진과 비슷한 크기(4032x3024 등)의 합성 이미지를 만들어 측정합니다. Pillow가 필요합니다.
+사용법: python benchmarks/bench_image_pipeline.py [max_edge] [format]
+"""
+import asyncio
+import base64
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+from image_pipeline import preprocess_image, content_key  # noqa: E402
+
+SIZES = [(4032, 3024), (3024, 4032), (1920, 1080), (1170, 2532), (800, 600)]
+
+
+def make_photo(size, seed: int) -> bytes:
+    """노이즈와 도형을 섞어 JPEG 압축이 잘 안 되는 사진 같은 이미지를 만듭니다."""
+    rng = random.Random(seed)
+    image = Image.effect_noise(size, 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(20, max(size) // 4)
+        draw.ellipse((x - r, y - r, x + r, y + r),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+async def main(max_edge: int, image_format: str):
+    print(f"max_edge={max_edge}, format={image_format}")
+    print(f"{'size':>11} {'original':>10} {'processed':>10} {'b64 before':>11} {'b64 after':>10} {'time':>8}")
+    total_before = total_after = 0
+    for i, size in enumerate(SIZES):
+        data = make_photo(size, i)
+        started = time.perf_counter()
+        processed = await preprocess_image(data, "image/jpeg", max_edge, image_format)
+        elapsed = time.perf_counter() - started
+        # 예전에는 base64 문자열을 Redis에 저장하고 원본 바이트를 Gemini에 보냈습니다.
+        before, after = len(base64.b64encode(data)), len(processed.data)
+        total_before += before
+        total_after += after
+        print(f"{size[0]:>5}x{size[1]:<5} {len(data):>10} {len(processed.data):>10} {before:>11} {after:>10} "
+              f"{elapsed * 1000:>6.0f}ms")
+    print(f"Redis 저장량: {total_before} -> {total_after} bytes ({(1 - total_after / total_before) * 100:.1f}% 감소)")
+
+    data = make_photo(SIZES[0], 0)
+    started = time.perf_counter()
+    for _ in range(20):
+        content_key(data)
+    print(f"중복 검사용 해시: {(time.perf_counter() - started) / 20 * 1000:.2f}ms/image ({len(data)} bytes)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1536, sys.argv[2] if len(sys.argv) > 2 else "WEBP"))
@@ -0,0 +1,57 @@
+# benchmarks/bench_keyword_matcher.py
+"""should_respond 키워드 검사 방식별 속도를 비교합니다.
+
+- naive      : 예전 방식. 키워드마다 `keyword in content`를 따로 검사
+- per_regex  : 키워드마다 경계 정규식을 따로 검사
+- matcher    : KeywordMatcher (정규식 하나로 한 번에 검사)
+
+사용법: python benchmarks/bench_keyword_matcher.py [메시지 수] [추가 키워드 수]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import JEBI_KEYWORDS  # noqa: E402
+from keyword_matcher import KeywordMatcher, KEYWORD_PARTICLES_PATTERN, WORD_CHAR  # noqa: E402
+
+FILLER = ["ㅋㅋㅋㅋ", "오늘 점심 뭐 먹지", "아 롤 한판 할 사람", "그거 진짜임?", "ㄹㅇ", "퇴근하고 싶다",
+          "내일 비 온다던데", "제비꽃 사진 올려봄", "강남제비 노래 좋더라", "lol that's wild",
+          "어제 본 영화 개꿀잼", "숙제 다 했냐", "배고파", "이번 패치 너프 심하네", "ㅇㅇ 나도"]
+CALLS = ["제비야 날씨 어때", "야제비야 업타임", "제비한테 물어보자", "제비 뭐해?", "제비님 검색 좀"]
+
+
+def make_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        # 실제 서버처럼 봇을 부르는 메시지는 5% 정도입니다.
+        if rng.random() < 0.05:
+            corpus.append(rng.choice(CALLS))
+        else:
+            corpus.append(" ".join(rng.choice(FILLER) for _ in range(rng.randint(1, 4))))
+    return corpus
+
+
+def run(name, fn, corpus):
+    started = time.perf_counter()
+    hits = sum(1 for text in corpus if fn(text.lower()))
+    elapsed = time.perf_counter() - started
+    print(f"{name:10}: {elapsed / len(corpus) * 1e6:7.2f} us/message  (hits {hits})")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    extra = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    keywords = {k.lower() for k in JEBI_KEYWORDS} | {f"봇{i}호" for i in range(extra)}
+    corpus = make_corpus(n)
+    print(f"messages: {n}, keywords: {len(keywords)}")
+
+    run("naive", lambda t: any(k in t for k in keywords), corpus)
+    patterns = [re.compile(rf"(?<!{WORD_CHAR}){re.escape(k)}{KEYWORD_PARTICLES_PATTERN}(?!{WORD_CHAR})")
+                for k in keywords]
+    run("per_regex", lambda t: any(p.search(t) for p in patterns), corpus)
+    matcher = KeywordMatcher(keywords)
+    run("matcher", lambda t: matcher.search(t) is not None, corpus)
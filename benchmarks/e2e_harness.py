@@ -0,0 +1,313 @@
+# benchmarks/e2e_harness.py
+"""on_message → process_chat_message 전체 경로의 지연 시간을 재는 하네스.
+
+실제 discord_bot 모듈을 그대로 불러와 다음만 로컬 대역으로 바꿉니다.
+- Discord: 가짜 메시지/채널/첨부 파일 객체 (이미지 첨부 포함)
+- Gemini: 고정 지연으로 답하는 가짜 모델. 날씨/업타임을 묻는 메시지에는 함수 호출을 먼저 돌려줍니다.
+- 메모리 백엔드: RisuMemoryBackend FastAPI 앱을 httpx ASGITransport로 같은 프로세스에서 호출
+  (요약/임베딩(요약문 정리에 쓰는 일괄 임베딩 포함)은 가짜, ChromaDB는 메모리 전용)
+- 이미지 캡션: 고정 지연으로 답하는 가짜 (실제 Gemini를 부르지 않음)
+- Redis: fakeredis
+- Gemini 호출 한도(RateGovernor): 기본으로 한도 없는 조정자로 바꿉니다. 가짜 Gemini에 실제 한도(분당 60회)를 걸면
+  메시지 경로가 아니라 한도 대기를 재게 되기 때문입니다. 한도까지 함께 재려면 --governed.
+
+대화 모양(shape) 파일을 주면 그대로 재생하고, 없으면 합성 대화를 만듭니다. 모양 파일 형식:
+    [{"user": "u1", "turns": [{"chars": 40, "image": false, "tool": null, "gap": 0.5}, ...]}, ...]
+
+사용법: python benchmarks/e2e_harness.py [--users 20] [--turns 30] [--concurrency 10]
+                                       [--gemini-delay 0.3] [--governed] [--shapes shapes.json] [--json out.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 봇과 백엔드가 만드는 파일(bot_data, risu_memory_db 등)은 임시 폴더에 생기도록 합니다.
+ORIGINAL_CWD = os.getcwd()
+WORK_DIR = tempfile.mkdtemp(prefix="e2e_harness_")
+os.chdir(WORK_DIR)
+
+import fakeredis  # noqa: E402
+import httpx  # noqa: E402
+import chromadb  # noqa: E402
+
+import discord_bot  # noqa: E402
+import main as backend_main  # noqa: E402  (RisuMemoryBackend/main.py, config.py가 sys.path에 추가함)
+from risu_memory_backend import rate_governor  # noqa: E402
+from risu_memory_backend.memory import hypa_memory  # noqa: E402
+from blob_store import RedisTier  # noqa: E402
+from config import IMAGE_TTL_SECONDS  # noqa: E402
+
+STAGES = ("gate", "image", "backend", "gemini", "save", "total")
+timings = defaultdict(list)
+
+
+@contextlib.contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage].append(time.perf_counter() - started)
+
+
+# ----- 가짜 Discord 객체 -----
+class FakeAttachment:
+    def __init__(self, data: bytes, content_type: str = "image/jpeg"):
+        self._data, self.content_type = data, content_type
+
+    async def read(self) -> bytes:
+        return self._data
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, text: str):
+        self.sent.append(text)
+
+    @contextlib.asynccontextmanager
+    async def typing(self):
+        yield
+
+
+def make_message(user: SimpleNamespace, channel: FakeChannel, content: str, attachments=()):
+    return SimpleNamespace(author=user, content=content, attachments=list(attachments), channel=channel,
+                           guild=SimpleNamespace(id=1), mentions=[], reference=None)
+
+
+# ----- 가짜 Gemini -----
+def _response(text: str = None, function_call: SimpleNamespace = None):
+    part = SimpleNamespace(text=text or "", function_call=function_call)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))], text=text or "",
+                           usage_metadata=None)
+
+
+class StubChatSession:
+    def __init__(self, delay: float, history):
+        self.delay = delay
+        self.history = list(history)
+
+    async def send_message_async(self, content):
+        await asyncio.sleep(self.delay)
+        self.history.append(content)
+        text = " ".join(getattr(p, "text", "") or "" for p in content) if isinstance(content, list) else ""
+        if "날씨" in text:
+            return _response(function_call=SimpleNamespace(name="get_weather", args={"city": "Seoul"}))
+        if "업타임" in text:
+            return _response(function_call=SimpleNamespace(name="get_uptime", args={}))
+        return _response(text="알았어")
+
+
+class StubModel:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def start_chat(self, history=None):
+        return StubChatSession(self.delay, history or [])
+
+
+class StubModelPool:
+    def __init__(self, delay: float):
+        self.model = StubModel(delay)
+        self.instruction_tokens = {}
+
+    def get(self, persona, model_name, toolset="default"):
+        return self.model
+
+    async def warm(self, *args, **kwargs):
+        pass
+
+
+# ----- 가짜 백엔드 LLM/임베딩 -----
+async def stub_summarize(text, settings):
+    await asyncio.sleep(0.05)
+    return text[:200]
+
+
+async def stub_embedding(text, model="text-embedding-004", priority=None):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255.0 for b in digest[:32]]
+
+
+async def stub_embeddings(texts, model="text-embedding-004", priority=None):
+    return [await stub_embedding(text, model, priority) for text in texts]
+
+
+async def stub_caption(record):
+    await asyncio.sleep(0.05)
+    record.caption = "가짜 이미지 설명"
+
+
+class BackendClient(httpx.AsyncClient):
+    """봇이 만드는 httpx 클라이언트 대신, 같은 프로세스의 FastAPI 앱으로 요청을 보냅니다."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs["transport"] = httpx.ASGITransport(app=backend_main.app)
+        super().__init__(*args, **kwargs)
+
+    async def post(self, *args, **kwargs):
+        with timed("backend"):
+            return await super().post(*args, **kwargs)
+
+
+def make_image(seed: int) -> bytes:
+    try:
+        from PIL import Image
+        image = Image.effect_noise((2048, 1536), 40).convert("RGB")
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=90)
+        return out.getvalue() + seed.to_bytes(4, "big")  # 이미지마다 해시가 달라지도록
+    except ImportError:
+        return random.Random(seed).randbytes(2 * 1024 * 1024)
+
+
+def install_stubs(gemini_delay: float, governed: bool = False):
+    if not governed:
+        # get_governor()가 돌려주는 프로세스 공유 인스턴스를 사실상 한도 없는 것으로 바꿉니다. (우선순위/재시도 경로는 그대로 지남)
+        rate_governor._governor = rate_governor.RateGovernor({}, rate_governor.RateLimit(10 ** 9, 10 ** 6))
+    discord_bot.bot._connection.user = SimpleNamespace(id=0, name="제비", bot=True)
+    discord_bot.model_pool = StubModelPool(gemini_delay)
+    discord_bot.image_store.hot = RedisTier(fakeredis.FakeRedis(), IMAGE_TTL_SECONDS)
+    discord_bot.available_functions.update({
+        "get_weather": lambda city, api_key=None: f"{city}: 맑음, 20°C",
+        "get_uptime": lambda: "1시간 0분 0초",
+    })
+    discord_bot.httpx.AsyncClient = BackendClient
+
+    async def no_commands(message):
+        pass
+
+    discord_bot.bot.process_commands = no_commands
+
+    hypa_memory.summarize_for_hypa = stub_summarize
+    hypa_memory.summarize_or_raise = stub_summarize
+    hypa_memory.get_embedding = stub_embedding
+    hypa_memory.get_embeddings = stub_embeddings
+    discord_bot.caption_image = stub_caption
+    hypa_memory.collection = chromadb.EphemeralClient().get_or_create_collection("e2e_harness")
+
+    def wrap_sync(name, stage):
+        original = getattr(discord_bot, name)
+
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return original(*args, **kwargs)
+        setattr(discord_bot, name, wrapper)
+
+    def wrap_async(name, stage):
+        original = getattr(discord_bot, name)
+
+        async def wrapper(*args, **kwargs):
+            with timed(stage):
+                return await original(*args, **kwargs)
+        setattr(discord_bot, name, wrapper)
+
+    wrap_sync("should_respond", "gate")
+    wrap_sync("save_memory_to_disk", "save")
+    wrap_async("preprocess_image", "image")
+    wrap_async("send_to_gemini", "gemini")
+
+
+# ----- 대화 모양 -----
+def synthetic_shapes(users: int, turns: int, seed: int = 0):
+    rng = random.Random(seed)
+    shapes = []
+    for u in range(users):
+        user_turns = []
+        for _ in range(turns):
+            roll = rng.random()
+            user_turns.append({
+                "chars": rng.choice([10, 30, 80, 200, 600]),
+                "image": roll < 0.08,
+                "tool": "get_weather" if roll > 0.95 else ("get_uptime" if roll > 0.93 else None),
+                "gap": rng.expovariate(2.0),
+            })
+        shapes.append({"user": f"user{u}", "turns": user_turns})
+    return shapes
+
+
+def turn_text(turn: dict, rng: random.Random) -> str:
+    prefix = {"get_weather": "제비야 서울 날씨 어때 ", "get_uptime": "제비야 업타임 알려줘 "}.get(turn.get("tool"), "제비야 ")
+    body = "".join(rng.choice("가나다라마바사아자차카타파하 ") for _ in range(max(0, turn["chars"] - len(prefix))))
+    return prefix + body
+
+
+async def replay_user(shape: dict, index: int, semaphore: asyncio.Semaphore, speed: float):
+    rng = random.Random(index)
+    user = SimpleNamespace(id=1000 + index, name=shape["user"], bot=False)
+    channel = FakeChannel(index)
+    for t, turn in enumerate(shape["turns"]):
+        await asyncio.sleep(turn.get("gap", 0.0) / speed)
+        attachments = [FakeAttachment(make_image(index * 10_000 + t))] if turn.get("image") else []
+        message = make_message(user, channel, turn_text(turn, rng), attachments)
+        async with semaphore:
+            with timed("total"):
+                await discord_bot.on_message(message)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def report(elapsed: float, turns: int) -> dict:
+    result = {"turns": turns, "elapsed_s": round(elapsed, 3), "throughput_tps": round(turns / elapsed, 2), "stages": {}}
+    print(f"turns={turns} elapsed={elapsed:.2f}s throughput={turns / elapsed:.2f} turns/s")
+    print(f"{'stage':8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage in STAGES:
+        values = timings.get(stage, [])
+        row = {q: round(percentile(values, q) * 1000, 2) for q in (50, 95, 99)}
+        result["stages"][stage] = {"n": len(values), **{f"p{q}_ms": v for q, v in row.items()}}
+        print(f"{stage:8} {len(values):>6} {row[50]:>9.2f} {row[95]:>9.2f} {row[99]:>9.2f}")
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--gemini-delay", type=float, default=0.3)
+    parser.add_argument("--speed", type=float, default=1.0, help="대화 사이 간격(gap)을 이 배수만큼 빠르게 재생")
+    parser.add_argument("--governed", action="store_true", help="실제 Gemini 호출 한도(RateGovernor)를 그대로 둠")
+    parser.add_argument("--shapes", help="재생할 대화 모양 JSON 파일")
+    parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    args = parser.parse_args()
+
+    install_stubs(args.gemini_delay, args.governed)
+    if args.shapes:
+        with open(os.path.join(ORIGINAL_CWD, args.shapes), "r", encoding="utf-8") as f:
+            shapes = json.load(f)
+    else:
+        shapes = synthetic_shapes(args.users, args.turns)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(replay_user(shape, i, semaphore, args.speed) for i, shape in enumerate(shapes)))
+    result = report(time.perf_counter() - started, sum(len(s["turns"]) for s in shapes))
+    if args.json:
+        with open(os.path.join(ORIGINAL_CWD, args.json), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# benchmarks/profile_startup.py
+"""봇과 메모리 백엔드의 시작 시간(임포트 완료, 준비 완료까지)을 잽니다.
+
+각 측정은 새 파이썬 프로세스에서 합니다.
+- 백엔드: `import main` 후 FastAPI lifespan을 실행하고 `/ready`가 참이 될 때까지
+- 봇: `import discord_bot` 후 `initialize_services()`(on_ready에서 하는 초기화)가 끝날 때까지
+  (디스코드 로그인은 제외. 예전 트리처럼 initialize_services가 없으면 임포트가 곧 준비 완료)
+
+`--before <git ref>`를 주면 그 커밋을 임시 폴더에 풀어 같은 방식으로 재고 나란히 보여줍니다.
+
+사용법: python benchmarks/profile_startup.py [--before HEAD~1] [--repeat 3] [--importtime] [--json out.json]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKEND_PROBE = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter()
+
+async def wait_ready():
+    async with main.app.router.lifespan_context(main.app):
+        state = getattr(main, "startup_state", None)
+        while state is not None and not state["ready"] and not state["error"]:
+            await asyncio.sleep(0.005)
+
+asyncio.run(wait_ready())
+print(json.dumps({"import_s": t_import - t0, "ready_s": time.perf_counter() - t0}))
+"""
+
+BOT_PROBE = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import discord_bot
+t_import = time.perf_counter()
+if hasattr(discord_bot, "initialize_services"):
+    asyncio.run(discord_bot.initialize_services())
+print(json.dumps({"import_s": t_import - t0, "ready_s": time.perf_counter() - t0}))
+"""
+
+TARGETS = {"backend": ("RisuMemoryBackend", BACKEND_PROBE, "main"), "bot": ("", BOT_PROBE, "discord_bot")}
+
+
+def extract_ref(ref: str) -> str:
+    """git ref의 트리를 임시 폴더에 풉니다. (작업 트리는 건드리지 않음)"""
+    archive = subprocess.run(["git", "archive", "--format=tar", ref], cwd=ROOT, capture_output=True, check=True).stdout
+    target = tempfile.mkdtemp(prefix="startup_before_")
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return target
+
+
+def probe(tree: str, target: str, repeat: int) -> dict:
+    subdir, code, _ = TARGETS[target]
+    cwd = os.path.join(tree, subdir)
+    work = tempfile.mkdtemp(prefix=f"startup_{target}_")  # bot_data, risu_memory_db 등이 생기는 곳
+    samples = []
+    for _ in range(repeat):
+        env = dict(os.environ, PYTHONPATH=cwd, PYTHONDONTWRITEBYTECODE="1")
+        result = subprocess.run([sys.executable, "-c", f"import os; os.chdir({work!r})\n" + code],
+                                cwd=cwd, env=env, capture_output=True, text=True, timeout=300)
+        if result.returncode != 0:
+            raise RuntimeError(f"{target} 측정 실패:\n{result.stderr[-2000:]}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {key: round(statistics.median(s[key] for s in samples), 3) for key in ("import_s", "ready_s")}
+
+
+def top_imports(tree: str, target: str, limit: int = 10):
+    """`python -X importtime` 결과에서 누적 시간이 큰 최상위 모듈을 고릅니다."""
+    subdir, _, module = TARGETS[target]
+    cwd = os.path.join(tree, subdir)
+    work = tempfile.mkdtemp(prefix=f"importtime_{target}_")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import os, sys; sys.path.insert(0, {cwd!r}); os.chdir({work!r}); import {module}"],
+                            cwd=cwd, capture_output=True, text=True, timeout=300)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]  # 하위 임포트는 이름 앞에 공백이 더 붙습니다.
+        if not name.startswith(" "):
+            rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--before", help="비교할 이전 git ref (예: HEAD~1)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--importtime", action="store_true", help="임포트 시간이 큰 모듈 상위 10개도 보여줌")
+    parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    args = parser.parse_args()
+
+    trees = {"after": ROOT}
+    if args.before:
+        trees = {"before": extract_ref(args.before), **trees}
+
+    result = {}
+    for label, tree in trees.items():
+        for target in TARGETS:
+            try:
+                result[f"{label}/{target}"] = probe(tree, target, args.repeat)
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print(e, file=sys.stderr)
+
+    print(f"{'case':18} {'import s':>10} {'ready s':>10}")
+    for key, stats in result.items():
+        print(f"{key:18} {stats['import_s']:>10.3f} {stats['ready_s']:>10.3f}")
+
+    if args.importtime:
+        for target in TARGETS:
+            print(f"\n[{target}] 누적 임포트 시간 상위 모듈")
+            for cumulative, name in top_imports(ROOT, target):
+                print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# benchmarks/replay_traffic.py
+"""트래픽 기록(TRAFFIC_CAPTURE_PATH)을 로컬 대역 위에서 1배/10배/100배 속도로 재생해 지연 시간과 대기를 잽니다.
+
+대역(가짜 Discord/Gemini, 같은 프로세스의 FastAPI 백엔드, fakeredis)은 e2e_harness.py의 것을 그대로 씁니다.
+기록된 턴은 이미 응답 게이트를 통과한 것이므로 on_message가 아니라 process_chat_message를 바로 부릅니다.
+
+- 턴은 기록된 시각(첫 턴 기준)을 속도로 나눈 때에 시작합니다. 글자 수, 이미지 유무, 첫 도구 이름을 재현합니다.
+- 대기(queueing)는 두 가지로 봅니다.
+  lag  예정 시각보다 늦게 시작한 시간 (같은 유저의 앞 턴이 아직 안 끝나서 밀린 경우)
+  lock 턴 잠금을 기다린 시간 (process_chat_message 안에서 잰 값을 트래픽 기록으로 다시 읽음)
+- Gemini 대역의 지연은 기본으로 기록된 Gemini 호출 시간의 중앙값을 씁니다. 기록된 시간에는 그때의 호출 한도 대기가
+  섞여 있을 수 있으니(특히 한도를 건 하네스로 만든 기록), 순수 호출 시간을 알면 --gemini-delay로 주세요.
+- 호출 한도(RateGovernor)는 e2e_harness.py처럼 기본으로 풉니다. 한도까지 재현하려면 --governed.
+
+기록을 e2e_harness.py의 대화 모양 파일로 바꿔 저장할 수도 있습니다. (--shapes-out)
+
+사용법: python benchmarks/replay_traffic.py capture.jsonl [capture.jsonl.shard1 ...] [--speeds 1 10 100]
+                                           [--window 600] [--gemini-delay 0.3] [--governed] [--shapes-out shapes.json]
+                                           [--json out.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import e2e_harness  # (작업 폴더를 임시 폴더로 옮기고 discord_bot/백엔드를 불러옵니다)
+from e2e_harness import FakeAttachment, FakeChannel, make_image, make_message, percentile, turn_text
+from traffic_capture import TrafficCapture
+
+discord_bot = e2e_harness.discord_bot
+
+
+def load_capture(paths, window: float = None):
+    """여러 기록 파일(샤드별)을 시각 순으로 합칩니다. `window`초를 주면 첫 턴부터 그 시간까지만 씁니다."""
+    records = []
+    for path in paths:
+        with open(os.path.join(e2e_harness.ORIGINAL_CWD, path), "r", encoding="utf-8") as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda r: r["t"])
+    if records and window:
+        records = [r for r in records if r["t"] - records[0]["t"] <= window]
+    return records
+
+
+def to_shapes(records):
+    """e2e_harness의 대화 모양 형식으로 바꿉니다. gap은 같은 유저의 앞 턴부터, at은 첫 턴부터 잰 초입니다."""
+    if not records:
+        return []
+    start = records[0]["t"]
+    users, last_seen = defaultdict(list), {}
+    for r in records:
+        offset = r["t"] - start
+        users[r["u"]].append({"chars": r.get("chars", 0), "image": bool(r.get("img")),
+                              "tool": (r.get("tools") or [None])[0],
+                              "gap": round(offset - last_seen.get(r["u"], 0.0), 3), "at": round(offset, 3)})
+        last_seen[r["u"]] = offset
+    return [{"user": user, "turns": turns} for user, turns in users.items()]
+
+
+def recorded_gemini_delay(records) -> float:
+    """Gemini 호출 한 번의 기록된 시간(중앙값). 도구를 쓴 턴은 호출 수로 나눕니다."""
+    samples = [r["ms"]["gemini"] / 1000 / (1 + len(r.get("tools", []))) for r in records if r.get("ms", {}).get("gemini")]
+    return statistics.median(samples) if samples else 0.3
+
+
+async def replay_user(shape: dict, index: int, run: str, speed: float, started: float, lags: list):
+    rng = random.Random(index)
+    user = SimpleNamespace(id=1000 + index, name=f"{shape['user']}@{run}", bot=False)
+    channel = FakeChannel(index)
+    for t, turn in enumerate(shape["turns"]):
+        due = started + turn["at"] / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lags.append(max(0.0, time.perf_counter() - due))
+        attachments = [FakeAttachment(make_image(index * 10_000 + t))] if turn.get("image") else []
+        message = make_message(user, channel, turn_text(turn, rng), attachments)
+        with e2e_harness.timed("total"):
+            await discord_bot.process_chat_message(message)
+
+
+def summarize(values, scale: float = 1000) -> dict:
+    return {"n": len(values), **{f"p{q}_ms": round(percentile(values, q) * scale, 2) for q in (50, 95, 99)},
+            "max_ms": round(max(values) * scale, 2) if values else 0.0}
+
+
+async def run_speed(shapes, speed: float) -> dict:
+    e2e_harness.timings.clear()
+    # 재생 중에도 트래픽 기록을 켜 두고, 턴 잠금 대기 시간(lock_ms)을 다시 읽어 옵니다.
+    capture_path = os.path.join(tempfile.mkdtemp(prefix="replay_capture_"), "turns.jsonl")
+    discord_bot.traffic = TrafficCapture(capture_path, flush_every=1)
+    lags = []
+    started = time.perf_counter()
+    await asyncio.gather(*(replay_user(shape, i, f"{speed:g}x", speed, started, lags)
+                           for i, shape in enumerate(shapes)))
+    elapsed = time.perf_counter() - started
+    discord_bot.traffic.flush()
+    with open(capture_path, "r", encoding="utf-8") as f:
+        replayed = [json.loads(line) for line in f if line.strip()]
+    discord_bot.traffic = None
+
+    print(f"\n=== {speed:g}x ===")
+    result = e2e_harness.report(elapsed, sum(len(s["turns"]) for s in shapes))
+    result["speed"] = speed
+    result["queue"] = {"lag": summarize(lags), "lock": summarize([r.get("lock_ms", 0) for r in replayed], scale=1)}
+    outcomes = defaultdict(int)
+    for r in replayed:
+        outcomes[r.get("out", "ok")] += 1
+    result["outcomes"] = dict(outcomes)
+    for name, row in result["queue"].items():
+        print(f"{'q:' + name:8} {row['n']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+              f"  (max {row['max_ms']:.2f})")
+    print(f"outcomes: {dict(outcomes)}")
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("captures", nargs="+", help="트래픽 기록 JSONL (샤드별 파일 여러 개 가능)")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1.0, 10.0, 100.0])
+    parser.add_argument("--window", type=float, help="첫 턴부터 이 초만큼만 재생")
+    parser.add_argument("--gemini-delay", type=float, help="기본값: 기록된 Gemini 호출 시간의 중앙값")
+    parser.add_argument("--governed", action="store_true", help="실제 Gemini 호출 한도(RateGovernor)를 그대로 둠")
+    parser.add_argument("--shapes-out", help="e2e_harness.py --shapes로 쓸 대화 모양 JSON을 저장할 경로")
+    parser.add_argument("--json", help="결과를 저장할 JSON 경로")
+    args = parser.parse_args()
+
+    records = load_capture(args.captures, args.window)
+    if not records:
+        print("재생할 턴이 없습니다.")
+        return
+    shapes = to_shapes(records)
+    if args.shapes_out:
+        with open(os.path.join(e2e_harness.ORIGINAL_CWD, args.shapes_out), "w", encoding="utf-8") as f:
+            json.dump(shapes, f, ensure_ascii=False)
+
+    gemini_delay = args.gemini_delay if args.gemini_delay is not None else recorded_gemini_delay(records)
+    span_s = records[-1]["t"] - records[0]["t"]
+    print(f"turns={len(records)} users={len(shapes)} span={span_s:.1f}s gemini_delay={gemini_delay * 1000:.0f}ms")
+    e2e_harness.install_stubs(gemini_delay, args.governed)
+
+    results = [await run_speed(shapes, speed) for speed in args.speeds]
+    if args.json:
+        with open(os.path.join(e2e_harness.ORIGINAL_CWD, args.json), "w", encoding="utf-8") as f:
+            json.dump({"turns": len(records), "users": len(shapes), "span_s": round(span_s, 3),
+                       "gemini_delay_s": gemini_delay, "runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
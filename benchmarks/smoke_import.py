@@ -0,0 +1,57 @@
+# benchmarks/smoke_import.py
+"""봇(discord_bot)과 백엔드(main)가 임포트되는지 새 파이썬 프로세스에서 확인합니다.
+
+모듈 맨 위에서 실행되는 코드(설정, 지표 등록, 전역 객체 생성)의 순서 실수는 임포트할 때만 드러나므로
+선택 기능을 켠 조합(답변 캐시, 트래픽 기록, in-process 백엔드)으로도 한 번씩 임포트해 봅니다.
+`--refs`를 주면 그 커밋들도 임시 폴더에 풀어 같은 방식으로 확인합니다. 하나라도 실패하면 종료 코드 1.
+
+사용법: python benchmarks/smoke_import.py [--refs HEAD~3 HEAD~2 ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from profile_startup import ROOT, extract_ref
+
+TARGETS = {"backend": ("RisuMemoryBackend", "main"), "bot": ("", "discord_bot")}
+VARIANTS = {
+    "default": {},
+    "answer_cache": {"ANSWER_CACHE_ENABLED": "1"},
+    "traffic_capture": {"TRAFFIC_CAPTURE_PATH": "capture/turns.jsonl"},
+    "inprocess": {"MEMORY_BACKEND_MODE": "inprocess"},
+}
+
+
+def try_import(tree: str, target: str, env_overrides: dict) -> str:
+    """성공하면 빈 문자열, 실패하면 오류 메시지 끝부분을 돌려줍니다."""
+    subdir, module = TARGETS[target]
+    cwd = os.path.join(tree, subdir)
+    work = tempfile.mkdtemp(prefix=f"smoke_{target}_")
+    env = dict(os.environ, PYTHONPATH=cwd, PYTHONDONTWRITEBYTECODE="1", **env_overrides)
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", f"import os; os.chdir({work!r}); import {module}"],
+                            cwd=cwd, env=env, capture_output=True, text=True, timeout=300)
+    return "" if result.returncode == 0 else result.stderr.strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--refs", nargs="*", default=[], help="함께 확인할 git ref")
+    args = parser.parse_args()
+
+    trees = {ref: extract_ref(ref) for ref in args.refs}
+    trees["working tree"] = ROOT
+    failed = 0
+    for label, tree in trees.items():
+        for target in TARGETS:
+            variants = VARIANTS if target == "bot" else {"default": {}}
+            for name, env_overrides in variants.items():
+                error = try_import(tree, target, env_overrides)
+                failed += bool(error)
+                print(f"{label:14} {target:8} {name:16} {'ok' if not error else 'FAIL  ' + error}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
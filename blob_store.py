@@ -0,0 +1,241 @@
+# bot/blob_store.py
+import logging
+import mmap
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from image_pipeline import IMAGE_KEY_PREFIX
+
+
+@dataclass
+class Blob:
+    data: bytes
+    mime_type: str
+
+
+class MemoryTier:
+    """프로세스 안의 LRU 캐시. Redis가 없을 때 핫 티어로 씁니다."""
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blobs: "OrderedDict[str, Blob]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> Optional[Blob]:
+        blob = self._blobs.get(key)
+        if blob is not None:
+            self._blobs.move_to_end(key)
+        return blob
+
+    def contains(self, key: str) -> Optional[str]:
+        blob = self.get(key)
+        return blob.mime_type if blob else None
+
+    def put(self, key: str, blob: Blob):
+        if key in self._blobs:
+            self._size -= len(self._blobs.pop(key).data)
+        self._blobs[key] = blob
+        self._size += len(blob.data)
+        while self._size > self.max_bytes and len(self._blobs) > 1:
+            _, evicted = self._blobs.popitem(last=False)
+            self._size -= len(evicted.data)
+
+
+class RedisTier:
+    """Redis 해시({mime, data})에 TTL을 걸어 저장하는 핫 티어.
+
+    `sliding`이면 읽을 때마다 TTL을 다시 겁니다. 여러 봇 프로세스가 디스크 티어를 공유하지 않을 때,
+    다른 프로세스가 저장한 이미지를 쓰는 동안에는 Redis에서 사라지지 않게 합니다.
+    """
+    name = "redis"
+
+    def __init__(self, client, ttl_seconds: int, sliding: bool = False):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.sliding = sliding
+
+    def get(self, key: str) -> Optional[Blob]:
+        try:
+            mime_type, data = self.client.hmget(key, "mime", "data")
+        except Exception as e:
+            logging.warning(f"Redis 이미지 조회 실패: {e}")
+            return None
+        if not data:
+            return None
+        if self.sliding:
+            try:
+                self.client.expire(key, self.ttl_seconds)
+            except Exception as e:
+                logging.warning(f"Redis 이미지 TTL 갱신 실패: {e}")
+        return Blob(data, mime_type.decode("utf-8"))
+
+    def contains(self, key: str) -> Optional[str]:
+        """mime 타입만 읽고 TTL을 다시 겁니다. (같은 이미지를 다시 올리면 보관 기간이 늘어남)"""
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hget(key, "mime")
+            pipe.expire(key, self.ttl_seconds)
+            mime_type, _ = pipe.execute()
+        except Exception as e:
+            logging.warning(f"Redis 이미지 확인 실패: {e}")
+            return None
+        return mime_type.decode("utf-8") if mime_type else None
+
+    def put(self, key: str, blob: Blob):
+        try:
+            pipe = self.client.pipeline()
+            pipe.hset(key, mapping={"mime": blob.mime_type, "data": blob.data})
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f"Redis 이미지 저장 실패: {e}")
+
+
+class DiskTier:
+    """내용 해시로 주소를 매기는 로컬 디스크 저장소. 전체 크기가 `max_bytes`를 넘으면 오래 안 쓴 것부터 지웁니다.
+
+    파일 형식은 `mime 타입\\n` 한 줄 뒤에 이미지 바이트이며, 읽을 때는 mmap으로 엽니다.
+    """
+    name = "disk"
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # 키 -> 파일 크기 (LRU 순서)
+        self._size = 0
+        self._load_index()
+
+    @property
+    def count(self) -> int:
+        return len(self._index)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Optional[Blob]:
+        if key not in self._index:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header_end = mm.find(b"\n")
+                blob = Blob(mm[header_end + 1:], mm[:header_end].decode("utf-8"))
+        except (OSError, ValueError) as e:
+            logging.warning(f"디스크 이미지 읽기 실패 ({key}): {e}")
+            self._forget(key)
+            return None
+        self._index.move_to_end(key)
+        return blob
+
+    def contains(self, key: str) -> Optional[str]:
+        """파일의 첫 줄(mime 타입)만 읽습니다."""
+        if key not in self._index:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                mime_type = f.readline().rstrip(b"\n").decode("utf-8")
+        except (OSError, ValueError) as e:
+            logging.warning(f"디스크 이미지 확인 실패 ({key}): {e}")
+            self._forget(key)
+            return None
+        self._index.move_to_end(key)
+        return mime_type
+
+    def put(self, key: str, blob: Blob):
+        if key in self._index:
+            self._index.move_to_end(key)
+            return  # 내용 주소 방식이므로 같은 키면 같은 내용
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob.mime_type.encode("utf-8") + b"\n")
+                f.write(blob.data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"디스크 이미지 저장 실패 ({key}): {e}")
+            return
+        size = os.path.getsize(path)
+        self._index[key] = size
+        self._size += size
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            self._forget(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _forget(self, key: str):
+        self._size -= self._index.pop(key, 0)
+
+    def _load_index(self):
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, IMAGE_KEY_PREFIX + entry.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        logging.info(f"디스크 이미지 저장소: {len(self._index)}개, {self._size / 1024 / 1024:.1f}MB")
+
+    def _path(self, key: str) -> str:
+        digest = key[len(IMAGE_KEY_PREFIX):]
+        return os.path.join(self.root, digest[:2], digest)
+
+
+class TieredBlobStore:
+    """핫 티어(Redis 또는 메모리 LRU) 뒤에 디스크 저장소를 두는 2단 이미지 저장소.
+
+    저장은 두 티어 모두에 하고, 읽을 때 핫 티어에 없으면 디스크에서 읽어 핫 티어로 다시 올립니다.
+    """
+
+    def __init__(self, hot, cold: DiskTier):
+        self.hot = hot
+        self.cold = cold
+        self.counters: Dict[str, int] = {"hot_hits": 0, "cold_hits": 0, "misses": 0, "puts": 0}
+
+    def get(self, key: str) -> Optional[Blob]:
+        blob = self.hot.get(key)
+        if blob is not None:
+            self.counters["hot_hits"] += 1
+            return blob
+        blob = self.cold.get(key)
+        if blob is not None:
+            self.counters["cold_hits"] += 1
+            self.hot.put(key, blob)
+            return blob
+        self.counters["misses"] += 1
+        return None
+
+    def contains(self, key: str) -> Optional[str]:
+        """저장되어 있으면 mime 타입을, 없으면 None을 돌려줍니다.
+
+        이미지 데이터는 읽지 않고 조회 수에도 넣지 않습니다. 핫 티어가 Redis면 TTL을 다시 겁니다.
+        """
+        return self.hot.contains(key) or self.cold.contains(key)
+
+    def put(self, key: str, blob: Blob):
+        self.counters["puts"] += 1
+        self.cold.put(key, blob)
+        self.hot.put(key, blob)
+
+    def stats(self) -> Dict:
+        reads = self.counters["hot_hits"] + self.counters["cold_hits"] + self.counters["misses"]
+        hit_rate = self.counters["hot_hits"] / reads if reads else 0.0
+        return {**self.counters, "hot_tier": self.hot.name, "hot_hit_rate": round(hit_rate, 3),
+                "disk_blobs": self.cold.count, "disk_mb": round(self.cold.size_bytes / 1024 / 1024, 1)}
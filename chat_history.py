@@ -0,0 +1,234 @@
+# bot/chat_history.py
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import uuid
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Union
+
+# 대화 한 건마다 붙는 고정 토큰 (백엔드 Tokenizer.count_chat_tokens와 동일한 값)
+MESSAGE_TOKEN_OVERHEAD = 4
+# 크기를 모르는 예전 이미지 기록의 토큰 수. 긴 변 1536px 사진(768px 타일 4개)으로 봅니다.
+DEFAULT_IMAGE_TOKENS = 258 * 4
+
+
+def estimate_tokens(text: str) -> int:
+    """tiktoken 없이 쓸 수 있는 대략적인 토큰 수를 계산합니다.
+
+    한글 등 비ASCII 문자는 글자당 1토큰, ASCII 문자는 4글자당 1토큰으로 잡습니다.
+    """
+    if not text:
+        return 0
+    # 글자마다 파이썬 루프를 돌지 않도록 ASCII 글자 수는 C로 구현된 encode로 셉니다.
+    ascii_count = len(text) if text.isascii() else len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_count) + ascii_count // 4 + 1
+
+
+def encode_memo(memo: Optional[str]) -> Union[bytes, str, None]:
+    """UUID 형식의 memo는 16바이트로 줄여 저장합니다. UUID가 아닌 memo는 그대로 둡니다."""
+    if not memo:
+        return None
+    if len(memo) == 36:
+        try:
+            return uuid.UUID(memo).bytes
+        except ValueError:
+            pass
+    return memo
+
+
+def decode_memo(memo: Union[bytes, str, None]) -> Optional[str]:
+    if isinstance(memo, bytes):
+        return str(uuid.UUID(bytes=memo))
+    return memo
+
+
+class ChatRecord:
+    """단기기억 한 건. 메시지마다 dict를 만드는 대신 __slots__로 메모리를 아낍니다.
+
+    role은 intern된 문자열, memo는 16바이트 UUID로 들고 있으며,
+    디스크나 백엔드로 보낼 때는 `to_dict()`로 예전 JSON 형식을 그대로 만듭니다.
+    """
+    __slots__ = ("role", "content", "memo_key", "image_key", "mime_type", "image_tokens", "caption")
+
+    def __init__(self, role: str, content: str, memo: Optional[str] = None,
+                 image_key: Optional[str] = None, mime_type: Optional[str] = None,
+                 image_tokens: Optional[int] = None, caption: Optional[str] = None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.memo_key = encode_memo(memo)
+        self.image_key = image_key
+        self.mime_type = sys.intern(mime_type) if mime_type else None
+        self.image_tokens = image_tokens  # 모델 입력에서 이미지가 차지하는 (추정) 토큰 수
+        self.caption = caption  # 오래된 이미지를 대신할 짧은 설명 (백그라운드에서 만듦)
+
+    @classmethod
+    def new(cls, role: str, content: str) -> "ChatRecord":
+        """새 UUID memo를 가진 기록을 만듭니다. (문자열 변환 없이 바로 16바이트로 저장)"""
+        record = cls(role, content)
+        record.memo_key = uuid.uuid4().bytes
+        return record
+
+    @property
+    def memo(self) -> Optional[str]:
+        return decode_memo(self.memo_key)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ChatRecord":
+        return cls(data["role"], data.get("content", ""), data.get("memo"),
+                   data.get("image_key"), data.get("mime_type"), data.get("image_tokens"), data.get("caption"))
+
+    def to_dict(self) -> Dict:
+        data = {"role": self.role, "content": self.content, "memo": self.memo}
+        if self.image_key:
+            data["image_key"] = self.image_key
+            data["mime_type"] = self.mime_type
+            if self.image_tokens:
+                data["image_tokens"] = self.image_tokens
+            if self.caption:
+                data["caption"] = self.caption
+        return data
+
+    def to_text_dict(self) -> Dict:
+        """메모리 백엔드로 보낼 형식. 이미지는 데이터 대신 토큰 수와 설명만 보내 백엔드가 예산에 넣게 합니다."""
+        data = {"role": self.role, "content": self.content, "memo": self.memo}
+        if self.image_key:
+            data["image_tokens"] = self.image_tokens or DEFAULT_IMAGE_TOKENS
+            if self.caption:
+                data["caption"] = self.caption
+        return data
+
+
+def record_tokens(record: ChatRecord) -> int:
+    return estimate_tokens(record.content) + MESSAGE_TOKEN_OVERHEAD
+
+
+def safe_file_name(name: str) -> str:
+    """유저 이름을 파일 이름으로 쓸 수 있게 바꿉니다. (알아보기 쉬운 앞부분 + 이름의 해시)
+
+    쓸 수 없는 글자만 '_'로 바꾸면 서로 다른 이름이 같은 파일이 되므로(한글 두 글자 이름은 모두 '__') 해시를 붙입니다.
+    """
+    readable = re.sub(r"[^0-9A-Za-z_.-]", "_", name)[:32].strip("._") or "user"
+    return f"{readable}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]}"
+
+
+def legacy_file_name(name: str) -> Optional[str]:
+    """해시를 붙이기 전의 파일 이름. 바꿀 글자가 없던 이름만 다른 유저와 겹치지 않았다고 볼 수 있으므로 그때만 돌려줍니다."""
+    return name if name and re.fullmatch(r"[0-9A-Za-z_.-]+", name) else None
+
+
+class ChatHistoryWindow:
+    """유저 한 명의 단기기억을 메시지 수와 토큰 수로 제한하는 슬라이딩 창.
+
+    창을 넘친 오래된 기록은 버리지 않고 `archive_dir`의 JSONL 파일(콜드 스토리지)에 덧붙입니다.
+    아카이브는 장기기억에 요약되지 않으므로, 한도를 넘친 기록도 백엔드가 요약했다고 알려줄 때까지(`sync_with_backend`)
+    한도의 `hard_limit_ratio`배까지는 창에 남겨둡니다. 그 너머는 요약 없이 아카이브로 보내고 경고를 남깁니다.
+    (1.0이면 한도를 넘는 즉시 아카이브로 보냅니다. converter처럼 나중에 backfill.py로 요약할 때 씁니다.)
+    """
+
+    def __init__(self, user_name: str, max_messages: int, max_tokens: int, archive_dir: Optional[str] = None,
+                 hard_limit_ratio: float = 2.0):
+        self.user_name = user_name
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.archive_dir = archive_dir
+        self.hard_limit_ratio = max(1.0, hard_limit_ratio)
+        self.unsummarized_archived = 0  # 요약되지 않은 채 아카이브로 넘어간 기록 수
+        self._records: Deque[ChatRecord] = deque()
+        self._by_memo: Dict[Union[bytes, str], ChatRecord] = {}
+        self._tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    def last(self) -> Optional[ChatRecord]:
+        return self._records[-1] if self._records else None
+
+    def get(self, memo: Optional[str]) -> Optional[ChatRecord]:
+        """memo로 창 안의 기록을 찾습니다."""
+        return self._by_memo.get(encode_memo(memo)) if memo else None
+
+    def append(self, record: Union[ChatRecord, Dict]):
+        self._push(record)
+        self._enforce_limits()
+
+    def extend(self, records: Iterable[Union[ChatRecord, Dict]]):
+        for record in records:
+            self._push(record)
+        self._enforce_limits()
+
+    def text_only(self) -> List[Dict]:
+        """메모리 백엔드로 보낼 기록을 만듭니다. (이미지 데이터 없이 토큰 수와 설명만)"""
+        return [r.to_text_dict() for r in self._records]
+
+    def to_list(self) -> List[Dict]:
+        return [r.to_dict() for r in self._records]
+
+    def sync_with_backend(self, summarized_until: Optional[str]) -> int:
+        """백엔드가 장기기억에 요약한 기록을 창에서 내보냅니다.
+
+        `summarized_until`은 백엔드 응답의 같은 이름 값으로, 아직 요약되지 않은 첫 메시지의 memo입니다.
+        그 앞의 기록만 내보내고, 맥락 예산 때문에 잘렸을 뿐 요약되지 않은 기록은 창에 남겨
+        다음 요청에서 다시 요약 대상이 되게 합니다. memo가 없거나 창에 없으면 아무것도 하지 않습니다.
+        """
+        boundary = self.get(summarized_until)
+        if boundary is None:
+            return 0
+        overflow = []
+        while self._records and self._records[0] is not boundary:
+            overflow.append(self._pop_oldest())
+        if overflow:
+            self._archive(overflow)
+        return len(overflow)
+
+    def _push(self, record: Union[ChatRecord, Dict]):
+        if isinstance(record, dict):
+            record = ChatRecord.from_dict(record)
+        self._records.append(record)
+        self._tokens += record_tokens(record)
+        if record.memo_key:
+            self._by_memo[record.memo_key] = record
+
+    def _pop_oldest(self) -> ChatRecord:
+        record = self._records.popleft()
+        self._tokens -= record_tokens(record)
+        if record.memo_key:
+            self._by_memo.pop(record.memo_key, None)
+        return record
+
+    def _enforce_limits(self):
+        # 한도를 넘친 기록은 요약될 때까지 hard_limit_ratio배까지 기다립니다. (sync_with_backend 참고)
+        # 방금 들어온 메시지는 토큰 한도를 넘더라도 항상 남겨둡니다.
+        max_messages = int(self.max_messages * self.hard_limit_ratio)
+        max_tokens = int(self.max_tokens * self.hard_limit_ratio)
+        overflow = []
+        while len(self._records) > 1 and (len(self._records) > max_messages or self._tokens > max_tokens):
+            overflow.append(self._pop_oldest())
+        if overflow:
+            if self.hard_limit_ratio > 1.0:
+                self.unsummarized_archived += len(overflow)
+                logging.warning(f"[History] '{self.user_name}' 단기기억이 요약되지 않은 채 한도를 넘어 "
+                                f"{len(overflow)}건을 아카이브로 보냅니다. (backfill.py로 장기기억에 넣을 수 있습니다)")
+            self._archive(overflow)
+
+    def _archive(self, records: List[ChatRecord]):
+        if not self.archive_dir:
+            return
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            path = os.path.join(self.archive_dir, f"{safe_file_name(self.user_name)}.jsonl")
+            with open(path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+            logging.info(f"'{self.user_name}'의 오래된 기록 {len(records)}개를 '{path}'에 보관했습니다.")
+        except Exception as e:
+            logging.error(f"기록 보관 중 오류: {e}")
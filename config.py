@@ -8,6 +8,9 @@ parent_dir = os.path.dirname(current_dir)
 grandparent_dir = os.path.dirname(parent_dir)
 personas_path = os.path.join(grandparent_dir, "personas", "personas")
 sys.path.append(os.path.dirname(personas_path))
+# 메모리 백엔드 패키지(risu_memory_backend)의 공용 모듈(호출 속도 조정 등)을 봇에서도 씁니다.
+sys.path.append(os.path.join(current_dir, "RisuMemoryBackend"))
+import personas
 from personas import *
 from dotenv import load_dotenv
 
@@ -18,6 +21,16 @@ load_dotenv()
 # ----- 키워드 설정 (JEBI_KEYWORDS) -----
 # 봇이 응답해야 하는 키워드를 여기에 정의합니다.
 JEBI_KEYWORDS = {"제비야", "제비", "야제비", "제비님", "제비봇", "야제비야"}
+# 서버(guild ID)별, 페르소나별로 추가로 반응할 키워드. 기본 키워드(JEBI_KEYWORDS)에 더해집니다.
+GUILD_KEYWORDS = {
+    # 123456789012345678: {"제비선생", "선생님"},
+}
+PERSONA_KEYWORDS = {
+    "이미지": {"이미지야", "분석해줘"},
+    "한준이": {"한준", "한준아", "한준이"},
+}
+# 응답 게이트 점수 기준 (message_gate.GateWeights 참고). 단어 경계를 지킨 키워드 하나(0.6)면 응답합니다.
+GATE_RESPOND_THRESHOLD = 0.6
 
 
 # ----- Constants -----
@@ -25,7 +38,86 @@ MODEL_NAME = "gemini-flash-latest"
 TIMEZONE = pytz.timezone('Asia/Shanghai')
 INACTIVE_SESSION_TIMEOUT = timedelta(minutes=5)
 DATA_DIR = "bot_data"
-SYSTEM_INSTRUCTION = 인외
+
+# ----- 페르소나 설정 -----
+# personas.py에 정의된 모든 지시문을 이름으로 고를 수 있습니다. 채널/서버별 선택은 PERSONA_SELECTION_PATH에 저장됩니다.
+PERSONAS = {name: text for name, text in vars(personas).items() if not name.startswith("_") and isinstance(text, str)}
+DEFAULT_PERSONA = "인외"
+SYSTEM_INSTRUCTION = PERSONAS[DEFAULT_PERSONA]
+PERSONA_SELECTION_PATH = os.path.join(DATA_DIR, "persona_selection.json")
+MODEL_POOL_SIZE = 8  # 동시에 보관할 GenerativeModel 수
+# 지시문이 이 토큰 수 이상인 페르소나만 Gemini 컨텍스트 캐싱을 사용합니다.
+PERSONA_CONTEXT_CACHE_MIN_TOKENS = 4096
+PERSONA_CONTEXT_CACHE_TTL = timedelta(hours=1)
+
+# ----- 단기기억 창 설정 -----
+# 유저별로 메모리에 올려두는 최근 대화의 최대 개수와 (추정) 토큰 수입니다.
+# 백엔드가 요약할 재료가 남도록 MAX_CONTEXT_TOKENS보다 넉넉하게 잡습니다.
+MAX_CONTEXT_TOKENS = 8192
+SHORT_TERM_MAX_MESSAGES = 200
+SHORT_TERM_MAX_TOKENS = MAX_CONTEXT_TOKENS * 3
+# 창에서 밀려난 기록이 보관되는 폴더 (유저별 JSONL)
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+
+# ----- 이미지 설정 -----
+# 업로드된 이미지는 긴 변이 IMAGE_MAX_EDGE 픽셀을 넘지 않게 줄이고 IMAGE_FORMAT으로 다시 인코딩해 저장합니다.
+IMAGE_MAX_EDGE = 1536
+IMAGE_FORMAT = "WEBP"  # "WEBP" 또는 "JPEG"
+IMAGE_QUALITY = 85
+IMAGE_TTL_SECONDS = 3600  # Redis(핫 티어)에 이미지를 보관하는 시간. 만료 후에도 디스크에서 다시 불러옵니다.
+BLOB_DIR = os.path.join(DATA_DIR, "blobs")  # 디스크 이미지 저장소 (내용 해시 기반)
+BLOB_DISK_MAX_BYTES = 2 * 1024 ** 3  # 디스크 저장소 최대 크기. 넘으면 오래 안 쓴 이미지부터 지웁니다.
+BLOB_MEMORY_MAX_BYTES = 64 * 1024 ** 2  # Redis가 없을 때 쓰는 메모리 캐시 최대 크기
+# 이미지도 컨텍스트 예산에 넣습니다. (크기로 추정한 토큰 수) 백엔드는 글을 요약하기 전에 최근 IMAGE_MAX_INLINE장만
+# 남기고, 이미지 토큰 합이 컨텍스트의 IMAGE_TOKEN_RATIO를 넘지 않게 오래된 이미지를 캡션으로 바꿉니다.
+IMAGE_MAX_INLINE = 3
+IMAGE_TOKEN_RATIO = 0.5
+IMAGE_CAPTIONS = True  # 이미지를 받으면 백그라운드에서 짧은 설명(캡션)을 만들어 둡니다.
+IMAGE_CAPTION_PROMPT = "이 이미지에 무엇이 있는지 한두 문장으로 설명해줘. 글자가 있으면 그대로 옮겨줘."
+IMAGE_CAPTION_MAX_CHARS = 300
+
+# ----- 세션 관리 설정 -----
+# INACTIVE_SESSION_TIMEOUT 동안 말이 없던 유저의 단기기억은 SESSION_DIR로 내보냈다가 다음 메시지에서 다시 불러옵니다.
+SESSION_DIR = os.path.join(DATA_DIR, "sessions")
+MAX_RESIDENT_SESSIONS = 500  # 메모리에 동시에 올려둘 최대 세션 수 (LRU)
+
+# ----- 샤딩/공유 상태 설정 -----
+# SHARD_COUNT가 없으면 디스코드가 권장하는 샤드 수를 씁니다. 여러 프로세스로 나눠 띄울 때는 모든 프로세스에 같은
+# SHARD_COUNT를, 프로세스마다 맡을 샤드 번호를 SHARD_IDS="0,1"처럼 줍니다. (run_shards.py가 대신 해 줍니다)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = [int(i) for i in os.getenv("SHARD_IDS", "").split(",") if i.strip()] or None
+# 여러 프로세스가 같은 유저를 처리할 수 있으면 단기기억과 유저별 턴 잠금을 Redis에 둡니다. ("local" 또는 "redis")
+# 샤드를 여러 프로세스로 나누면 기본값이 "redis"입니다.
+SHARED_STATE = os.getenv("SHARED_STATE", "redis" if SHARD_IDS else "local")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+TURN_LOCK_TTL_SECONDS = 180  # 턴 잠금을 쥔 프로세스가 죽었을 때 잠금이 풀리기까지의 시간 (한 턴의 최대 처리 시간보다 길게)
+TURN_LOCK_WAIT_SECONDS = 60  # 같은 유저의 앞 턴을 기다리는 최대 시간
+IMAGE_SHARED_TTL_SECONDS = 7 * 24 * 3600  # 공유 상태에서 Redis 이미지 TTL (읽을 때마다 연장). 디스크 티어는 프로세스마다 따로입니다.
+
+# ----- 답변 캐시 설정 (기본 꺼짐) -----
+# 도구를 써서 답한 질문(날씨, 검색 등)의 최종 답을 서버/채널/페르소나별로 보관해, 거의 같은 질문에는 LLM 없이 바로 답합니다.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "0") == "1"
+ANSWER_CACHE_THRESHOLD = 0.88  # 부르는 말을 뺀 질문의 글자 3-그램 유사도가 이 이상이면 같은 질문으로 봅니다.
+ANSWER_CACHE_MAX_ENTRIES = 256  # 서버/채널/페르소나별 최대 보관 수
+ANSWER_CACHE_MAX_SCOPES = 1024  # 보관할 서버/채널/페르소나 조합 수 (넘으면 오래 안 쓴 조합부터 버림)
+# 도구별 (보관 시간(초), 꺼낼 때 도구를 다시 불러 결과가 같은지 확인할지). 보관 시간 0이나 목록에 없는 도구를 쓴 답은 보관하지 않습니다.
+ANSWER_CACHE_TOOL_POLICIES = {
+    "get_weather": (30 * 60, True),
+    "search_web": (3600, True),  # 검색 결과는 수시로 바뀌므로 꺼낼 때 다시 검색해 같을 때만 씁니다.
+    "get_uptime": (0, False),  # 물을 때마다 값이 바뀝니다.
+}
+
+# ----- 트래픽 기록 (기본 꺼짐) -----
+# 경로를 주면 턴마다 내용 없이 크기/시간/토큰/도구 이름만 JSONL로 남깁니다. (benchmarks/replay_traffic.py로 재생)
+# 샤드 프로세스마다 파일을 따로 씁니다. 솔트를 정해 두면 재시작해도 같은 유저가 같은 익명 ID로 남습니다.
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH")
+TRAFFIC_CAPTURE_SALT = os.getenv("TRAFFIC_CAPTURE_SALT")
+
+# ----- 지표 설정 -----
+# 단계별 처리 시간/토큰/캐시 지표를 Prometheus 형식으로 이 주소에 노출합니다. 0이면 지표 서버를 띄우지 않습니다.
+# (기록 자체를 끄려면 환경 변수 METRICS_ENABLED=0)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 샤드 프로세스마다 맡은 첫 샤드 번호만큼 더해서 씁니다.
 # ----- API Configurations -----
 
 
@@ -49,6 +141,26 @@ SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 # ----- 메모리 백엔드 서버 주소 -----
 # 로컬에서 실행 중인 FastAPI 서버의 주소입니다.
 MEMORY_API_URL = "http://127.0.0.1:8000/process_chat/"
+# 백엔드와 주고받는 본문 형식. "auto"면 msgpack이 설치되어 있을 때 msgpack, 아니면 JSON을 씁니다.
+MEMORY_WIRE_FORMAT = os.getenv("MEMORY_WIRE_FORMAT", "auto")
+MEMORY_WIRE_GZIP_MIN_BYTES = 64 * 1024  # 요청 본문이 이보다 크면 gzip으로 보냅니다. 0이면 압축하지 않음
+# 봇이 답한 뒤(그리고 유저가 입력 중일 때) 다음 턴의 요약/기억 선택을 백엔드에 미리 시켜 둡니다.
+MEMORY_PREPARE_URL = "http://127.0.0.1:8000/prepare_context/"
+PREPARE_NEXT_CONTEXT = True
+PREPARE_ON_TYPING = True
+# 메모리 백엔드를 부르는 방식. "http"는 따로 띄운 FastAPI 서버(MEMORY_API_URL)로 보내고, "inprocess"는 봇 프로세스 안에서
+# risu_memory_backend.service를 바로 부릅니다. (직렬화/HTTP 왕복/검증 없음. 서버 한 대에서 샤드 하나로 돌릴 때)
+# in-process 모드에서는 아래 ChromaDB 폴더를 봇이 직접 엽니다. 같은 폴더를 쓰는 백엔드 서버는 함께 띄우지 마세요.
+MEMORY_BACKEND_MODE = os.getenv("MEMORY_BACKEND_MODE", "http")
+MEMORY_DB_PATH = os.path.join(current_dir, "RisuMemoryBackend", "risu_memory_db")
+
+# ----- Gemini 호출 한도 -----
+# 봇, 메모리 백엔드(http 모드), 샤드 프로세스는 API 키 하나의 한도를 나눠 씁니다. 한도는 이 파일이 아니라 모든 프로세스가
+# 같은 환경 변수에서 읽습니다. (.env에 적으면 봇은 위의 load_dotenv로, 백엔드는 띄울 때 환경으로 받음)
+#   GEMINI_RATE_LIMITS="gemini-flash-latest=60/10,text-embedding-004=1500/50"  모델별 분당 요청 수/버스트
+#   GEMINI_RATE_REDIS_URL=redis://...  모든 프로세스가 Redis 버킷 하나를 씁니다. (대화 응답 우선도 프로세스 사이에 지켜짐)
+#   GEMINI_RATE_SHARE=0.6  Redis 없이 여러 프로세스를 띄우면 프로세스마다 따로 세므로, 각자 몫을 주어 합이 1을 넘지 않게 합니다.
+# 자세한 형식은 RisuMemoryBackend/risu_memory_backend/rate_governor.py의 get_governor를 보세요.
 
 # ----- 모든 키가 제대로 로드되었는지 확인 (선택 사항) -----
 if not all([DISCORD_BOT_TOKEN, GEMINI_API_KEY, OPENWEATHER_API, SERPAPI_API_KEY]):
@@ -1,122 +1,230 @@
 import discord
 from discord.ext import commands, tasks
-import os
+import asyncio
 import logging
-import json
-import uuid
 import base64
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 import httpx
-import google.generativeai as genai
-import google.ai.generativelanguage as glm
-import redis # <--- 추가
-
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0)
-    redis_client.ping() # 연결 테스트
-    logging.info("Redis에 성공적으로 연결되었습니다.")
-except redis.exceptions.ConnectionError as e:
-    logging.error(f"Redis 연결 실패: {e}. 이미지 기억 기능이 비활성화됩니다.")
-    redis_client = None
+# google.generativeai / glm / redis는 무거워서 on_ready의 initialize_services()나 처음 쓰는 함수 안에서 불러옵니다.
 
 # config.py에서 모든 설정을 가져옵니다.
 from config import (
-    DISCORD_BOT_TOKEN, MEMORY_API_URL, GEMINI_API_KEY,
-    SYSTEM_INSTRUCTION, OPENWEATHER_API, SERPAPI_API_KEY,
-    JEBI_KEYWORDS  # <--- 추가됨: 키워드 목록 임포트
+    DISCORD_BOT_TOKEN, MEMORY_API_URL, MEMORY_WIRE_FORMAT, MEMORY_WIRE_GZIP_MIN_BYTES, GEMINI_API_KEY,
+    MEMORY_PREPARE_URL, PREPARE_NEXT_CONTEXT, PREPARE_ON_TYPING, MEMORY_BACKEND_MODE, MEMORY_DB_PATH,
+    OPENWEATHER_API, SERPAPI_API_KEY, MODEL_NAME,
+    PERSONAS, DEFAULT_PERSONA, PERSONA_SELECTION_PATH, MODEL_POOL_SIZE,
+    PERSONA_CONTEXT_CACHE_MIN_TOKENS, PERSONA_CONTEXT_CACHE_TTL,
+    JEBI_KEYWORDS,  # <--- 추가됨: 키워드 목록 임포트
+    MAX_CONTEXT_TOKENS, SHORT_TERM_MAX_MESSAGES, SHORT_TERM_MAX_TOKENS, ARCHIVE_DIR,
+    SESSION_DIR, INACTIVE_SESSION_TIMEOUT, MAX_RESIDENT_SESSIONS, GATE_RESPOND_THRESHOLD,
+    GUILD_KEYWORDS, PERSONA_KEYWORDS,
+    IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_TTL_SECONDS,
+    BLOB_DIR, BLOB_DISK_MAX_BYTES, BLOB_MEMORY_MAX_BYTES,
+    METRICS_HOST, METRICS_PORT,
+    SHARD_COUNT, SHARD_IDS, SHARED_STATE, REDIS_URL, TURN_LOCK_TTL_SECONDS, TURN_LOCK_WAIT_SECONDS,
+    IMAGE_SHARED_TTL_SECONDS, IMAGE_MAX_INLINE, IMAGE_TOKEN_RATIO, IMAGE_CAPTIONS, IMAGE_CAPTION_PROMPT,
+    IMAGE_CAPTION_MAX_CHARS, TRAFFIC_CAPTURE_PATH, TRAFFIC_CAPTURE_SALT,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_MAX_SCOPES,
+    ANSWER_CACHE_TOOL_POLICIES
 )
+from answer_cache import AnswerCache, ToolPolicy, normalize_question
+from chat_history import ChatHistoryWindow, ChatRecord
+from session_manager import RedisSessionStore, SessionManager
+from turn_lock import TurnLocks, TurnLockTimeout
+from traffic_capture import TrafficCapture, note, note_add, note_tool, stage
+from message_gate import MessageGate
+from keyword_matcher import KeywordMatcherRegistry
+from model_pool import ModelPool, PersonaSelector
+from gemini_sessions import GeminiSessionCache
+from image_pipeline import preprocess_image, content_key, estimate_image_tokens, fitted_size, image_size, IMAGE_KEY_PREFIX
+from blob_store import Blob, DiskTier, MemoryTier, RedisTier, TieredBlobStore
+from risu_memory_backend.rate_governor import Priority, get_governor
+from risu_memory_backend import wire
+from risu_memory_backend.metrics import (CACHE_LOOKUPS, TOKENS, TOOL_CALLS, TURN_INPUT_TOKENS, registry, span, start_metrics_server,
+                                         timed)
 # utils.py에서 실제 실행할 함수들을 가져옵니다.
 from utils import get_uptime, get_weather, search_web
 
+# ----- 이미지 저장소 -----
+# Redis(없으면 프로세스 메모리 LRU)를 핫 티어로, 로컬 디스크를 콜드 티어로 쓰는 2단 저장소입니다.
+# Redis 연결은 on_ready에서 하므로 그 전까지는 메모리 티어를 씁니다. (디스크 티어에도 저장되므로 잃는 이미지는 없음)
+redis_client = None
+image_store = TieredBlobStore(MemoryTier(BLOB_MEMORY_MAX_BYTES), DiskTier(BLOB_DIR, BLOB_DISK_MAX_BYTES))
+
 # ----- 기본 설정 -----
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='괦뚫쉙렋', intents=intents)
+# 서버가 많아지면 샤드를 나눕니다. SHARD_IDS가 있으면 이 프로세스는 그 샤드들만 맡습니다. (config.py 참고)
+bot = commands.AutoShardedBot(command_prefix='괦뚫쉙렋', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 start_time = datetime.now(timezone.utc)
 
 # --- 키워드 필터링을 위한 전처리 ---
-# 모든 키워드를 소문자로 변환하여 저장 (대소문자 구분 없이 인식하기 위함)
-LOWER_JEBI_KEYWORDS = {k.lower() for k in JEBI_KEYWORDS}
-
-
-def should_respond(message_content: str) -> bool:
-    """메시지 내용에 응답 키워드가 포함되어 있는지 확인합니다."""
-    content = message_content.lower()
-    for keyword in LOWER_JEBI_KEYWORDS:
-        if keyword in content:
-            return True
-    return False
+# LLM을 부르기 전에 단어 경계를 지킨 키워드, 멘션/답장 여부로 응답할지 로컬에서 먼저 판단합니다.
+keyword_matchers = KeywordMatcherRegistry(JEBI_KEYWORDS, GUILD_KEYWORDS, PERSONA_KEYWORDS)
+message_gate = MessageGate(keyword_matchers, threshold=GATE_RESPOND_THRESHOLD)
+
+
+def should_respond(message) -> bool:
+    """메시지가 봇을 부르는 것인지 로컬 게이트로 판단합니다."""
+    reference = message.reference.resolved if message.reference else None
+    decision = message_gate.evaluate(
+        message.content,
+        mentioned=bot.user in message.mentions,
+        replied_to_bot=isinstance(reference, discord.Message) and reference.author == bot.user,
+        has_image=any(a.content_type and a.content_type.startswith("image/") for a in message.attachments),
+        guild_id=message.guild.id if message.guild else None,
+        persona=resolve_persona(message),
+    )
+    if not decision.respond and decision.reasons:
+        logging.info(f"게이트에서 응답 생략 (점수 {decision.score}, {decision.reasons})")
+    return decision.respond
 
 
 # --- 여기까지 추가/수정 ---
 
 # ----- Tools (함수) 정의 -----
-tools = [
-    glm.Tool(function_declarations=[
-        glm.FunctionDeclaration(
-            name="get_weather",
-            description="특정 도시의 현재 날씨 정보를 가져옵니다.",
-            parameters=glm.Schema(type=glm.Type.OBJECT, properties={
-                "city": glm.Schema(type=glm.Type.STRING, description="날씨 정보를 가져올 도시 이름 (영어로)")}, required=["city"]),
-        ),
-        glm.FunctionDeclaration(
-            name="get_uptime",
-            description="봇의 현재 가동 시간을 알려줍니다.",
-        ),
-        glm.FunctionDeclaration(
-            name="search_web",
-            description="최신 정보나 특정 주제에 대해 웹에서 검색합니다.",
-            parameters=glm.Schema(type=glm.Type.OBJECT,
-                                  properties={"query": glm.Schema(type=glm.Type.STRING, description="검색할 내용")},
-                                  required=["query"]),
-        ),
-    ])
-]
 available_functions = {
     "get_weather": get_weather,
     "get_uptime": get_uptime,
     "search_web": search_web,
 }
 
+
+def build_tools() -> list:
+    import google.ai.generativelanguage as glm
+    return [
+        glm.Tool(function_declarations=[
+            glm.FunctionDeclaration(
+                name="get_weather",
+                description="특정 도시의 현재 날씨 정보를 가져옵니다.",
+                parameters=glm.Schema(type=glm.Type.OBJECT, properties={
+                    "city": glm.Schema(type=glm.Type.STRING, description="날씨 정보를 가져올 도시 이름 (영어로)")}, required=["city"]),
+            ),
+            glm.FunctionDeclaration(
+                name="get_uptime",
+                description="봇의 현재 가동 시간을 알려줍니다.",
+            ),
+            glm.FunctionDeclaration(
+                name="search_web",
+                description="최신 정보나 특정 주제에 대해 웹에서 검색합니다.",
+                parameters=glm.Schema(type=glm.Type.OBJECT,
+                                      properties={"query": glm.Schema(type=glm.Type.STRING, description="검색할 내용")},
+                                      required=["query"]),
+            ),
+        ])
+    ]
+
+
 # ----- Google Gemini API 클라이언트 설정 -----
-generation_model = None
-try:
-    if GEMINI_API_KEY:
-        genai.configure(api_key=GEMINI_API_KEY)
-        generation_model = genai.GenerativeModel(
-            'gemini-flash-latest',
-            system_instruction=SYSTEM_INSTRUCTION,
-            tools=tools
-        )
-        logging.info("Gemini API 클라이언트가 페르소나 및 모든 도구와 함께 설정되었습니다.")
+# 페르소나별 GenerativeModel은 풀에 한 번만 만들어 두고 채널마다 골라 씁니다. 풀은 on_ready에서 만듭니다.
+model_pool = None
+
+
+def initialize_gemini():
+    """google.generativeai를 불러오고 모델 풀을 만듭니다. 임포트가 느리므로 워커 스레드에서 부릅니다."""
+    global model_pool
+    try:
+        if GEMINI_API_KEY:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            model_pool = ModelPool(PERSONAS, {"default": build_tools()}, MODEL_POOL_SIZE,
+                                   PERSONA_CONTEXT_CACHE_MIN_TOKENS, PERSONA_CONTEXT_CACHE_TTL)
+            logging.info("Gemini API 클라이언트가 설정되었습니다. 페르소나 모델은 풀에서 관리됩니다.")
+        else:
+            logging.warning("경고: config.py에 GEMINI_API_KEY가 설정되지 않았습니다.")
+    except Exception as e:
+        logging.error(f"Gemini API 설정 중 오류 발생: {e}")
+
+
+def connect_redis():
+    """Redis에 연결되면 이미지 저장소의 핫 티어를 Redis로 바꿉니다. 연결 대기 중 이벤트 루프를 막지 않도록 스레드에서 부릅니다.
+
+    SHARED_STATE가 "redis"면 단기기억 저장소와 유저별 턴 잠금도 Redis로 옮겨, 어느 샤드 프로세스가 받든 같은 기록을 봅니다.
+    """
+    global redis_client
+    try:
+        import redis
+        client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=2)
+        client.ping()  # 연결 테스트
+    except Exception as e:
+        if SHARED_STATE == "redis":
+            logging.error(f"Redis 연결 실패: {e}. 공유 상태 없이 이 프로세스의 단기기억만 씁니다. "
+                          f"다른 샤드 프로세스와 같은 유저의 기록이 어긋날 수 있습니다.")
+        else:
+            logging.error(f"Redis 연결 실패: {e}. 이미지는 메모리 캐시와 디스크 저장소만 사용합니다.")
+        return
+    redis_client = client
+    if SHARED_STATE == "redis":
+        image_store.hot = RedisTier(client, IMAGE_SHARED_TTL_SECONDS, sliding=True)
+        chat_sessions.store = RedisSessionStore(client)
+        turn_locks.client = client
+        logging.info(f"Redis에 연결되었습니다. 단기기억/턴 잠금/이미지를 다른 샤드 프로세스와 공유합니다. (샤드 {SHARD_IDS or '전체'})")
     else:
-        logging.warning("경고: config.py에 GEMINI_API_KEY가 설정되지 않았습니다.")
-except Exception as e:
-    logging.error(f"Gemini API 설정 중 오류 발생: {e}")
+        image_store.hot = RedisTier(client, IMAGE_TTL_SECONDS)
+        logging.info("Redis에 성공적으로 연결되었습니다.")
+
+
+services_ready = False
+
+
+async def initialize_services():
+    """무거운 초기화(Gemini 모델 풀, Redis 연결)를 스레드에서 동시에 합니다. on_ready가 다시 불려도 한 번만 합니다."""
+    global services_ready
+    if services_ready:
+        return
+    services_ready = True
+    started = datetime.now(timezone.utc)
+    await asyncio.gather(asyncio.to_thread(initialize_gemini), asyncio.to_thread(connect_redis),
+                         *([warm_memory_service()] if MEMORY_BACKEND_MODE == "inprocess" else []))
+    # 세션 관리자를 건드리므로 이벤트 루프에서 실행 (예전 파일이 없으면 바로 끝남).
+    # 공유 상태라면 Redis 저장소로 옮겨지도록 Redis 연결 뒤에 합니다.
+    load_memory_from_disk()
+    if model_pool:
+        await model_pool.warm(persona_selector.selected_personas(), MODEL_NAME)
+    logging.info(f"서비스 초기화 완료 ({(datetime.now(timezone.utc) - started).total_seconds():.2f}s)")
+
+
+persona_selector = PersonaSelector(PERSONAS, DEFAULT_PERSONA, PERSONA_SELECTION_PATH)
+
+
+def resolve_persona(message) -> str:
+    return persona_selector.resolve(message.guild.id if message.guild else None, message.channel.id)
+
 
 # ----- 비휘발성 단기기억 관리 -----
-MEMORY_FILE_PATH = "bot_short_term_memory.json"
-user_chat_histories = {}  # 유저별 대화 기록 (이미지 포함 단기기억)
+MEMORY_FILE_PATH = "bot_short_term_memory.json"  # 예전 통합 저장 파일 (시작 시 세션 폴더로 옮겨짐)
+
 
+def new_history_window(user_name: str) -> ChatHistoryWindow:
+    return ChatHistoryWindow(user_name, SHORT_TERM_MAX_MESSAGES, SHORT_TERM_MAX_TOKENS, ARCHIVE_DIR)
 
+
+# 유저별 대화 기록 창 (이미지 포함 단기기억). 유휴 세션은 디스크로 내보내고 다음 메시지에서 다시 불러옵니다.
+# 유저별 Gemini ChatSession 캐시. 세션이 유휴로 내보내질 때 함께 버립니다.
+gemini_sessions = GeminiSessionCache()
+chat_sessions = SessionManager(new_history_window, SESSION_DIR, INACTIVE_SESSION_TIMEOUT, MAX_RESIDENT_SESSIONS,
+                               on_evict=gemini_sessions.discard)
+# 한 유저의 턴은 한 번에 하나씩 처리합니다. 공유 상태면 connect_redis()가 Redis 잠금으로 바꿔 샤드 프로세스 사이에도 적용됩니다.
+turn_locks = TurnLocks(ttl_seconds=TURN_LOCK_TTL_SECONDS, wait_seconds=TURN_LOCK_WAIT_SECONDS)
+
+
+@timed("bot", "save")
 def save_memory_to_disk():
-    """현재 단기기억(대화 기록)을 JSON 파일에 저장합니다."""
+    """변경된 단기기억(대화 기록)을 유저별 JSON 파일에 저장합니다."""
     try:
-        with open(MEMORY_FILE_PATH, "w", encoding="utf-8") as f:
-            json.dump(user_chat_histories, f, ensure_ascii=False, indent=4)
-        logging.info(f"단기 기억을 '{MEMORY_FILE_PATH}'에 저장했습니다.")
+        chat_sessions.save_all()
+        logging.info(f"단기 기억을 '{SESSION_DIR}'에 저장했습니다.")
     except Exception as e:
         logging.error(f"단기 기억 저장 중 오류: {e}")
 
 
 def load_memory_from_disk():
-    """JSON 파일에서 단기기억(대화 기록)을 불러옵니다."""
-    global user_chat_histories
+    """예전 통합 JSON 파일이 남아 있으면 유저별 세션 파일로 옮깁니다. 세션 자체는 필요할 때 불러옵니다."""
     try:
-        if os.path.exists(MEMORY_FILE_PATH):
-            with open(MEMORY_FILE_PATH, "r", encoding="utf-8") as f:
-                user_chat_histories = json.load(f)
-            logging.info(f"'{MEMORY_FILE_PATH}'에서 단기 기억을 불러왔습니다.")
+        # 창 크기를 넘는 예전 기록은 옮기는 시점에 바로 보관 폴더로 옮겨집니다.
+        chat_sessions.load_legacy_file(MEMORY_FILE_PATH)
     except Exception as e:
         logging.error(f"단기 기억 로딩 중 오류: {e}")
 
@@ -126,12 +234,44 @@ async def periodic_save_task():
     save_memory_to_disk()
 
 
+@tasks.loop(minutes=1)
+async def session_eviction_task():
+    chat_sessions.evict_idle()
+
+
+@tasks.loop(minutes=5)
+async def model_warm_task():
+    # 새로 선택된 페르소나나 만료가 가까운 컨텍스트 캐시를 핫 패스 밖에서 미리 준비합니다.
+    await model_pool.warm(persona_selector.selected_personas(), MODEL_NAME)
+
+
+# ----- 지표 -----
+# 다른 모듈이 이미 세고 있는 값은 /metrics를 읽을 때 가져옵니다.
+registry.collect("risu_image_store_reads", "이미지 저장소 조회 결과 누적 수", lambda: image_store.counters, "result")
+registry.collect("risu_gemini_sessions", "Gemini 세션 재사용/재생성 누적 수", gemini_sessions.stats, "kind")
+registry.collect("risu_gate_messages", "응답 게이트 판단 누적 수", lambda: message_gate.counters, "kind")
+registry.collect("risu_chat_sessions", "단기기억 세션 상태", chat_sessions.stats, "kind")
+registry.collect("risu_turn_locks", "유저별 턴 잠금 누적 수", lambda: turn_locks.counters, "kind")
+metrics_server = None
+
+
 # ----- Discord 이벤트 핸들러 -----
 
 @bot.event
 async def on_ready():
-    load_memory_from_disk()
-    periodic_save_task.start()
+    await initialize_services()
+    if not periodic_save_task.is_running():
+        periodic_save_task.start()
+        session_eviction_task.start()
+    if model_pool and not model_warm_task.is_running():
+        model_warm_task.start()
+    global metrics_server
+    if METRICS_PORT and registry.enabled and metrics_server is None:  # on_ready는 재연결 때마다 다시 불립니다.
+        try:
+            # 한 호스트에 샤드 프로세스가 여럿이면 포트가 겹치지 않게 맡은 첫 샤드 번호만큼 더합니다.
+            metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT + (SHARD_IDS[0] if SHARD_IDS else 0))
+        except OSError as e:
+            logging.error(f"지표 서버 시작 실패: {e}")
     logging.info(f'{bot.user.name} 온라인! 모든 기억이 로드되었습니다.')
 
 
@@ -139,6 +279,17 @@ async def on_ready():
 async def on_close():
     logging.info("봇이 종료됩니다. 마지막으로 기억을 저장합니다...")
     save_memory_to_disk()
+    if memory_client is not None:
+        await memory_client.aclose()
+
+
+@bot.event
+async def on_typing(channel, user, when):
+    # 유저가 입력하기 시작하면 (답이 끝난 뒤 준비를 못 했거나 기록이 바뀐 경우를 위해) 다음 턴을 미리 준비합니다.
+    if not PREPARE_ON_TYPING or user.bot or turn_locks.is_held(user.name):
+        return
+    guild = getattr(channel, "guild", None)
+    schedule_prepare(user.name, persona_selector.resolve(guild.id if guild else None, channel.id))
 
 
 @bot.event
@@ -147,7 +298,7 @@ async def on_message(message):
     if not message.content.strip() and not message.attachments: return
 
     # --- 수정된 키워드 필터링 로직 ---
-    if not message.content.startswith(bot.command_prefix) and should_respond(message.content):
+    if not message.content.startswith(bot.command_prefix) and should_respond(message):
         await process_chat_message(message)
     # --- 여기까지 수정 ---
 
@@ -158,97 +309,418 @@ async def on_message(message):
 
 # ----- 핵심 대화 처리 로직 (과제 1: Redis 이미지 기억 적용) -----
 
+memory_client = None
+memory_wire_format = wire.choose_format(MEMORY_WIRE_FORMAT)
+
+
+def get_memory_client() -> httpx.AsyncClient:
+    """메모리 백엔드용 httpx 클라이언트. 매 턴 새로 만들지 않고 연결을 재사용합니다."""
+    global memory_client
+    if memory_client is None:
+        memory_client = httpx.AsyncClient(timeout=120.0)
+    return memory_client
+
+
+def body_not_understood(response: httpx.Response) -> bool:
+    """백엔드가 본문 형식 자체를 읽지 못했다는 응답인지. (요청 내용의 검증 오류와 구분합니다)
+
+    415이거나, 현재 백엔드의 400 "Could not decode request body", 예전 백엔드(FastAPI 기본 본문 해석)의
+    본문 전체(loc == ["body"])에 대한 JSON 해석/객체 타입 오류일 때만 그렇게 봅니다.
+    """
+    if response.status_code == 415:
+        return True
+    if response.status_code not in (400, 422):
+        return False
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        return False
+    if isinstance(detail, str):
+        return detail.startswith("Could not decode request body") or "error parsing the body" in detail
+    return isinstance(detail, list) and any(
+        isinstance(error, dict) and error.get("loc") == ["body"]
+        and error.get("type") in ("json_invalid", "model_attributes_type", "dict_type", "value_error.jsondecode")
+        for error in detail)
+
+
+async def post_to_memory_backend(payload: dict, url: str = MEMORY_API_URL) -> dict:
+    """대화 기록을 백엔드에 보내고 응답을 돌려줍니다. msgpack을 모르는 예전 백엔드면 JSON으로 바꿔 다시 보냅니다."""
+    global memory_wire_format
+    body, headers = wire.encode_body(payload, memory_wire_format, MEMORY_WIRE_GZIP_MIN_BYTES)
+    response = await get_memory_client().post(url, content=body, headers=headers)
+    if memory_wire_format != wire.JSON and body_not_understood(response):
+        logging.warning(f"백엔드가 {memory_wire_format} 본문을 받지 않아 JSON으로 바꿉니다. ({response.status_code})")
+        memory_wire_format = wire.JSON
+        return await post_to_memory_backend(payload, url)
+    response.raise_for_status()
+    return wire.decode_body(response.content, response.headers.get("content-type"))
+
+
+# in-process 모드: 백엔드 서버 대신 같은 프로세스에서 risu_memory_backend.service를 부릅니다.
+# 처음 쓸 때(또는 initialize_services에서) 불러오므로 http 모드에서는 tiktoken/ChromaDB를 불러오지 않습니다.
+memory_service = None
+
+
+def get_memory_service():
+    global memory_service
+    if memory_service is None:
+        from risu_memory_backend import service
+        service.configure(db_path=MEMORY_DB_PATH)
+        memory_service = service
+    return memory_service
+
+
+async def warm_memory_service():
+    if SHARD_IDS:
+        logging.warning("in-process 모드에서는 샤드 프로세스마다 ChromaDB를 따로 엽니다. 여러 프로세스로 나눌 때는 http 모드를 쓰세요.")
+    try:
+        await get_memory_service().warm_up()
+        logging.info("메모리 백엔드를 in-process 모드로 준비했습니다.")
+    except Exception as e:
+        logging.error(f"in-process 메모리 백엔드 초기화 실패 (첫 턴에서 다시 시도): {e}")
+
+
+async def process_with_memory_backend(payload: dict) -> dict:
+    """설정(MEMORY_BACKEND_MODE)에 따라 백엔드 서버로 보내거나 같은 프로세스에서 처리합니다. 돌려주는 값은 같습니다."""
+    if MEMORY_BACKEND_MODE == "inprocess":
+        service = get_memory_service()
+        return await service.process_chat(payload["messages"], service.ChatOptions.from_payload(payload))
+    return await post_to_memory_backend(payload)
+
+
+async def prepare_with_memory_backend(payload: dict) -> dict:
+    if MEMORY_BACKEND_MODE == "inprocess":
+        service = get_memory_service()
+        return service.prepare_context(payload["messages"], service.ChatOptions.from_payload(payload))
+    return await post_to_memory_backend(payload, MEMORY_PREPARE_URL)
+
+
+def build_gemini_message(processed_msg, history):
+    """백엔드가 돌려준 메시지 하나를 Gemini 메시지로 만듭니다. 이미지는 이미지 저장소에서 다시 불러옵니다."""
+    import google.ai.generativelanguage as glm
+    memo, gemini_parts = processed_msg.get("memo"), []
+    if processed_msg.get("content"): gemini_parts.append(glm.Part(text=processed_msg["content"]))
+
+    original_msg = history.get(memo)
+    # 백엔드가 이미지 예산 때문에 뺀 오래된 이미지는 content에 붙은 캡션으로 대신합니다.
+    if original_msg and original_msg.image_key and not processed_msg.get("image_dropped"):
+        image_key = original_msg.image_key
+        image_bytes = None
+        if image_key.startswith(IMAGE_KEY_PREFIX):
+            with span("bot", "image_fetch"):
+                blob = image_store.get(image_key)
+            image_bytes = blob.data if blob else None
+        elif redis_client:  # 예전 형식 (image:{user_id}:{memo} 키에 base64 문자열)
+            with span("bot", "image_fetch"):
+                image_base64_bytes = redis_client.get(image_key)  # Redis 응답은 bytes
+            image_bytes = base64.b64decode(image_base64_bytes) if image_base64_bytes else None
+
+        if image_bytes:
+            gemini_parts.append(glm.Part(inline_data=glm.Blob(
+                mime_type=original_msg.mime_type,
+                data=image_bytes
+            )))
+            logging.info(f"이미지 로드 성공: {image_key}")
+
+    if not gemini_parts:
+        return None
+    return {"role": "model" if processed_msg["role"] == "assistant" else "user", "parts": gemini_parts}
+
+
+def build_memory_payload(history, user_name: str, persona: str) -> dict:
+    return {
+        "messages": history.text_only(), "memory_type": "hypa",
+        # 페르소나 지시문이 차지하는 토큰만큼 대화 기록에 쓸 예산을 줄입니다.
+        "max_context_tokens": max(1024, MAX_CONTEXT_TOKENS - model_pool.instruction_tokens.get(persona, 0))
+        if model_pool else MAX_CONTEXT_TOKENS,
+        "character_name": bot.user.name, "room_data": {},
+        "conversation_id": user_name,  # 백필한 요약과 같은 대화로 묶이도록 유저 이름을 씁니다.
+        "max_images": IMAGE_MAX_INLINE, "image_token_ratio": IMAGE_TOKEN_RATIO
+    }
+
+
+# 다음 턴 미리 준비: 유저별로 마지막으로 준비를 부탁한 기록의 마지막 memo (같은 기록으로 두 번 보내지 않음)
+prepared_memos = {}
+background_tasks = set()
+
+
+def schedule_prepare(user_name: str, persona: str):
+    """다음 턴의 요약/기억 선택을 백엔드에 미리 시킵니다. 응답을 기다리지 않으며 실패해도 다음 턴은 평소대로 처리됩니다."""
+    history = chat_sessions.peek(user_name)  # 최근에 대화한 유저만 (입력 중 이벤트로 세션을 불러오지 않음)
+    if history is None or history.last() is None:
+        return
+    last_memo = history.last().memo
+    if prepared_memos.get(user_name) == last_memo:
+        return
+    prepared_memos[user_name] = last_memo
+    payload = build_memory_payload(history, user_name, persona)
+
+    async def send():
+        try:
+            await prepare_with_memory_backend(payload)
+        except Exception as e:
+            logging.debug(f"다음 턴 미리 준비 요청 실패: {e}")
+
+    task = asyncio.create_task(send())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+@timed("bot", "gemini")
+async def send_to_gemini(chat_session, content):
+    """대화 응답은 요약/임베딩보다 먼저 처리되도록 공용 호출 조정자를 거쳐 보냅니다. 429면 백오프 후 재시도합니다."""
+    with stage("gemini"):
+        response = await get_governor().call(MODEL_NAME, Priority.INTERACTIVE,
+                                             lambda: chat_session.send_message_async(content))
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        note_add(g_in=usage.prompt_token_count, g_out=usage.candidates_token_count)
+        TOKENS.inc(usage.prompt_token_count, component="gemini", direction="in")
+        TOKENS.inc(usage.candidates_token_count, component="gemini", direction="out")
+    return response
+
+
+def report_input_tokens(user_name: str, memory_response: dict, response):
+    """이번 턴의 입력 토큰을 백엔드 추정치(글+이미지)와 Gemini가 센 값으로 나란히 남깁니다.
+
+    Gemini 값에는 페르소나 지시문과 도구 선언이 더 들어 있으므로 둘의 차이가 일정한지를 봅니다.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    actual = usage.prompt_token_count if usage else None
+    if actual:
+        TURN_INPUT_TOKENS.observe(actual, component="bot", source="gemini")
+    logging.info(f"[{user_name}] 입력 토큰: 백엔드 추정 {memory_response.get('final_tokens')} "
+                 f"(이미지 {memory_response.get('image_tokens', 0)}), Gemini {actual}")
+
+
+# ----- 이미지 캡션 -----
+# 백엔드는 오래된 이미지를 빼고 캡션으로 대신합니다. 캡션은 이미지 키별로도 보관해 같은 사진을 다시 설명하지 않습니다.
+image_captions = OrderedDict()
+IMAGE_CAPTION_CACHE_SIZE = 1024
+caption_model = None
+
+
+def schedule_caption(record: ChatRecord):
+    caption = image_captions.get(record.image_key)
+    if caption is not None:
+        record.caption = caption
+        return
+    task = asyncio.create_task(caption_image(record))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def caption_image(record: ChatRecord):
+    """이미지 설명을 만들어 기록에 붙입니다. 답변보다 뒤로 밀리도록 BACKGROUND 우선순위로 부르고, 실패하면 캡션 없이 둡니다."""
+    global caption_model
+    import google.generativeai as genai
+    blob = image_store.get(record.image_key)
+    if blob is None:
+        return
+    if caption_model is None:
+        caption_model = genai.GenerativeModel(MODEL_NAME)
+    try:
+        with span("bot", "image_caption"):
+            response = await get_governor().call(MODEL_NAME, Priority.BACKGROUND, lambda: caption_model.generate_content_async(
+                [IMAGE_CAPTION_PROMPT, {"mime_type": blob.mime_type, "data": blob.data}]))
+        caption = " ".join(response.text.split())[:IMAGE_CAPTION_MAX_CHARS]
+    except Exception as e:
+        logging.warning(f"이미지 캡션 생성 실패 ({record.image_key}): {e}")
+        return
+    record.caption = caption
+    image_captions[record.image_key] = caption
+    while len(image_captions) > IMAGE_CAPTION_CACHE_SIZE:
+        image_captions.popitem(last=False)
+
+
+# ----- 답변 캐시 (선택) -----
+answer_cache = AnswerCache({name: ToolPolicy(*policy) for name, policy in ANSWER_CACHE_TOOL_POLICIES.items()},
+                           ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES,
+                           max_scopes=ANSWER_CACHE_MAX_SCOPES) if ANSWER_CACHE_ENABLED else None
+if answer_cache is not None:
+    registry.collect("risu_answer_cache", "답변 캐시 조회/보관 누적 수와 아낀 시간(초)", answer_cache.stats, "kind")
+
+
+def answer_cache_scope(message, persona: str) -> str:
+    """답변 캐시를 나누는 범위. 다른 서버/채널에서 한 답(그 자리의 맥락이 들어갈 수 있음)을 꺼내지 않게 합니다."""
+    return f"{message.guild.id if message.guild else 'dm'}:{message.channel.id}:{persona}"
+
+
+async def answer_from_cache(scope: str, question: str):
+    """보관된 답이 있으면 돌려줍니다. 결과가 바뀔 수 있는 도구는 같은 인자로 다시 불러 결과가 같을 때만 씁니다."""
+    started = time.perf_counter()
+    entry = answer_cache.lookup(scope, question)
+    if entry is not None and entry.revalidate:
+        try:
+            # 도구(날씨/검색)는 동기 HTTP 호출이므로 이벤트 루프를 막지 않도록 스레드에서 부릅니다.
+            results = [await asyncio.to_thread(run_tool, name, dict(args)) for name, args in entry.tool_calls]
+        except Exception as e:
+            logging.warning(f"답변 캐시 확인 중 도구 오류: {e}")
+            results = None
+        if results is None or not answer_cache.verify(entry, results):
+            entry = None
+    if entry is None:
+        answer_cache.record_miss()
+        CACHE_LOOKUPS.inc(cache="answer", result="miss")
+        return None
+    answer_cache.record_hit(entry, time.perf_counter() - started)
+    CACHE_LOOKUPS.inc(cache="answer", result="hit")
+    logging.info(f"답변 캐시 적중: '{question}' ~ '{entry.question}'")
+    return entry.answer
+
+
+def call_tool(fname: str, args: dict):
+    """모델이 요청한 함수를 실행하고 결과(또는 오류 문구)를 돌려줍니다. 트래픽 기록에 도구 이름을 남깁니다."""
+    if fname in available_functions:
+        note_tool(fname)
+    return run_tool(fname, args)
+
+
+def run_tool(fname: str, args: dict):
+    """도구를 실행만 합니다. 답변 캐시 확인처럼 모델이 요청하지 않은 호출은 트래픽 기록에 남기지 않습니다.
+    (남기면 재생할 때 캐시 적중 턴이 도구를 쓴 턴으로 재현됨)"""
+    if fname not in available_functions:
+        TOOL_CALLS.inc(tool=fname, result="unknown")
+        return "알 수 없는 함수"
+    if fname == "get_weather": args['api_key'] = OPENWEATHER_API
+    with span("tool", fname):
+        try:
+            result = available_functions[fname](**args)
+        except Exception:
+            TOOL_CALLS.inc(tool=fname, result="error")
+            raise
+    TOOL_CALLS.inc(tool=fname, result="ok")
+    return result
+
+
+# 트래픽 기록 (선택): 턴마다 내용 없이 모양만 남깁니다.
+traffic = TrafficCapture(TRAFFIC_CAPTURE_PATH + (f".shard{SHARD_IDS[0]}" if SHARD_IDS else ""),
+                         TRAFFIC_CAPTURE_SALT) if TRAFFIC_CAPTURE_PATH else None
+if traffic is not None:
+    registry.collect("risu_traffic_capture", "트래픽 기록 누적 수", traffic.stats, "kind")
+
+
+@timed("bot", "turn")
 async def process_chat_message(message):
+    if traffic is None:
+        return await handle_chat_message(message)
+    with traffic.turn(message.author.name, message.channel.id, message.content, message.attachments):
+        await handle_chat_message(message)
+
+
+async def handle_chat_message(message):
     user_name = message.author.name
-    user_id = str(message.author.id)  # Redis 키 생성을 위해 user_id 사용
-    message_memo = str(uuid.uuid4())
-    user_message_record = {"role": "user", "content": message.content, "memo": message_memo}
+    user_message_record = ChatRecord.new("user", message.content)
 
-    # 이미지가 있으면 Redis에 저장하고, 대화 기록에는 '키'만 저장합니다.
+    # 이미지가 있으면 줄여서 이미지 저장소에 넣고, 대화 기록에는 '키'만 저장합니다.
     if message.attachments:
         for attachment in message.attachments:
             if attachment.content_type and attachment.content_type.startswith("image/"):
-                if not redis_client:
-                    await message.channel.send("이미지 기억 시스템이 현재 오프라인 상태야.");
-                    return
                 try:
                     image_bytes = await attachment.read()
-                    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-                    # Redis에 저장할 고유 키 생성
-                    image_key = f"image:{user_id}:{message_memo}"
-
-                    # Redis에 (키, 값) 저장 및 만료 시간 설정 (예: 1시간 = 3600초)
-                    redis_client.setex(image_key, 3600, image_base64)
+                    # 원본 해시로 키를 만들어 같은 사진은 한 번만 처리/저장합니다.
+                    image_key = content_key(image_bytes)
+                    # 저장 여부만 확인합니다. (데이터는 읽지 않고, Redis라면 보관 기간을 다시 늘림)
+                    stored_mime_type = image_store.contains(image_key)
+                    CACHE_LOOKUPS.inc(cache="image_dedupe", result="hit" if stored_mime_type else "miss")
+                    if stored_mime_type:
+                        logging.info(f"이미 저장된 이미지를 재사용: {image_key}")
+                        mime_type = stored_mime_type
+                        width, height = fitted_size(*image_size(image_bytes), IMAGE_MAX_EDGE)
+                    else:
+                        with span("bot", "image_ingest"):
+                            processed = await preprocess_image(image_bytes, attachment.content_type,
+                                                               IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY)
+                            mime_type, width, height = processed.mime_type, processed.width, processed.height
+                            image_store.put(image_key, Blob(processed.data, mime_type))
+                        logging.info(f"이미지를 저장: {image_key} ({processed.original_size} -> "
+                                     f"{len(processed.data)} bytes, {processed.width}x{processed.height}, "
+                                     f"{processed.elapsed * 1000:.0f}ms)")
 
                     # 대화 기록에는 이미지 데이터 대신 '키'와 '타입'만 저장
-                    user_message_record["image_key"] = image_key
-                    user_message_record["mime_type"] = attachment.content_type
-                    logging.info(f"이미지를 Redis에 저장: {image_key}")
+                    user_message_record.image_key = image_key
+                    user_message_record.mime_type = mime_type
+                    user_message_record.image_tokens = estimate_image_tokens(width, height, mime_type, IMAGE_MAX_EDGE)
+                    note(img_tok=user_message_record.image_tokens)
+                    if IMAGE_CAPTIONS:
+                        schedule_caption(user_message_record)
                     break
                 except Exception as e:
+                    note(out="image_error")
                     await message.channel.send("이미지를 처리하는 데 실패했어.");
                     return
 
-    if user_name not in user_chat_histories: user_chat_histories[user_name] = []
-    user_chat_histories[user_name].append(user_message_record)
+    try:
+        # 기록을 읽고 응답해서 저장할 때까지 같은 유저의 다른 턴(다른 샤드 프로세스 포함)이 끼어들지 못하게 합니다.
+        lock_started = time.perf_counter()
+        async with turn_locks.hold(user_name):
+            note(lock_ms=round((time.perf_counter() - lock_started) * 1000, 1))
+            await run_turn(message, user_name, user_message_record)
+    except TurnLockTimeout:
+        note(out="lock_timeout")
+        await message.channel.send("앞의 말에 아직 답하는 중이야. 조금 있다가 다시 말해줘.")
+
+
+async def run_turn(message, user_name: str, user_message_record: ChatRecord):
+    """턴 잠금을 쥔 상태에서 기록을 불러와 백엔드와 Gemini를 거쳐 응답하고 저장합니다."""
+    import google.ai.generativelanguage as glm
+    turn_started = time.perf_counter()
+    history = chat_sessions.get(user_name)
+    history.append(user_message_record)
+    persona = resolve_persona(message)
+
+    question = cache_scope = None
+    if answer_cache is not None and not user_message_record.image_key:
+        matcher = keyword_matchers.get(message.guild.id if message.guild else None, persona)
+        question = normalize_question(message.content, matcher.remove)
+        cache_scope = answer_cache_scope(message, persona)
+        cached_answer = await answer_from_cache(cache_scope, question)
+        if cached_answer is not None:
+            # 백엔드와 Gemini를 거치지 않고 답합니다. 기록에는 평소처럼 남겨 다음 턴의 맥락이 이어지게 합니다.
+            note(out="answer_cache", reply=len(cached_answer))
+            await message.channel.send(cached_answer)
+            history.append(ChatRecord.new("assistant", cached_answer))
+            save_memory_to_disk()
+            return
 
-    text_only_history = [{"role": msg["role"], "content": msg["content"], "memo": msg.get("memo")} for msg in
-                         user_chat_histories[user_name]]
-    payload = {
-        "messages": text_only_history, "memory_type": "hypa", "max_context_tokens": 8192,
-        "character_name": bot.user.name, "room_data": {}
-    }
+    payload = build_memory_payload(history, user_name, persona)
 
+    chat_sessions.pin(user_name)  # 처리 도중 유휴/LRU 정리로 내보내지지 않도록 고정
+    chat_session = None
     async with message.channel.typing():
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(MEMORY_API_URL, json=payload)
-                response.raise_for_status()
-            memory_response = response.json()
+            with span("bot", "backend_post"), stage("backend"):
+                memory_response = await process_with_memory_backend(payload)
+            note(bk_in=memory_response.get("final_tokens"), bk_msgs=len(payload["messages"]))
             processed_text_messages = memory_response["processed_messages"]
+            # 백엔드가 장기기억에 요약한 기록만 창에서 내보내 다음 턴에 다시 보내지 않습니다.
+            history.sync_with_backend(memory_response.get("summarized_until"))
 
-            # 최종 Gemini 메시지를 조립할 때, Redis에서 이미지를 다시 불러옵니다.
-            final_gemini_messages = []
-            for processed_msg in processed_text_messages:
-                memo, gemini_parts = processed_msg.get("memo"), []
-                if processed_msg.get("content"): gemini_parts.append(glm.Part(text=processed_msg["content"]))
-
-                if memo:
-                    for original_msg in user_chat_histories[user_name]:
-                        if original_msg.get("memo") == memo and "image_key" in original_msg:
-                            if not redis_client: continue  # Redis가 꺼져있으면 이미지 로드 스킵
-
-                            image_key = original_msg["image_key"]
-                            image_base64_bytes = redis_client.get(image_key)  # Redis 응답은 bytes
-
-                            if image_base64_bytes:
-                                gemini_parts.append(glm.Part(inline_data=glm.Blob(
-                                    mime_type=original_msg["mime_type"],
-                                    data=base64.b64decode(image_base64_bytes)
-                                )))
-                                logging.info(f"Redis에서 이미지 로드 성공: {image_key}")
-                            break  # 해당 memo의 이미지를 찾았으므로 루프 중단
-
-                if gemini_parts:
-                    final_gemini_messages.append(
-                        {"role": "model" if processed_msg["role"] == "assistant" else "user", "parts": gemini_parts})
-
-            if not generation_model:
+            if not model_pool:
                 await message.channel.send("모델이 준비되지 않았어.");
                 return
-
-            chat_session = generation_model.start_chat(history=final_gemini_messages[:-1])
-            final_user_message_for_gemini = final_gemini_messages[-1]['parts'] if final_gemini_messages else []
-            if not final_user_message_for_gemini: return
-            llm_response = await chat_session.send_message_async(final_user_message_for_gemini)
+            generation_model = model_pool.get(persona, MODEL_NAME)
+
+            # 지난 턴의 세션을 이어 쓸 수 있으면 새 메시지만 보내고, 컨텍스트가 바뀌었으면 세션을 다시 만듭니다.
+            with span("bot", "context_build"):
+                chat_session, final_user_message_for_gemini = gemini_sessions.acquire(
+                    user_name, generation_model, processed_text_messages,
+                    lambda processed_msg: build_gemini_message(processed_msg, history))
+            if not final_user_message_for_gemini:
+                gemini_sessions.discard(user_name, chat_session)
+                return
+            llm_response = await send_to_gemini(chat_session, final_user_message_for_gemini)
+            report_input_tokens(user_name, memory_response, llm_response)
 
             # (이하 함수 호출 및 응답 처리 로직은 이전과 동일)
             if not llm_response.candidates or not llm_response.candidates[0].content.parts:
                 logging.info("모델이 응답하지 않기로 결정하여 침묵합니다.")
-                user_chat_histories[user_name].append({"role": "assistant", "content": "", "memo": str(uuid.uuid4())})
+                note(out="silent")
+                history.append(ChatRecord.new("assistant", ""))
+                gemini_sessions.discard(user_name, chat_session)  # 빈 응답이 섞인 세션은 이어 쓰지 않음
                 return
 
+            turn_tools = []  # (도구 이름, 인자, 결과). 답변 캐시에 보관할 때 씁니다.
             while True:
                 response_part = llm_response.candidates[0].content.parts[0]
                 if response_part.function_call:
@@ -257,30 +729,41 @@ async def process_chat_message(message):
                                                                                                                  k, v in
                                                                                                                  response_part.function_call.args.items()}
                     logging.info(f"함수 호출: {fname}({args})")
-                    if fname in available_functions:
-                        if fname == "get_weather": args['api_key'] = OPENWEATHER_API
-                        f_response = available_functions[fname](**args)
-                        llm_response = await chat_session.send_message_async(glm.Part(
-                            function_response=glm.FunctionResponse(name=fname, response={"result": f_response})))
-                    else:
-                        llm_response = await chat_session.send_message_async(glm.Part(
-                            function_response=glm.FunctionResponse(name=fname, response={"result": "알 수 없는 함수"})))
+                    tool_args = dict(args)  # call_tool이 API 키를 넣기 전의 인자
+                    f_response = call_tool(fname, args)
+                    turn_tools.append((fname, tool_args, f_response))
+                    llm_response = await send_to_gemini(chat_session, glm.Part(
+                        function_response=glm.FunctionResponse(name=fname, response={"result": f_response})))
                 else:
                     break
 
             response_text = llm_response.text.strip()
+            note(reply=len(response_text))
             if response_text:
                 await message.channel.send(response_text)
+                if question is not None and turn_tools:
+                    answer_cache.put(cache_scope, question, turn_tools, response_text,
+                                     time.perf_counter() - turn_started)
 
-            user_chat_histories[user_name].append(
-                {"role": "assistant", "content": response_text, "memo": str(uuid.uuid4())})
+            assistant_record = ChatRecord.new("assistant", response_text)
+            history.append(assistant_record)
+            gemini_sessions.commit(user_name, chat_session, assistant_record.memo)
+            chat_session = None
+            if PREPARE_NEXT_CONTEXT:
+                schedule_prepare(user_name, persona)
 
         except httpx.RequestError as e:
+            note(out="backend_error")
             await message.channel.send(f"메모리 서버 연결 실패. 🧠 (에러: {e})")
         except Exception as e:
+            note(out="error")
             await message.channel.send(f"처리 중 오류 발생. 🤯 (에러: {e})")
             logging.error(f"처리 중 오류 발생: {e}", exc_info=True)
         finally:
+            if chat_session is not None:
+                # 턴이 정상적으로 끝나지 않았다면 세션 기록이 어긋났을 수 있으므로 버립니다.
+                gemini_sessions.discard(user_name, chat_session)
+            chat_sessions.unpin(user_name)
             save_memory_to_disk()
 
 # ----- Discord 커맨드 -----
@@ -293,11 +776,86 @@ async def 업타임(ctx):
 @bot.command()
 async def 기억초기화(ctx):
     user_name = ctx.author.name
-    if user_name in user_chat_histories: del user_chat_histories[user_name]
-    save_memory_to_disk()  # 초기화된 상태를 바로 저장
+    async with turn_locks.hold(user_name):
+        chat_sessions.remove(user_name)  # 메모리와 저장소(디스크 또는 Redis)의 기록을 함께 지움
     await ctx.send(f"{user_name}와의 단기 기억을 모두 지웠어. (장기기억은 백엔드 서버에서 별도로 관리돼!)")
 
 
+@bot.command()
+@commands.has_permissions(manage_channels=True)
+async def 페르소나(ctx, name: str = None):
+    """이 채널의 페르소나를 바꿉니다. 이름 없이 부르면 현재 페르소나와 목록을 보여줍니다. '기본'은 선택 해제."""
+    if name is None:
+        await ctx.send(f"지금 페르소나: {resolve_persona(ctx.message)}\n고를 수 있는 것: {', '.join(PERSONAS)}")
+        return
+    if name != "기본" and name not in PERSONAS:
+        await ctx.send(f"'{name}' 같은 페르소나는 없어.")
+        return
+    persona_selector.set_channel(ctx.channel.id, None if name == "기본" else name)
+    if model_pool:
+        await model_pool.warm([resolve_persona(ctx.message)], MODEL_NAME)  # 다음 메시지 전에 모델을 미리 만들어 둠
+    await ctx.send(f"이 채널의 페르소나를 '{resolve_persona(ctx.message)}'(으)로 바꿨어.")
+
+
+@bot.command()
+@commands.has_permissions(manage_guild=True)
+async def 서버페르소나(ctx, name: str):
+    """서버 전체의 기본 페르소나를 바꿉니다. 채널별 선택이 있으면 그쪽이 우선합니다."""
+    if not ctx.guild or (name != "기본" and name not in PERSONAS):
+        await ctx.send("서버 안에서 있는 페르소나 이름으로만 바꿀 수 있어.")
+        return
+    persona_selector.set_guild(ctx.guild.id, None if name == "기본" else name)
+    if model_pool:
+        await model_pool.warm(persona_selector.selected_personas(), MODEL_NAME)
+    await ctx.send(f"서버 기본 페르소나를 '{name}'(으)로 바꿨어.")
+
+
+@페르소나.error
+@서버페르소나.error
+async def persona_command_error(ctx, error):
+    if isinstance(error, commands.MissingPermissions):
+        await ctx.send("페르소나는 채널 관리(서버 페르소나는 서버 관리) 권한이 있어야 바꿀 수 있어.")
+    elif isinstance(error, commands.NoPrivateMessage):
+        await ctx.send("페르소나는 서버 채널에서만 바꿀 수 있어.")
+    else:
+        logging.error(f"페르소나 커맨드 오류: {error}", exc_info=error)
+
+
+@bot.command()
+async def 세션상태(ctx):
+    stats = chat_sessions.stats()
+    await ctx.send(f"상주 세션 {stats['resident']}개, 저장된 세션 {stats['stored']}개, "
+                   f"내보냄 {stats['evictions']}회, 복원 {stats['rehydrations']}회 "
+                   f"(평균 {stats['avg_rehydration_ms']}ms), "
+                   f"Gemini 세션 재사용 {gemini_sessions.reuses}회/재생성 {gemini_sessions.rebuilds}회")
+
+
+@bot.command()
+async def 저장소상태(ctx):
+    stats = image_store.stats()
+    await ctx.send(f"이미지 저장소 ({stats['hot_tier']} + disk): 핫 티어 적중률 {stats['hot_hit_rate'] * 100:.1f}% "
+                   f"(핫 {stats['hot_hits']}, 디스크 {stats['cold_hits']}, 없음 {stats['misses']}), "
+                   f"디스크 {stats['disk_blobs']}개 {stats['disk_mb']}MB")
+
+
+@bot.command()
+async def 답변캐시상태(ctx):
+    if answer_cache is None:
+        await ctx.send("답변 캐시가 꺼져 있어. (ANSWER_CACHE_ENABLED=1)")
+        return
+    stats = answer_cache.stats()
+    await ctx.send(f"답변 캐시: 조회 {stats['lookups']}건, 적중 {stats['hits']}건 (적중률 {stats['hit_rate'] * 100:.1f}%), "
+                   f"결과가 바뀌어 버림 {stats['stale']}건, 대상(숫자/도구 인자)이 달라 건너뜀 {stats['entity_mismatch']}건, "
+                   f"보관 {stats['entries']}개, 아낀 시간 {stats['saved_seconds']}s")
+
+
+@bot.command()
+async def 게이트상태(ctx):
+    c = message_gate.counters
+    await ctx.send(f"판단 {c['evaluated']}건, 응답 {c['passed']}건, 생략 {c['skipped']}건 "
+                   f"(아낀 LLM 호출 {c['llm_calls_avoided']}건)")
+
+
 if __name__ == "__main__":
     if not all([DISCORD_BOT_TOKEN, MEMORY_API_URL, GEMINI_API_KEY, SERPAPI_API_KEY]):
         raise ValueError("필수 API 키가 config.py에 없습니다.")
@@ -0,0 +1,79 @@
+# bot/gemini_sessions.py
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:  # 타입 표시에만 쓰므로 봇 시작 시 google.generativeai를 불러오지 않습니다.
+    import google.generativeai as genai
+
+Signature = Tuple  # 메시지 하나를 식별하는 값 (memo, 또는 memo가 바뀌지 않는 시스템 메시지는 내용 해시 포함)
+
+
+def message_signature(message: Dict) -> Signature:
+    # 백엔드의 요약 메시지는 memo('hypaMemory')가 항상 같으므로 내용까지 비교해야 바뀐 것을 알 수 있습니다.
+    if message.get("role") == "system" or not message.get("memo"):
+        return message.get("role"), message.get("memo"), hash(message.get("content", ""))
+    if message.get("image_dropped"):  # 같은 메시지라도 이미지가 빠지면 내용이 바뀌므로 다른 메시지로 봅니다.
+        return message["memo"], "image_dropped"
+    return (message["memo"],)
+
+
+@dataclass
+class _CachedSession:
+    model: genai.GenerativeModel
+    session: genai.ChatSession
+    signature: List[Signature] = field(default_factory=list)
+    pending: List[Signature] = field(default_factory=list)
+    busy: bool = False
+
+
+class GeminiSessionCache:
+    """유저별 Gemini ChatSession을 유지해 매 턴 전체 기록(이미지 디코딩 포함)을 다시 만들지 않습니다.
+
+    백엔드가 돌려준 컨텍스트가 지난 턴 세션의 기록 뒤에 새 메시지 하나만 붙은 형태면 세션을 그대로 쓰고,
+    요약이 끼어들거나 앞부분이 잘리는 등 컨텍스트가 바뀌었을 때만 세션을 새로 만듭니다.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, _CachedSession] = {}
+        self.reuses = 0
+        self.rebuilds = 0
+
+    def acquire(self, user_name: str, model: genai.GenerativeModel, processed_messages: List[Dict],
+                build_message: Callable[[Dict], Optional[Dict]]) -> Tuple[genai.ChatSession, list]:
+        """이번 턴에 쓸 ChatSession과 새로 보낼 마지막 메시지의 parts를 돌려줍니다."""
+        signature = [message_signature(m) for m in processed_messages]
+        cached = self._sessions.get(user_name)
+        if cached and not cached.busy and cached.model is model and cached.signature == signature[:-1]:
+            last_message = build_message(processed_messages[-1]) if processed_messages else None
+            self.reuses += 1
+            cached.pending, cached.busy = signature, True
+            return cached.session, last_message["parts"] if last_message else []
+
+        gemini_messages = [m for m in (build_message(pm) for pm in processed_messages) if m]
+        session = model.start_chat(history=gemini_messages[:-1])
+        self.rebuilds += 1
+        if cached and cached.busy:
+            # 같은 유저의 이전 턴이 아직 진행 중이면 그 세션은 건드리지 않고 일회용 세션을 씁니다.
+            logging.info(f"'{user_name}'의 Gemini 세션이 사용 중이라 임시 세션을 만듭니다.")
+        else:
+            self._sessions[user_name] = _CachedSession(model, session, pending=signature, busy=True)
+        return session, gemini_messages[-1]["parts"] if gemini_messages else []
+
+    def commit(self, user_name: str, session: genai.ChatSession, assistant_memo: Optional[str]):
+        """응답이 기록에 추가된 뒤 호출합니다. 다음 턴에 이 세션을 이어 쓸 수 있게 됩니다."""
+        cached = self._sessions.get(user_name)
+        if cached and cached.session is session:
+            cached.signature = cached.pending + [(assistant_memo,)]
+            cached.pending, cached.busy = [], False
+
+    def discard(self, user_name: str, session: Optional[genai.ChatSession] = None):
+        """세션을 버립니다. `session`을 주면 그 세션이 캐시된 것일 때만 버립니다."""
+        cached = self._sessions.get(user_name)
+        if cached and (session is None or cached.session is session):
+            del self._sessions[user_name]
+
+    def stats(self) -> Dict:
+        return {"sessions": len(self._sessions), "reuses": self.reuses, "rebuilds": self.rebuilds}
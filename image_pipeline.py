@@ -0,0 +1,114 @@
+# bot/image_pipeline.py
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow가 없으면 원본 그대로 저장합니다.
+    Image = None
+    logging.warning("Pillow가 설치되지 않아 이미지 축소/재인코딩을 건너뜁니다. (pip install pillow)")
+
+IMAGE_KEY_PREFIX = "image:sha256:"
+# Gemini는 두 변이 모두 384px 이하인 이미지를 258토큰으로, 더 큰 이미지는 768px 타일로 잘라 타일마다 258토큰으로 셉니다.
+TOKENS_PER_TILE = 258
+SMALL_IMAGE_EDGE = 384
+
+
+@dataclass
+class ProcessedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_size: int
+    elapsed: float
+
+
+def estimate_image_tokens(width: int, height: int, mime_type: str = "image/jpeg",
+                          fallback_edge: int = 1536) -> int:
+    """이미지 하나가 Gemini 입력에서 차지하는 토큰 수. 크기를 모르면(0) `fallback_edge` 크기의 정사각형으로 봅니다.
+
+    타일 한 변은 짧은 변의 2/3을 256~768px로 맞춘 값입니다. 이미지가 아닌 첨부(PDF 등)는 한 장(258)으로 셉니다.
+    """
+    if not mime_type.startswith("image/"):
+        return TOKENS_PER_TILE
+    if not width or not height:
+        width = height = fallback_edge
+    if width <= SMALL_IMAGE_EDGE and height <= SMALL_IMAGE_EDGE:
+        return TOKENS_PER_TILE
+    tile = min(max(int(min(width, height) / 1.5), 256), 768)
+    return TOKENS_PER_TILE * math.ceil(width / tile) * math.ceil(height / tile)
+
+
+def image_size(data: bytes) -> tuple:
+    """헤더만 읽어 (너비, 높이)를 돌려줍니다. 읽을 수 없으면 (0, 0)."""
+    if Image is None:
+        return 0, 0
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return 0, 0
+
+
+def fitted_size(width: int, height: int, max_edge: int) -> tuple:
+    """긴 변이 `max_edge`를 넘지 않게 비율대로 줄인 크기. (전처리의 thumbnail과 같은 계산, 원본 크기만으로 추정할 때 씀)"""
+    if not width or not height or max(width, height) <= max_edge:
+        return width, height
+    scale = max_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def content_key(data: bytes) -> str:
+    """원본 바이트의 해시로 만든 이미지 키. 같은 사진을 다시 올려도 한 번만 저장됩니다."""
+    return IMAGE_KEY_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+def _process_sync(data: bytes, mime_type: str, max_edge: int, image_format: str, quality: int) -> ProcessedImage:
+    started = time.perf_counter()
+    if Image is None:
+        return ProcessedImage(data, mime_type, 0, 0, len(data), time.perf_counter() - started)
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)  # 폰 사진의 회전 정보를 픽셀에 반영
+        if getattr(image, "is_animated", False):
+            image.seek(0)  # 움짤은 첫 프레임만 사용
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        if image_format == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+        downscaled = max(image.size) > max_edge
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = io.BytesIO()
+        save_options = {"quality": quality}
+        if image_format == "WEBP":
+            save_options["method"] = 4  # 속도와 압축률의 절충
+        image.save(out, format=image_format, **save_options)
+        width, height = image.size
+
+    encoded = out.getvalue()
+    if not downscaled and len(encoded) >= len(data) and mime_type != "image/gif":
+        # 이미 충분히 작은 원본이면 재인코딩 결과를 버리고 원본을 씁니다.
+        return ProcessedImage(data, mime_type, width, height, len(data), time.perf_counter() - started)
+    return ProcessedImage(encoded, f"image/{image_format.lower()}", width, height, len(data),
+                          time.perf_counter() - started)
+
+
+async def preprocess_image(data: bytes, mime_type: str, max_edge: int, image_format: str = "WEBP",
+                           quality: int = 85) -> ProcessedImage:
+    """이미지를 디코딩해 긴 변이 `max_edge`를 넘지 않도록 줄이고 효율적인 형식으로 다시 인코딩합니다.
+
+    CPU를 쓰는 작업이므로 이벤트 루프를 막지 않도록 워커 스레드에서 실행합니다.
+    디코딩에 실패하면 원본을 그대로 돌려줍니다.
+    """
+    try:
+        return await asyncio.to_thread(_process_sync, data, mime_type, max_edge, image_format, quality)
+    except Exception as e:
+        logging.warning(f"이미지 전처리 실패, 원본을 사용합니다: {e}")
+        return ProcessedImage(data, mime_type, 0, 0, len(data), 0.0)
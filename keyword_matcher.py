@@ -0,0 +1,62 @@
+# bot/keyword_matcher.py
+import re
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+# 호칭 뒤에 자연스럽게 붙는 조사/어미. 이 뒤에 오는 글자까지는 같은 '단어'로 봅니다. (예: 제비야, 제비한테)
+KOREAN_PARTICLES = ("야", "아", "님", "씨", "봇", "는", "은", "가", "이", "를", "을", "도", "랑", "의",
+                    "한테", "에게", "께", "하고", "이랑")
+WORD_CHAR = r"[0-9A-Za-z가-힣]"
+KEYWORD_PARTICLES_PATTERN = "(?:" + "|".join(sorted(KOREAN_PARTICLES, key=len, reverse=True)) + ")?"
+
+
+class KeywordMatcher:
+    """여러 키워드를 정규식 하나로 미리 컴파일해 메시지를 한 번만 훑어 가장 앞의 일치를 찾습니다.
+
+    '제비'는 '제비야', '제비한테', '제비?'에는 걸리지만 '제비꽃', '강남제비'에는 걸리지 않습니다.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = frozenset(k.lower() for k in keywords if k)
+        # 긴 키워드를 먼저 두어 같은 위치에서 '야제비야'가 '야제비'보다 먼저 잡히게 합니다.
+        alternation = "|".join(re.escape(k) for k in sorted(self.keywords, key=len, reverse=True))
+        if alternation:
+            self._word_pattern = re.compile(
+                rf"(?<!{WORD_CHAR})(?:{alternation}){KEYWORD_PARTICLES_PATTERN}(?!{WORD_CHAR})")
+            self._substring_pattern = re.compile(alternation)
+        else:
+            self._word_pattern = self._substring_pattern = None
+
+    def search(self, text: str) -> Optional[re.Match]:
+        """단어 경계를 지킨 가장 앞의 키워드 일치. `text`는 소문자로 넘겨야 합니다."""
+        return self._word_pattern.search(text) if self._word_pattern else None
+
+    def remove(self, text: str) -> str:
+        """부르는 말(키워드+조사)을 지운 글. 같은 질문을 부르는 말과 상관없이 비교할 때 씁니다."""
+        return self._word_pattern.sub(" ", text) if self._word_pattern else text
+
+    def contains(self, text: str) -> bool:
+        """경계와 상관없이 키워드가 포함되어 있는지. (예전 should_respond와 같은 기준)"""
+        return bool(self._substring_pattern and self._substring_pattern.search(text))
+
+
+class KeywordMatcherRegistry:
+    """기본 키워드에 서버(guild)별, 페르소나별 키워드를 더한 매처를 만들어 캐시합니다."""
+
+    def __init__(self, base_keywords: Iterable[str], guild_keywords: Mapping[int, Iterable[str]] = None,
+                 persona_keywords: Mapping[str, Iterable[str]] = None):
+        self.base_keywords = frozenset(base_keywords)
+        self.guild_keywords = {int(g): frozenset(k) for g, k in (guild_keywords or {}).items()}
+        self.persona_keywords = {p: frozenset(k) for p, k in (persona_keywords or {}).items()}
+        self._cache: Dict[Tuple[Optional[int], Optional[str]], KeywordMatcher] = {}
+
+    def get(self, guild_id: Optional[int] = None, persona: Optional[str] = None) -> KeywordMatcher:
+        # 추가 키워드가 없는 서버/페르소나는 모두 기본 매처 하나를 공유합니다.
+        key = (guild_id if guild_id in self.guild_keywords else None,
+               persona if persona in self.persona_keywords else None)
+        matcher = self._cache.get(key)
+        if matcher is None:
+            keywords = set(self.base_keywords)
+            keywords |= self.guild_keywords.get(key[0], frozenset())
+            keywords |= self.persona_keywords.get(key[1], frozenset())
+            matcher = self._cache[key] = KeywordMatcher(keywords)
+        return matcher
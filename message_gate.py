@@ -0,0 +1,79 @@
+# bot/message_gate.py
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from keyword_matcher import KeywordMatcherRegistry
+
+QUESTION_PATTERN = re.compile(r"\?|뭐|왜|어때|어떻|언제|어디|누구|알려|해줘|해 줘|줘$|니\b|냐\b|나요|까\b")
+
+
+@dataclass
+class GateWeights:
+    direct: float = 1.0  # 멘션 또는 봇 메시지에 대한 답장
+    keyword: float = 0.6  # 단어 경계를 지킨 키워드
+    vocative: float = 0.2  # 키워드가 문장 맨 앞/맨 뒤에 있어 부르는 말로 보일 때
+    question: float = 0.2  # 질문/요청 형태의 문장
+    substring: float = 0.2  # 단어 경계를 지키지 않은 단순 포함 ('제비꽃' 등)
+    image: float = 0.1  # 이미지가 함께 온 경우
+
+
+@dataclass
+class GateDecision:
+    respond: bool
+    score: float
+    reasons: List[str] = field(default_factory=list)
+
+
+class MessageGate:
+    """LLM을 부르기 전에 메시지에 응답할지를 로컬에서 싸게 판단합니다.
+
+    낄끼빠빠 지침상 모델이 어차피 침묵할 메시지(유저끼리의 대화)를 걸러내어
+    메모리 백엔드 호출과 Gemini 호출을 아낍니다.
+    """
+
+    def __init__(self, keywords: KeywordMatcherRegistry, threshold: float, weights: GateWeights = None):
+        self.keywords = keywords
+        self.threshold = threshold
+        self.weights = weights or GateWeights()
+        self.counters: Dict[str, int] = {"evaluated": 0, "passed": 0, "skipped": 0, "llm_calls_avoided": 0}
+
+    def evaluate(self, content: str, mentioned: bool = False, replied_to_bot: bool = False,
+                 has_image: bool = False, guild_id: Optional[int] = None,
+                 persona: Optional[str] = None) -> GateDecision:
+        self.counters["evaluated"] += 1
+        text = content.lower().strip()
+        matcher = self.keywords.get(guild_id, persona)
+        w, score, reasons = self.weights, 0.0, []
+
+        if mentioned or replied_to_bot:
+            score += w.direct
+            reasons.append("mention" if mentioned else "reply")
+
+        match = matcher.search(text)
+        if match:
+            score += w.keyword
+            reasons.append("keyword")
+            if match.start() == 0 or match.end() >= len(text.rstrip("?!. ~")):
+                score += w.vocative
+                reasons.append("vocative")
+        elif matcher.contains(text):
+            score += w.substring
+            reasons.append("substring")
+
+        if score > 0 and QUESTION_PATTERN.search(text):
+            score += w.question
+            reasons.append("question")
+        if score > 0 and has_image:
+            score += w.image
+            reasons.append("image")
+
+        decision = GateDecision(respond=score >= self.threshold, score=round(score, 3), reasons=reasons)
+        if decision.respond:
+            self.counters["passed"] += 1
+        else:
+            self.counters["skipped"] += 1
+            # 예전 방식(단순 포함 검사)이었다면 LLM까지 갔을 메시지
+            if "substring" in reasons:
+                self.counters["llm_calls_avoided"] += 1
+        return decision
@@ -0,0 +1,168 @@
+# bot/model_pool.py
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Tuple
+
+from chat_history import estimate_tokens
+
+if TYPE_CHECKING:  # 실제 임포트는 모델을 처음 만들 때 합니다. (봇 시작 시간 단축)
+    import google.generativeai as genai
+
+ModelKey = Tuple[str, str, str]  # (페르소나, 모델 이름, 도구 세트 이름)
+
+
+class PersonaSelector:
+    """채널 > 서버 > 기본값 순서로 사용할 페르소나를 고르고, 선택 내용을 JSON 파일에 저장합니다."""
+
+    def __init__(self, personas: Mapping[str, str], default_persona: str, path: str):
+        self.personas = personas
+        self.default_persona = default_persona
+        self.path = path
+        self._selections: Dict[str, str] = {}
+        self.load()
+
+    def resolve(self, guild_id: Optional[int], channel_id: Optional[int]) -> str:
+        return (self._selections.get(f"channel:{channel_id}")
+                or self._selections.get(f"guild:{guild_id}")
+                or self.default_persona)
+
+    def set_channel(self, channel_id: int, persona: Optional[str]):
+        self._set(f"channel:{channel_id}", persona)
+
+    def set_guild(self, guild_id: int, persona: Optional[str]):
+        self._set(f"guild:{guild_id}", persona)
+
+    def selected_personas(self) -> List[str]:
+        """현재 어딘가에서 쓰이고 있는 페르소나 목록 (기본값 포함)."""
+        return sorted({self.default_persona, *self._selections.values()})
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                self._selections = {k: v for k, v in saved.items() if v in self.personas}
+        except Exception as e:
+            logging.error(f"페르소나 선택 정보 로딩 중 오류: {e}")
+
+    def _set(self, key: str, persona: Optional[str]):
+        if persona is None:
+            self._selections.pop(key, None)
+        elif persona not in self.personas:
+            raise KeyError(persona)
+        else:
+            self._selections[key] = persona
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._selections, f, ensure_ascii=False, indent=4)
+        except Exception as e:
+            logging.error(f"페르소나 선택 정보 저장 중 오류: {e}")
+
+
+class ModelPool:
+    """(페르소나, 모델, 도구 세트)별 GenerativeModel을 한 번만 만들어 LRU로 보관합니다.
+
+    시스템 지시문이 `context_cache_min_tokens` 이상으로 긴 페르소나는 Gemini 컨텍스트 캐싱을 사용해
+    매 요청마다 지시문 토큰을 다시 보내지 않습니다. 캐시 생성에 실패하면 일반 모델로 대신합니다.
+    캐시 생성은 네트워크 호출이므로 스레드에서 하고, 턴 처리 중에 캐시가 없거나 만료됐으면 기다리지 않고
+    이번 턴은 일반 모델로 답하면서 캐시는 뒤에서 만듭니다. 그동안 쓰는 일반 모델은 키마다 하나만 만들어 두고 같은 객체를
+    돌려줍니다. (턴마다 새로 만들면 만드는 비용이 들고, 모델이 바뀐 것으로 보여 Gemini 세션을 이어 쓰지 못함)
+    """
+
+    def __init__(self, personas: Mapping[str, str], toolsets: Mapping[str, list], max_size: int,
+                 context_cache_min_tokens: int, context_cache_ttl: datetime.timedelta):
+        self.personas = personas
+        self.toolsets = toolsets
+        self.max_size = max_size
+        self.context_cache_min_tokens = context_cache_min_tokens
+        self.context_cache_ttl = context_cache_ttl
+        # 예산 계산용으로 페르소나별 지시문 토큰 수를 미리 계산해 둡니다.
+        self.instruction_tokens: Dict[str, int] = {name: estimate_tokens(text) for name, text in personas.items()}
+        self._models: "OrderedDict[ModelKey, genai.GenerativeModel]" = OrderedDict()
+        self._cache_expiry: Dict[ModelKey, float] = {}
+        self._fallbacks: Dict[ModelKey, genai.GenerativeModel] = {}  # 캐시를 만드는 중이거나 만료됐을 때 쓰는 일반 모델
+        self._building: Dict[ModelKey, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, persona: str, model_name: str, toolset: str = "default") -> genai.GenerativeModel:
+        key = (persona, model_name, toolset)
+        model = self._models.get(key)
+        if model is not None and self._cache_expiry.get(key, float("inf")) > time.time():
+            self._models.move_to_end(key)
+            self.hits += 1
+            return model
+        self.misses += 1
+        if not self._uses_context_cache(persona):
+            return self._store(key, self._plain_model(key))
+        self._schedule_build(key)
+        fallback = self._fallbacks.get(key)
+        if fallback is None:
+            fallback = self._fallbacks[key] = self._plain_model(key)
+        return fallback
+
+    async def warm(self, personas: List[str], model_name: str, toolset: str = "default"):
+        """핫 패스에서 모델을 만들지 않도록 쓰일 페르소나의 모델을 미리 만들어 둡니다."""
+        tasks = []
+        for persona in personas:
+            key = (persona, model_name, toolset)
+            if key not in self._models or self._cache_expiry.get(key, float("inf")) - time.time() < 300:
+                tasks.append(self._schedule_build(key))
+        await asyncio.gather(*tasks)
+
+    def _uses_context_cache(self, persona: str) -> bool:
+        return self.instruction_tokens[persona] >= self.context_cache_min_tokens
+
+    def _plain_model(self, key: ModelKey) -> genai.GenerativeModel:
+        import google.generativeai as genai
+
+        persona, model_name, toolset = key
+        return genai.GenerativeModel(model_name, system_instruction=self.personas[persona],
+                                     tools=self.toolsets[toolset])
+
+    def _schedule_build(self, key: ModelKey) -> asyncio.Task:
+        """모델 만들기를 띄웁니다. 같은 키를 이미 만드는 중이면 그 작업을 돌려줍니다."""
+        task = self._building.get(key)
+        if task is None or task.done():
+            task = self._building[key] = asyncio.create_task(self._build(key))
+        return task
+
+    async def _build(self, key: ModelKey):
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        persona, model_name, toolset = key
+        model = None
+        if self._uses_context_cache(persona):
+            try:
+                cached = await asyncio.to_thread(
+                    caching.CachedContent.create, model=model_name, display_name=f"persona-{persona}",
+                    system_instruction=self.personas[persona], tools=self.toolsets[toolset],
+                    ttl=self.context_cache_ttl)
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                self._cache_expiry[key] = time.time() + self.context_cache_ttl.total_seconds()
+                logging.info(f"페르소나 '{persona}'의 지시문을 Gemini 컨텍스트 캐시에 올렸습니다.")
+            except Exception as e:
+                logging.warning(f"페르소나 '{persona}' 컨텍스트 캐시 생성 실패, 일반 모델로 대신합니다: {e}")
+        if model is None:
+            self._cache_expiry.pop(key, None)
+            model = self._fallbacks.pop(key, None) or self._plain_model(key)
+        self._store(key, model)
+
+    def _store(self, key: ModelKey, model: genai.GenerativeModel) -> genai.GenerativeModel:
+        self._models[key] = model
+        self._models.move_to_end(key)
+        while len(self._models) > self.max_size:
+            evicted, _ = self._models.popitem(last=False)
+            self._cache_expiry.pop(evicted, None)
+            self._fallbacks.pop(evicted, None)
+        logging.info(f"GenerativeModel 생성: {key} (풀 {len(self._models)}/{self.max_size})")
+        return model
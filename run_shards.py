@@ -0,0 +1,54 @@
+# run_shards.py
+"""봇을 여러 프로세스로 나눠 띄웁니다. 각 프로세스는 샤드 번호 범위 하나를 맡고, 단기기억/턴 잠금은 Redis로 공유합니다.
+
+사용법: python run_shards.py --shards 8 --processes 4
+  (프로세스 0은 샤드 0-1, 프로세스 1은 샤드 2-3, ... 을 맡습니다. Redis 주소는 REDIS_URL 환경 변수)
+여러 호스트에 나눌 때는 호스트마다 --only로 맡을 프로세스 번호를 줍니다. 예: --only 0 1
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def shard_ranges(shard_count: int, processes: int):
+    """샤드 번호를 프로세스 수만큼 연속된 범위로 고르게 나눕니다."""
+    per_process, extra = divmod(shard_count, processes)
+    start = 0
+    for i in range(processes):
+        size = per_process + (1 if i < extra else 0)
+        yield list(range(start, start + size))
+        start += size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, required=True, help="전체 샤드 수 (모든 프로세스가 같은 값을 씀)")
+    parser.add_argument("--processes", type=int, required=True)
+    parser.add_argument("--only", type=int, nargs="+", help="이 호스트에서 띄울 프로세스 번호")
+    args = parser.parse_args()
+    if not 0 < args.processes <= args.shards:
+        raise SystemExit("프로세스 수는 1 이상, 샤드 수 이하여야 합니다.")
+
+    children = []
+    for index, shard_ids in enumerate(shard_ranges(args.shards, args.processes)):
+        if args.only is not None and index not in args.only:
+            continue
+        env = dict(os.environ, SHARD_COUNT=str(args.shards), SHARD_IDS=",".join(map(str, shard_ids)))
+        env.setdefault("SHARED_STATE", "redis")
+        print(f"프로세스 {index}: 샤드 {shard_ids[0]}-{shard_ids[-1]}")
+        children.append(subprocess.Popen([sys.executable, os.path.join(ROOT, "discord_bot.py")], cwd=ROOT, env=env))
+
+    try:
+        for child in children:
+            child.wait()
+    except KeyboardInterrupt:
+        # 자식 프로세스도 같은 Ctrl+C를 받아 기억을 저장하고 종료합니다.
+        for child in children:
+            child.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+# bot/session_manager.py
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from chat_history import ChatHistoryWindow, legacy_file_name, safe_file_name
+
+
+class SessionConflict(Exception):
+    """저장하려는 창을 불러온 뒤로 다른 프로세스가 그 유저의 세션을 먼저 저장했습니다."""
+
+
+class FileSessionStore:
+    """유저별 JSON 파일에 단기기억을 저장합니다. 한 프로세스만 쓰는 기본 저장소."""
+    name = "file"
+
+    def __init__(self, session_dir: str):
+        self.session_dir = session_dir
+
+    def exists(self, user_name: str) -> bool:
+        return os.path.exists(self._path(user_name)) or self._legacy_path(user_name) is not None
+
+    def load(self, user_name: str) -> Tuple[Optional[List[Dict]], Optional[int]]:
+        """(기록, 버전)을 돌려줍니다. 파일 저장소는 다른 프로세스가 고치지 않으므로 버전이 없습니다."""
+        path = self._path(user_name)
+        if not os.path.exists(path):
+            legacy_path = self._legacy_path(user_name)
+            if legacy_path is None:
+                return None, None
+            os.replace(legacy_path, path)  # 예전 이름의 파일을 새 이름으로 옮깁니다.
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), None
+
+    def version(self, user_name: str) -> Optional[int]:
+        return None
+
+    def save(self, user_name: str, records: List[Dict], expected_version: Optional[int] = None) -> Optional[int]:
+        os.makedirs(self.session_dir, exist_ok=True)
+        path = self._path(user_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return None
+
+    def delete(self, user_name: str):
+        try:
+            os.remove(self._path(user_name))
+        except FileNotFoundError:
+            pass
+
+    def quarantine(self, user_name: str) -> str:
+        """읽을 수 없는 세션 파일을 옆으로 옮겨 둡니다. 옮긴 경로를 돌려줍니다."""
+        path = self._path(user_name)
+        moved = f"{path}.{time.strftime('%Y%m%d-%H%M%S')}.corrupt"
+        os.replace(path, moved)
+        return moved
+
+    def count(self) -> int:
+        try:
+            return sum(1 for n in os.listdir(self.session_dir) if n.endswith(".json"))
+        except FileNotFoundError:
+            return 0
+
+    def _path(self, user_name: str) -> str:
+        return os.path.join(self.session_dir, f"{safe_file_name(user_name)}.json")
+
+    def _legacy_path(self, user_name: str) -> Optional[str]:
+        """해시 없는 예전 이름의 파일이 있으면 그 경로. (이름을 그대로 쓸 수 있던 유저만)"""
+        legacy_name = legacy_file_name(user_name)
+        path = os.path.join(self.session_dir, f"{legacy_name}.json") if legacy_name else None
+        return path if path and os.path.exists(path) else None
+
+
+class RedisSessionStore:
+    """여러 봇 프로세스(샤드)가 함께 쓰는 Redis 저장소.
+
+    `{prefix}:{유저}`에 기록(JSON)을, `{prefix}:{유저}:ver`에 저장할 때마다 1씩 오르는 버전을 둡니다.
+    프로세스는 자기가 들고 있는 창의 버전이 Redis와 다르면 다른 프로세스가 그 유저의 턴을 처리한 것으로 보고 다시 불러옵니다.
+    저장은 버전을 비교한 뒤에만 하므로(WATCH/MULTI), 턴 잠금이 풀린 사이 다른 프로세스가 저장한 기록을 덮지 않습니다.
+    저장된 유저 목록은 `{prefix}#users` 집합에 따로 두어 세는 데 키 전체를 훑지 않습니다.
+    """
+    name = "redis"
+
+    def __init__(self, client, prefix: str = "session"):
+        self.client = client
+        self.prefix = prefix
+        self._index_key = f"{prefix}#users"
+        self._index_checked = False
+
+    def exists(self, user_name: str) -> bool:
+        return bool(self.client.exists(self._key(user_name)))
+
+    def load(self, user_name: str) -> Tuple[Optional[List[Dict]], Optional[int]]:
+        data, version = self.client.mget(self._key(user_name), self._key(user_name) + ":ver")
+        return (json.loads(data) if data else None), int(version or 0)
+
+    def version(self, user_name: str) -> Optional[int]:
+        return int(self.client.get(self._key(user_name) + ":ver") or 0)
+
+    def save(self, user_name: str, records: List[Dict], expected_version: Optional[int] = None) -> Optional[int]:
+        """기록을 저장하고 새 버전을 돌려줍니다. `expected_version`이 지금 버전과 다르면 SessionConflict를 올립니다."""
+        from redis.exceptions import WatchError
+
+        key, ver_key = self._key(user_name), self._key(user_name) + ":ver"
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(ver_key)
+                if expected_version is not None and int(pipe.get(ver_key) or 0) != expected_version:
+                    raise SessionConflict(user_name)
+                pipe.multi()  # 기록과 버전이 함께 바뀝니다. WATCH한 뒤 버전이 바뀌었으면 실행되지 않습니다.
+                pipe.set(key, json.dumps(records, ensure_ascii=False))
+                pipe.incr(ver_key)
+                pipe.sadd(self._index_key, user_name)
+                return pipe.execute()[1]
+            except WatchError:
+                raise SessionConflict(user_name) from None
+
+    def delete(self, user_name: str):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(user_name))
+        pipe.incr(self._key(user_name) + ":ver")  # 다른 프로세스가 들고 있는 창도 낡은 것이 됩니다.
+        pipe.srem(self._index_key, user_name)
+        pipe.execute()
+
+    def quarantine(self, user_name: str) -> str:
+        """읽을 수 없는 기록을 다른 키로 옮겨 둡니다. 옮긴 키를 돌려줍니다."""
+        moved = f"{self._key(user_name)}:corrupt:{int(time.time())}"
+        pipe = self.client.pipeline()
+        pipe.rename(self._key(user_name), moved)
+        pipe.srem(self._index_key, user_name)
+        pipe.execute()
+        return moved
+
+    def count(self) -> int:
+        if not self._index_checked:
+            self._build_index()
+        return self.client.scard(self._index_key)
+
+    def _build_index(self):
+        """유저 목록 집합이 생기기 전에 저장된 세션을 한 번만 훑어 넣습니다. (프로세스마다 처음 셀 때)"""
+        prefix = f"{self.prefix}:"
+        users = [key.decode("utf-8")[len(prefix):] for key in self.client.scan_iter(f"{prefix}*", count=1000)
+                 if not key.endswith(b":ver") and b":corrupt:" not in key]
+        if users:
+            self.client.sadd(self._index_key, *users)
+        self._index_checked = True
+
+    def _key(self, user_name: str) -> str:
+        return f"{self.prefix}:{user_name}"
+
+
+class SessionManager:
+    """유저별 단기기억 창을 메모리에 올려두고, 오래 쉬고 있는 유저는 디스크로 내보냅니다.
+
+    - 상주 세션은 LRU 순서로 관리되며 `max_resident`개를 넘으면 가장 오래 안 쓴 세션부터 내보냅니다.
+    - `idle_timeout` 동안 메시지가 없던 세션은 `evict_idle()`이 내보냅니다.
+    - 내보낸 세션은 다음 메시지가 올 때 저장소(기본은 `session_dir`의 유저별 JSON 파일)에서 다시 불러옵니다.
+    - 여러 프로세스가 같은 저장소(RedisSessionStore)를 쓰면, 상주 세션도 `get()` 때마다 버전을 확인해
+      다른 프로세스가 고쳤으면 다시 불러옵니다. 같은 유저의 턴이 겹치지 않게 하는 것은 부르는 쪽(턴 잠금)의 몫입니다.
+    """
+
+    def __init__(self, window_factory: Callable[[str], ChatHistoryWindow], session_dir: str,
+                 idle_timeout: timedelta, max_resident: int,
+                 on_evict: Optional[Callable[[str], None]] = None, store=None):
+        self.window_factory = window_factory
+        self.session_dir = session_dir
+        self.store = store or FileSessionStore(session_dir)
+        self.idle_timeout = idle_timeout
+        self.max_resident = max_resident
+        self.on_evict = on_evict  # 세션을 내보내거나 지울 때 함께 정리할 것이 있으면 호출됩니다.
+        self._resident: "OrderedDict[str, ChatHistoryWindow]" = OrderedDict()
+        self._last_active: Dict[str, float] = {}
+        self._dirty: Set[str] = set()
+        self._pinned: Dict[str, int] = {}
+        self._versions: Dict[str, Optional[int]] = {}  # 상주 세션을 불러오거나 저장했을 때의 저장소 버전
+        self.eviction_count = 0
+        self.stale_reload_count = 0
+        self.conflict_count = 0
+        self.rehydration_count = 0
+        self.rehydration_seconds = 0.0
+        self.last_rehydration_seconds = 0.0
+
+    def __contains__(self, user_name: str) -> bool:
+        return user_name in self._resident or self.store.exists(user_name)
+
+    def __len__(self) -> int:
+        return len(self._resident)
+
+    def get(self, user_name: str) -> ChatHistoryWindow:
+        """유저의 단기기억 창을 돌려줍니다. 내보내진 상태라면 디스크에서 다시 불러옵니다."""
+        window = self._resident.get(user_name)
+        if window is not None and self._is_stale(user_name):
+            logging.info(f"'{user_name}' 세션을 다른 프로세스가 바꿔서 다시 불러옵니다.")
+            self.stale_reload_count += 1
+            self._forget(user_name)
+            window = None
+        if window is None:
+            window = self._rehydrate(user_name)
+            self._resident[user_name] = window
+        else:
+            self._resident.move_to_end(user_name)
+        self._last_active[user_name] = time.monotonic()
+        # get()을 부른 쪽이 창을 수정한다고 보고 저장 대상으로 표시합니다.
+        self._dirty.add(user_name)
+        self._enforce_max_resident()
+        return window
+
+    def peek(self, user_name: str) -> Optional[ChatHistoryWindow]:
+        """메모리에 올라와 있는 창만 돌려줍니다. 디스크에서 불러오거나 활동/저장 대상으로 표시하지 않습니다."""
+        return self._resident.get(user_name)
+
+    def pin(self, user_name: str):
+        """대화 처리 중인 세션이 중간에 내보내지지 않도록 고정합니다."""
+        self._pinned[user_name] = self._pinned.get(user_name, 0) + 1
+
+    def unpin(self, user_name: str):
+        count = self._pinned.get(user_name, 0) - 1
+        if count > 0:
+            self._pinned[user_name] = count
+        else:
+            self._pinned.pop(user_name, None)
+        if user_name in self._resident:
+            self._last_active[user_name] = time.monotonic()
+
+    def replace(self, user_name: str, window: ChatHistoryWindow):
+        """유저의 단기기억 창을 통째로 바꿉니다. (가져오기 등) 다음 save_all()에서 저장됩니다."""
+        self._resident[user_name] = window
+        self._resident.move_to_end(user_name)
+        self._last_active[user_name] = time.monotonic()
+        self._dirty.add(user_name)
+        if self.on_evict:
+            self.on_evict(user_name)  # 이전 창에 묶여 있던 것(Gemini 세션 등)은 더 이상 맞지 않습니다.
+        self._enforce_max_resident()
+
+    def remove(self, user_name: str):
+        """유저의 단기기억을 메모리와 저장소에서 모두 지웁니다."""
+        self._forget(user_name)
+        try:
+            self.store.delete(user_name)
+        except Exception as e:
+            logging.error(f"'{user_name}' 세션 삭제 중 오류: {e}")
+
+    def evict(self, user_name: str):
+        if user_name in self._pinned:
+            return
+        window = self._resident.pop(user_name, None)
+        if window is None:
+            return
+        if user_name in self._dirty:
+            self._write(user_name, window)
+            self._dirty.discard(user_name)
+        self._last_active.pop(user_name, None)
+        self._versions.pop(user_name, None)
+        self.eviction_count += 1
+        if self.on_evict:
+            self.on_evict(user_name)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """idle_timeout 동안 활동이 없던 세션을 모두 디스크로 내보냅니다."""
+        now = time.monotonic() if now is None else now
+        limit = self.idle_timeout.total_seconds()
+        idle_users = [name for name in self._resident
+                      if name not in self._pinned and now - self._last_active.get(name, now) > limit]
+        for name in idle_users:
+            self.evict(name)
+        if idle_users:
+            logging.info(f"유휴 세션 {len(idle_users)}개를 디스크로 내보냈습니다. (상주 {len(self._resident)}개)")
+        return len(idle_users)
+
+    def save(self, user_name: str):
+        """한 유저의 세션만 바로 저장합니다. 공유 저장소에서는 턴 잠금을 풀기 전에 불러 다음 프로세스가 보게 합니다."""
+        window = self._resident.get(user_name)
+        if window is not None and user_name in self._dirty:
+            self._write(user_name, window)
+            self._dirty.discard(user_name)
+
+    def save_all(self):
+        """변경된 상주 세션을 모두 저장소에 저장합니다."""
+        for name in list(self._dirty):
+            window = self._resident.get(name)
+            if window is not None:
+                self._write(name, window)
+        self._dirty.clear()
+
+    def load_legacy_file(self, path: str):
+        """예전 방식의 통합 단기기억 파일을 유저별 세션 파일로 옮깁니다."""
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            saved_histories = json.load(f)
+        for name, records in saved_histories.items():
+            window = self.window_factory(name)
+            window.extend(records)
+            self._write(name, window)
+        os.replace(path, path + ".migrated")
+        logging.info(f"'{path}'의 단기 기억 {len(saved_histories)}명 분을 '{self.session_dir}'로 옮겼습니다.")
+
+    def stats(self) -> Dict:
+        try:
+            stored = self.store.count()
+        except Exception:
+            stored = 0
+        avg_ms = self.rehydration_seconds / self.rehydration_count * 1000 if self.rehydration_count else 0.0
+        return {
+            "resident": len(self._resident),
+            "stored": stored,
+            "evictions": self.eviction_count,
+            "rehydrations": self.rehydration_count,
+            "avg_rehydration_ms": round(avg_ms, 2),
+            "last_rehydration_ms": round(self.last_rehydration_seconds * 1000, 2),
+            "stale_reloads": self.stale_reload_count,
+            "save_conflicts": self.conflict_count,
+        }
+
+    def _enforce_max_resident(self):
+        candidates = [name for name in self._resident if name not in self._pinned]
+        for name in candidates[:max(0, len(self._resident) - self.max_resident)]:
+            self.evict(name)
+
+    def _forget(self, user_name: str):
+        self._resident.pop(user_name, None)
+        self._last_active.pop(user_name, None)
+        self._versions.pop(user_name, None)
+        self._dirty.discard(user_name)
+        if self.on_evict:
+            self.on_evict(user_name)
+
+    def _is_stale(self, user_name: str) -> bool:
+        known = self._versions.get(user_name)
+        if known is None:
+            return False
+        try:
+            return self.store.version(user_name) != known
+        except Exception as e:
+            logging.warning(f"'{user_name}' 세션 버전 확인 실패: {e}")
+            return False
+
+    def _rehydrate(self, user_name: str) -> ChatHistoryWindow:
+        window = self.window_factory(user_name)
+        started = time.perf_counter()
+        try:
+            records, version = self.store.load(user_name)
+        except Exception as e:
+            # 빈 창으로 시작하면 다음 저장이 원래 기록을 덮으므로 먼저 옆으로 옮겨 둡니다.
+            # 옮기지도 못하면(저장소 연결 문제 등) 빈 창을 돌려주지 않고 오류를 그대로 올립니다.
+            logging.error(f"'{user_name}' 세션 복원 중 오류: {e}")
+            moved = self.store.quarantine(user_name)
+            logging.error(f"'{user_name}'의 읽을 수 없는 세션을 '{moved}'(으)로 옮기고 빈 기록으로 시작합니다.")
+            self._versions[user_name] = self.store.version(user_name)
+            return window
+        self._versions[user_name] = version
+        if records is None:
+            return window
+        window.extend(records)
+        elapsed = time.perf_counter() - started
+        self.rehydration_count += 1
+        self.rehydration_seconds += elapsed
+        self.last_rehydration_seconds = elapsed
+        logging.info(f"'{user_name}' 세션을 {self.store.name} 저장소에서 복원했습니다. ({elapsed * 1000:.1f}ms)")
+        return window
+
+    def _write(self, user_name: str, window: ChatHistoryWindow):
+        try:
+            version = self.store.save(user_name, window.to_list(), self._versions.get(user_name))
+        except SessionConflict:
+            # 다른 프로세스의 기록이 더 새것이므로 덮지 않습니다. 버전을 어긋난 값으로 두어
+            # 다음 get()에서 다시 불러오고, 그 전에 다시 저장하려 해도 같은 이유로 막히게 합니다.
+            self.conflict_count += 1
+            logging.error(f"'{user_name}' 세션을 다른 프로세스가 먼저 저장해서 이 프로세스의 변경은 버립니다.")
+            if user_name in self._resident:
+                self._versions[user_name] = -1
+            return
+        except Exception as e:
+            logging.error(f"'{user_name}' 세션 저장 중 오류: {e}")
+            return
+        if user_name in self._resident:
+            self._versions[user_name] = version
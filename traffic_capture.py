@@ -0,0 +1,138 @@
+# bot/traffic_capture.py
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from chat_history import estimate_tokens
+
+# 지금 처리 중인 턴의 기록. 같은 태스크 안에서 부르는 함수(백엔드 호출, Gemini 호출, 도구)가 여기에 값을 더합니다.
+_current: ContextVar[Optional[Dict]] = ContextVar("traffic_turn", default=None)
+
+
+class TrafficCapture:
+    """턴마다 내용 없이 '모양'만 JSONL 한 줄로 남깁니다. 부하 테스트(benchmarks/replay_traffic.py)에서 그대로 재생합니다.
+
+    한 줄의 키 (값이 없거나 0인 키는 생략):
+        t       턴 시작 시각 (유닉스 초, ms 단위)
+        u, ch   유저/채널 (솔트를 넣은 HMAC-SHA256 앞 12자리. 이름과 ID는 남기지 않음)
+        chars   메시지 글자 수, tok: 추정 토큰 수
+        img     첨부 이미지 수, img_b: 첨부 바이트 합, img_tok: 이미지 추정 토큰
+        tools   부른 도구 이름 (인자와 결과는 남기지 않음)
+        bk_in   백엔드가 센 입력 토큰(요약 후), bk_msgs: 백엔드로 보낸 메시지 수
+        g_in, g_out  Gemini가 알려준 입력/출력 토큰 (도구 호출로 여러 번 부르면 합)
+        reply   답장 글자 수, out: 결과 (ok/silent/answer_cache/lock_timeout/error ...)
+        lock_ms 같은 유저의 앞 턴이 끝나기를 기다린 시간(ms)
+        ms      단계별 시간(ms): backend, gemini(도구 호출로 여러 번 부르면 합), total
+
+    같은 솔트를 쓰는 동안만 같은 유저가 같은 값으로 남습니다. 솔트를 정하지 않으면 실행마다 새로 만듭니다.
+    """
+
+    def __init__(self, path: str, salt: Optional[str] = None, flush_every: int = 16,
+                 max_bytes: int = 256 * 1024 ** 2):
+        self.path = path
+        self._salt = (salt or secrets.token_hex(16)).encode("utf-8")
+        self.flush_every = flush_every
+        self.max_bytes = max_bytes
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self.counters = {"turns": 0, "rotations": 0, "write_errors": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        atexit.register(self.flush)
+
+    def anonymize(self, value) -> str:
+        return hmac.new(self._salt, str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+    @contextmanager
+    def turn(self, user, channel_id, text: str, attachments=()):
+        """턴 하나를 기록합니다. 블록 안에서 `note`/`stage`/`note_tool`로 값을 더하고, 블록이 끝나면 한 줄을 씁니다."""
+        images = [a for a in attachments if (getattr(a, "content_type", None) or "").startswith("image/")]
+        record = {"t": round(time.time(), 3), "u": self.anonymize(user), "ch": self.anonymize(channel_id),
+                  "chars": len(text), "tok": estimate_tokens(text),
+                  "img": len(images), "img_b": sum(getattr(a, "size", 0) or 0 for a in images),
+                  "tools": [], "ms": {}, "out": "ok"}
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record["out"] = "error"
+            raise
+        finally:
+            record["ms"]["total"] = round((time.perf_counter() - started) * 1000, 1)
+            _current.reset(token)
+            self.write(record)
+
+    def write(self, record: Dict):
+        line = json.dumps({k: v for k, v in record.items() if v},
+                          ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._buffer.append(line)
+            self.counters["turns"] += 1
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")  # 한 개만 남기고 넘깁니다.
+                self.counters["rotations"] += 1
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            self.counters["write_errors"] += 1
+            logging.warning(f"트래픽 기록 저장 실패 ({len(lines)}줄 버림): {e}")
+
+    def stats(self) -> Dict:
+        return {**self.counters, "buffered": len(self._buffer)}
+
+
+# 아래 함수들은 기록 중인 턴이 없으면 아무것도 하지 않으므로, 기록을 꺼 두어도 호출 비용은 거의 없습니다.
+def note(**fields):
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+
+def note_add(**fields):
+    """여러 번 불릴 수 있는 값(Gemini 토큰 등)을 더합니다."""
+    record = _current.get()
+    if record is not None:
+        for key, value in fields.items():
+            record[key] = record.get(key, 0) + (value or 0)
+
+
+def note_tool(name: str):
+    record = _current.get()
+    if record is not None:
+        record["tools"].append(name)
+
+
+@contextmanager
+def stage(name: str):
+    """단계 시간을 ms로 더합니다. (도구 호출로 Gemini를 여러 번 부르면 합)"""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = record["ms"]
+        ms[name] = round(ms.get(name, 0) + (time.perf_counter() - started) * 1000, 1)
@@ -0,0 +1,125 @@
+# bot/turn_lock.py
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+# 잠금을 가진 쪽(토큰이 같은 쪽)만 풀 수 있게 비교 후 지웁니다.
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# 잠금을 아직 가지고 있을 때만 TTL을 다시 겁니다.
+_EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class TurnLockTimeout(TimeoutError):
+    """같은 유저의 앞 턴이 `wait_seconds` 안에 끝나지 않았습니다."""
+
+
+class TurnLocks:
+    """유저별 턴 잠금. 한 유저의 메시지는 한 번에 하나씩 (기록을 읽고 -> 응답하고 -> 저장까지) 처리합니다.
+
+    같은 프로세스 안에서는 asyncio.Lock으로 줄을 세우고, Redis 클라이언트가 있으면 그 위에
+    `{prefix}:{유저}` 키(SET NX PX)를 잡아 다른 프로세스(샤드)와도 겹치지 않게 합니다.
+    Redis 잠금에는 TTL이 있어, 잠금을 쥔 프로세스가 죽어도 `ttl_seconds` 뒤에는 풀립니다.
+    턴이 TTL보다 오래 걸려도 풀리지 않도록, 쥐고 있는 동안 TTL의 1/3마다 다시 겁니다.
+    """
+
+    def __init__(self, client=None, ttl_seconds: float = 180, wait_seconds: float = 60,
+                 poll_seconds: float = 0.05, prefix: str = "turnlock"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.prefix = prefix
+        self._local: Dict[str, asyncio.Lock] = {}
+        self._waiters: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {"acquired": 0, "contended": 0, "timeouts": 0, "lost": 0}
+
+    def is_held(self, user_name: str) -> bool:
+        """이 프로세스에서 그 유저의 턴이 진행 중이거나 기다리는 중인지."""
+        return user_name in self._local
+
+    @asynccontextmanager
+    async def hold(self, user_name: str):
+        lock = self._local.setdefault(user_name, asyncio.Lock())
+        self._waiters[user_name] = self._waiters.get(user_name, 0) + 1
+        try:
+            if not lock.locked():
+                await lock.acquire()  # 비어 있으면 기다리는 태스크를 만들지 않고 바로 잡습니다.
+            else:
+                self.counters["contended"] += 1
+                try:
+                    await asyncio.wait_for(lock.acquire(), self.wait_seconds)
+                except asyncio.TimeoutError:
+                    self.counters["timeouts"] += 1
+                    raise TurnLockTimeout(user_name) from None
+            try:
+                token = await self._acquire_shared(user_name) if self.client is not None else None
+                self.counters["acquired"] += 1
+                renewal = asyncio.create_task(self._keep_shared(user_name, token)) if token is not None else None
+                try:
+                    yield
+                finally:
+                    if renewal is not None:
+                        renewal.cancel()
+                    if token is not None:
+                        self._release_shared(user_name, token)
+            finally:
+                lock.release()
+        finally:
+            self._waiters[user_name] -= 1
+            if not self._waiters[user_name]:  # 기다리는 턴이 없으면 유저별 잠금을 남겨두지 않습니다.
+                del self._waiters[user_name]
+                self._local.pop(user_name, None)
+
+    async def _acquire_shared(self, user_name: str) -> Optional[str]:
+        key, token = f"{self.prefix}:{user_name}", uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_seconds
+        contended = False
+        while True:
+            try:
+                if self.client.set(key, token, nx=True, px=int(self.ttl_seconds * 1000)):
+                    return token
+            except Exception as e:
+                # Redis가 잠깐 안 되면 프로세스 안 잠금만으로 진행합니다. (같은 유저가 여러 샤드에 동시에 있는 경우는 드묾)
+                logging.warning(f"Redis 턴 잠금 실패, 프로세스 잠금만 사용: {e}")
+                return None
+            if not contended:
+                contended = True
+                self.counters["contended"] += 1
+            if time.monotonic() >= deadline:
+                self.counters["timeouts"] += 1
+                raise TurnLockTimeout(user_name)
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _keep_shared(self, user_name: str, token: str):
+        key, ttl_ms = f"{self.prefix}:{user_name}", int(self.ttl_seconds * 1000)
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            try:
+                extended = self.client.eval(_EXTEND_SCRIPT, 1, key, token, ttl_ms)
+            except Exception as e:
+                logging.warning(f"Redis 턴 잠금 연장 실패 (다음에 다시 시도): {e}")
+                continue
+            if not extended:
+                # 연장하기 전에 만료되어 다른 프로세스가 잡았을 수 있습니다. 저장은 세션 버전 비교로 막힙니다.
+                self.counters["lost"] += 1
+                logging.warning(f"'{user_name}'의 Redis 턴 잠금을 잃었습니다.")
+                return
+
+    def _release_shared(self, user_name: str, token: str):
+        try:
+            self.client.eval(_RELEASE_SCRIPT, 1, f"{self.prefix}:{user_name}", token)
+        except Exception as e:
+            logging.warning(f"Redis 턴 잠금 해제 실패 (TTL로 풀림): {e}")
@@ -1,7 +1,5 @@
 # bot/utils.py
-import requests
 from datetime import datetime, timezone
-from serpapi import GoogleSearch
 import os
 from typing import Optional
 
@@ -21,6 +19,7 @@ def get_weather(city: str, api_key: str) -> str:
         "lang": "kr"
     }
     try:
+        import requests  # 도구를 실제로 쓸 때만 불러옵니다. (봇 시작 시간 단축)
         response = requests.get(base_url, params=params)
         response.raise_for_status()
         weather_data = response.json()
@@ -50,6 +49,7 @@ def search_web(query: str) -> str:
     try:
         # .env 파일에서 키를 로드합니다.
         from config import SERPAPI_API_KEY
+        from serpapi import GoogleSearch
         if not SERPAPI_API_KEY:
             return "웹 검색 API 키(SERPAPI_API_KEY)가 설정되지 않았습니다."
 